@@ -0,0 +1,82 @@
+"""Measures how much the Bloom filters speed up lookups that miss and slow down lookups that hit.
+
+The index has to be created with Bloom filters, e.g. via
+
+    $ wikimapper create barwiki-latest --bloom-error-rate 0.01
+
+and the benchmark is then invoked by
+
+    $ python benchmarks/bloom_filter.py index_barwiki-latest.db --miss-ratio 0.9
+"""
+
+import argparse
+import random
+import sqlite3
+import time
+
+from wikimapper import WikiMapper
+
+
+def _workload(path_to_db: str, size: int, miss_ratio: float, seed: int):
+    rnd = random.Random(seed)
+    with sqlite3.connect(path_to_db) as conn:
+        titles = [t for (t,) in conn.execute("SELECT wikipedia_title FROM mapping")]
+
+    num_misses = int(size * miss_ratio)
+    hits = [rnd.choice(titles) for _ in range(size - num_misses)]
+    misses = ["{0}_{1}".format(rnd.choice(titles), rnd.getrandbits(32)) for _ in range(num_misses)]
+
+    workload = hits + misses
+    rnd.shuffle(workload)
+    return workload, hits, misses
+
+
+def _run(mapper: WikiMapper, workload) -> float:
+    start = time.perf_counter()
+    for title in workload:
+        mapper.title_to_id(title)
+    return time.perf_counter() - start
+
+
+def _us_per_lookup(mapper: WikiMapper, workload) -> float:
+    return _run(mapper, workload) / max(len(workload), 1) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("index", help="Path to an index created with Bloom filters.")
+    parser.add_argument("--size", type=int, default=100000, help="Number of lookups.")
+    parser.add_argument("--miss-ratio", type=float, default=0.9, help="Fraction of misses.")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    workload, hits, misses = _workload(args.index, args.size, args.miss_ratio, args.seed)
+
+    plain = WikiMapper(args.index)
+    filtered = WikiMapper(args.index, use_bloom_filter=True)
+    if not filtered._bloom_filters:
+        parser.error("[{0}] does not contain Bloom filters".format(args.index))
+
+    # Warm up the page cache so that both runs see the same state
+    _run(plain, workload)
+
+    t_plain = _run(plain, workload)
+    t_filtered = _run(filtered, workload)
+
+    n = len(workload)
+    print("lookups:        {0} ({1:.0%} misses)".format(n, args.miss_ratio))
+    print("without filter: {0:.3f}s ({1:.2f} us/lookup)".format(t_plain, t_plain / n * 1e6))
+    print("with filter:    {0:.3f}s ({1:.2f} us/lookup)".format(t_filtered, t_filtered / n * 1e6))
+    print("speedup:        {0:.2f}x".format(t_plain / t_filtered))
+
+    # The filter is checked before every lookup, so hits pay for it and only misses gain
+    for name, lookups in [("hits", hits), ("misses", misses)]:
+        print(
+            "{0:<15} {1:.2f} us/lookup without, {2:.2f} us/lookup with filter".format(
+                name + ":", _us_per_lookup(plain, lookups), _us_per_lookup(filtered, lookups)
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Compares the size and lookup latencies of compressed indices with those of the index.
+
+The benchmark is invoked with an index created by `wikimapper create`, e.g.
+
+    $ python benchmarks/compressed.py index_barwiki-latest.db --block-sizes 16 64 256
+
+It compresses the index with every block size into a temporary folder and then looks up the
+same random titles, page ids and Wikidata ids in all of them. Lookups run twice and the second
+run is reported, so that all indices are read from the page cache.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from wikimapper import CompressedWikiMapper, WikiMapper, compress_index
+
+_METHODS = [
+    ("title_to_id", "titles"),
+    ("wikipedia_id_to_title", "wikipedia_ids"),
+    ("id_to_titles", "wikidata_ids"),
+]
+
+
+def _workload(path_to_db: str, size: int, seed: int):
+    rnd = random.Random(seed)
+    with sqlite3.connect(path_to_db) as conn:
+        rows = conn.execute(
+            "SELECT wikipedia_title, wikipedia_id, wikidata_id FROM mapping WHERE namespace = 0"
+        ).fetchall()
+
+    sample = [rnd.choice(rows) for _ in range(size)]
+    return {
+        "titles": [title for title, _, _ in sample],
+        "wikipedia_ids": [wikipedia_id for _, wikipedia_id, _ in sample],
+        "wikidata_ids": [wikidata_id for _, _, wikidata_id in sample if wikidata_id is not None],
+    }
+
+
+def _run(mapper, method: str, keys) -> float:
+    lookup = getattr(mapper, method)
+    start = time.perf_counter()
+    for key in keys:
+        lookup(key)
+    return time.perf_counter() - start
+
+
+def _measure(mapper, workload) -> list:
+    latencies = []
+    for method, keys in _METHODS:
+        _run(mapper, method, workload[keys])
+        latencies.append(_run(mapper, method, workload[keys]) / len(workload[keys]) * 1e6)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("index", help="Path to an index created by `wikimapper create`.")
+    parser.add_argument("--block-sizes", nargs="+", type=int, default=[16, 64, 256])
+    parser.add_argument("--cache-size", type=int, default=256, help="Cached blocks per mapper.")
+    parser.add_argument("--size", type=int, default=100000, help="Number of lookups per method.")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    workload = _workload(args.index, args.size, args.seed)
+
+    header = "{0:<12} {1:>10} {2:>7}".format("index", "size (MB)", "ratio")
+    header += "".join(" {0:>22}".format(method + " (us)") for method, _ in _METHODS)
+    print(header)
+
+    def report(name: str, size: int, latencies: list):
+        line = "{0:<12} {1:>10.1f} {2:>6.1f}x".format(name, size / 1e6, db_size / size)
+        line += "".join(" {0:>22.2f}".format(latency) for latency in latencies)
+        print(line)
+
+    db_size = os.path.getsize(args.index)
+    report("sqlite", db_size, _measure(WikiMapper(args.index), workload))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for block_size in args.block_sizes:
+            path = os.path.join(tmp_dir, "index_{0}.wmz".format(block_size))
+            compress_index(args.index, path, block_size)
+
+            mapper = CompressedWikiMapper(path, args.cache_size)
+            latencies = _measure(mapper, workload)
+            mapper.close()
+
+            report("block {0}".format(block_size), os.path.getsize(path), latencies)
+
+
+if __name__ == "__main__":
+    main()
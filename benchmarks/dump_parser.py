@@ -0,0 +1,74 @@
+"""Measures the throughput and peak memory of parsing SQL dumps on synthetic dumps, e.g.
+
+    $ python benchmarks/dump_parser.py --pages 300000 --statement-size 1099511627776
+
+With a huge `--statement-size` every dump is a single INSERT statement. Each dump is parsed in
+a fresh process, so that the reported peak resident memory is that of parsing it alone. The
+peak is read from /proc and therefore only reported on Linux.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from wikimapper.testing import write_wikidumps
+
+_DUMPNAME = "synwiki-20240101"
+
+_PARSE = """
+import sys, time
+from wikimapper.processor import _iter_rows
+
+start = time.perf_counter()
+rows = sum(1 for _ in _iter_rows(sys.argv[1], sys.argv[2]))
+elapsed = time.perf_counter() - start
+
+max_rss = 0
+with open("/proc/self/status") as f:
+    for line in f:
+        if line.startswith("VmHWM:"):
+            max_rss = int(line.split()[1])
+print(rows, elapsed, max_rss)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=100000, help="Pages that are not redirects.")
+    parser.add_argument("--statement-size", type=int, default=1024 * 1024)
+    parser.add_argument("--long-value-size", type=int, default=64 * 1024)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dir", default=None, help="Folder for the dumps (default: temp).")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp_dir:
+        write_wikidumps(
+            _DUMPNAME,
+            tmp_dir,
+            num_pages=args.pages,
+            statement_size=args.statement_size,
+            long_value_size=args.long_value_size,
+            seed=args.seed,
+        )
+
+        for table, errors in [("page", "strict"), ("page_props", "ignore"), ("redirect", "ignore")]:
+            path_to_dump = os.path.join(tmp_dir, "{0}-{1}.sql.gz".format(_DUMPNAME, table))
+            result = subprocess.run(
+                [sys.executable, "-c", _PARSE, path_to_dump, errors],
+                check=True,
+                stdout=subprocess.PIPE,
+            )
+            rows, elapsed, max_rss = result.stdout.decode("utf-8").split()
+            rows, elapsed, max_rss = int(rows), float(elapsed), int(max_rss)
+
+            print(
+                "{0:<11} {1:>9} rows  {2:6.2f}s  {3:8.0f} rows/s  peak RSS {4:.0f} MB".format(
+                    table, rows, elapsed, rows / elapsed, max_rss / 1024
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Measures downloading, creating an index and looking up keys on synthetic dumps, offline.
+
+The dumps are generated with `wikimapper.testing`, served by a local mirror and downloaded from
+it, so the benchmark runs on hosts without network access, e.g.
+
+    $ python benchmarks/end_to_end.py --pages 1000000 --low-memory
+
+Larger `--statement-size` values give longer INSERT lines, which stresses the dump parser.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from wikimapper import WikiMapper, create_index, download_wikidumps
+from wikimapper.testing import MirrorServer, write_wikidumps
+
+_DUMPNAME = "synwiki-20240101"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=100000, help="Pages that are not redirects.")
+    parser.add_argument("--statement-size", type=int, default=1024 * 1024)
+    parser.add_argument("--low-memory", action="store_true")
+    parser.add_argument("--lookups", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dir", default=None, help="Folder for dumps and index (default: temp).")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp_dir:
+        mirror_dir = os.path.join(tmp_dir, "mirror")
+        dump_dir = os.path.join(tmp_dir, "dumps")
+        path_to_db = os.path.join(tmp_dir, "index.db")
+
+        with MirrorServer(mirror_dir) as mirror:
+            start = time.perf_counter()
+            pages = write_wikidumps(
+                _DUMPNAME,
+                mirror.dump_dir(_DUMPNAME),
+                num_pages=args.pages,
+                statement_size=args.statement_size,
+                seed=args.seed,
+            )
+            t_generate = time.perf_counter() - start
+
+            start = time.perf_counter()
+            download_wikidumps(_DUMPNAME, dump_dir, mirror.url)
+            t_download = time.perf_counter() - start
+
+        start = time.perf_counter()
+        create_index(_DUMPNAME, dump_dir, path_to_db, low_memory=args.low_memory)
+        t_create = time.perf_counter() - start
+
+        rnd = random.Random(args.seed)
+        titles = [page.title for page in pages if page.namespace == 0]
+        workload = [rnd.choice(titles) for _ in range(args.lookups)]
+
+        mapper = WikiMapper(path_to_db)
+        start = time.perf_counter()
+        for title in workload:
+            mapper.title_to_id(title)
+        t_lookup = time.perf_counter() - start
+
+        dump_size = sum(os.path.getsize(os.path.join(dump_dir, f)) for f in os.listdir(dump_dir))
+        index_size = os.path.getsize(path_to_db)
+
+    print("pages:     {0} ({1:.1f} MB of dumps)".format(len(pages), dump_size / 1e6))
+    print("generate:  {0:.2f}s".format(t_generate))
+    print("download:  {0:.2f}s".format(t_download))
+    print("create:    {0:.2f}s ({1:.1f} MB index)".format(t_create, index_size / 1e6))
+    print(
+        "lookups:   {0:.2f}s ({1:.2f} us/lookup)".format(t_lookup, t_lookup / len(workload) * 1e6)
+    )
+
+
+if __name__ == "__main__":
+    main()
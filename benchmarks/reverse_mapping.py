@@ -0,0 +1,75 @@
+"""Measures how much the reverse mapping speeds up looking up the pages of Wikidata ids.
+
+The index has to be created with the reverse mapping, e.g. via
+
+    $ wikimapper create barwiki-latest --reverse-mapping
+
+and the benchmark is then invoked by
+
+    $ python benchmarks/reverse_mapping.py index_barwiki-latest.db
+
+Wikidata ids are drawn with a bias towards those with many pages, i.e. many redirects, as
+these are the slowest to look up without the reverse mapping.
+"""
+
+import argparse
+import random
+import sqlite3
+import time
+
+from wikimapper import WikiMapper
+
+
+def _workload(path_to_db: str, size: int, seed: int):
+    rnd = random.Random(seed)
+    with sqlite3.connect(path_to_db) as conn:
+        counts = conn.execute(
+            """SELECT wikidata_id, COUNT(*) FROM mapping
+            WHERE wikidata_id IS NOT NULL AND namespace = 0 GROUP BY wikidata_id"""
+        ).fetchall()
+
+    wikidata_ids = [wikidata_id for wikidata_id, _ in counts]
+    weights = [count for _, count in counts]
+    return rnd.choices(wikidata_ids, weights, k=size)
+
+
+def _run(mapper: WikiMapper, workload) -> float:
+    start = time.perf_counter()
+    for wikidata_id in workload:
+        mapper.id_to_titles(wikidata_id)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("index", help="Path to an index created with the reverse mapping.")
+    parser.add_argument("--size", type=int, default=100000, help="Number of lookups.")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    workload = _workload(args.index, args.size, args.seed)
+
+    plain = WikiMapper(args.index)
+    if not plain._has_reverse_mapping:
+        parser.error("[{0}] does not contain the reverse mapping".format(args.index))
+    # Query the main table like an index without the reverse mapping would
+    plain._has_reverse_mapping = False
+    reverse = WikiMapper(args.index)
+
+    # Warm up the page cache so that all runs see the same state
+    _run(plain, workload)
+    _run(reverse, workload)
+
+    n = len(workload)
+    t_plain = _run(plain, workload)
+    t_reverse = _run(reverse, workload)
+
+    titles = sum(len(plain.id_to_titles(wikidata_id)) for wikidata_id in workload)
+    print("lookups:         {0} ({1:.1f} titles/lookup)".format(n, titles / n))
+    print("main table:      {0:.3f}s ({1:.2f} us/lookup)".format(t_plain, t_plain / n * 1e6))
+    print("reverse mapping: {0:.3f}s ({1:.2f} us/lookup)".format(t_reverse, t_reverse / n * 1e6))
+    print("speedup:         {0:.2f}x".format(t_plain / t_reverse))
+
+
+if __name__ == "__main__":
+    main()
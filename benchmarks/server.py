@@ -0,0 +1,100 @@
+"""Load tests the mapping server with many concurrent clients sending single-key requests.
+
+By default, a server for the given index is started in-process, e.g.
+
+    $ python benchmarks/server.py index_barwiki-latest.db --clients 32 --requests 500
+
+Use `--url` to load test a server started separately via `wikimapper serve` instead.
+"""
+
+import argparse
+import http.client
+import json
+import random
+import sqlite3
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from wikimapper.server import MappingServer
+
+
+def _client(url: str, titles, num_requests: int, latencies: list, seed: int):
+    rnd = random.Random(seed)
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port)
+
+    for _ in range(num_requests):
+        body = json.dumps({"key": rnd.choice(titles)})
+        start = time.perf_counter()
+        conn.request("POST", "/title_to_id", body, {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        assert response.status == 200
+
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("index", help="Path to the index, also used to sample titles.")
+    parser.add_argument("--url", default=None, help="URL of a running server to load test.")
+    parser.add_argument("--clients", type=int, default=32, help="Number of concurrent clients.")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per client.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-window", type=float, default=2.0, help="In milliseconds.")
+    parser.add_argument("--max-batch", type=int, default=256)
+    args = parser.parse_args()
+
+    with sqlite3.connect(args.index) as conn:
+        titles = [t for (t,) in conn.execute("SELECT wikipedia_title FROM mapping LIMIT 100000")]
+    titles += ["{0}_missing".format(t) for t in titles[:1000]]
+
+    server = None
+    url = args.url
+    if url is None:
+        server = MappingServer(
+            args.index,
+            port=0,
+            workers=args.workers,
+            batch_window=args.batch_window / 1000,
+            max_batch=args.max_batch,
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = "http://{0}:{1}".format(*server.server_address[:2])
+
+    latencies = []
+    clients = [
+        threading.Thread(target=_client, args=(url, titles, args.requests, latencies, i))
+        for i in range(args.clients)
+    ]
+
+    start = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print("requests:     {0} from {1} clients".format(len(latencies), args.clients))
+    print("throughput:   {0:.0f} requests/s".format(len(latencies) / elapsed))
+    print("latency p50:  {0:.2f} ms".format(statistics.median(latencies) * 1000))
+    print("latency p99:  {0:.2f} ms".format(latencies[int(len(latencies) * 0.99)] * 1000))
+
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port)
+    conn.request("GET", "/metrics")
+    metrics = json.loads(conn.getresponse().read())
+    batches, mean_size = metrics["batches"], metrics["mean_batch_size"]
+    print("batches:      {0} (mean size {1:.1f})".format(batches, mean_size))
+
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Measures how long one-shot lookups via the command line take, compared to the bare
+interpreter startup and to the lookup itself, e.g.
+
+    $ python benchmarks/startup.py index_barwiki-latest.db Stoaboog
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+from wikimapper import WikiMapper
+
+_CLI = "import sys; from wikimapper.cli import main; sys.argv[0] = 'wikimapper'; main()"
+
+
+def _time(command, runs: int) -> float:
+    """Returns the median wall clock time of running `command` in seconds."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("index", help="Path to the index to look up in.")
+    parser.add_argument("title", help="Title to look up.")
+    parser.add_argument("--runs", type=int, default=20, help="Number of runs per measurement.")
+    args = parser.parse_args()
+
+    interpreter = _time([sys.executable, "-c", "pass"], args.runs)
+    imports = _time([sys.executable, "-c", "import wikimapper.cli"], args.runs)
+    cli = _time([sys.executable, "-c", _CLI, "title2id", args.index, args.title], args.runs)
+
+    start = time.perf_counter()
+    WikiMapper(args.index).title_to_id(args.title)
+    lookup = time.perf_counter() - start
+
+    print("interpreter startup:       {0:7.1f} ms".format(interpreter * 1000))
+    print("import wikimapper.cli:     {0:7.1f} ms".format(imports * 1000))
+    print("wikimapper title2id:       {0:7.1f} ms".format(cli * 1000))
+    print("  thereof over interpreter:{0:7.1f} ms".format((cli - interpreter) * 1000))
+    print("open index and look up:    {0:7.1f} ms".format(lookup * 1000))
+
+
+if __name__ == "__main__":
+    main()
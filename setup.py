@@ -17,7 +17,7 @@ DESCRIPTION = "Mapping Wikidata and Wikipedia entities to each other"
 HOMEPAGE = "https://github.com/jcklie/wikimapper"
 EMAIL = "git@mrklie.com"
 AUTHOR = "Jan-Christoph Klie"
-REQUIRES_PYTHON = ">=3.5.0"
+REQUIRES_PYTHON = ">=3.7.0"
 
 install_requires=[]
 
@@ -135,9 +135,9 @@ setup(
         "Intended Audience :: Science/Research",
         "License :: OSI Approved :: Apache Software License",
         "Programming Language :: Python :: 3 :: Only",
-        "Programming Language :: Python :: 3.5",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
         "Topic :: Internet :: WWW/HTTP :: Dynamic Content :: Wiki",
         "Topic :: Software Development :: Libraries",
         "Topic :: Scientific/Engineering :: Human Machine Interfaces",
@@ -1,15 +1,44 @@
+import os
 from collections import namedtuple
 
 import pytest
 
 from wikimapper import WikiMapper, create_index, download_wikidumps
+from wikimapper.testing import MirrorServer, SyntheticPage, _write_dump, write_wikidumps
 
-Wiki = namedtuple("Wiki", ["dumpname", "path"])
+# `pages` are the pages of synthetic dumps as they should end up in an index
+Wiki = namedtuple("Wiki", ["dumpname", "path", "pages"], defaults=[None])
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--network",
+        action="store_true",
+        help="Also run the tests marked with `network`, which download real Wikipedia dumps.",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "network: downloads real Wikipedia dumps, only run with `--network`"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--network"):
+        return
+
+    skip = pytest.mark.skip(reason="Downloads real Wikipedia dumps, run with `--network`")
+    for item in items:
+        if "network" in item.keywords:
+            item.add_marker(skip)
 
 
 @pytest.fixture(scope="package")
 def bavarian_wiki_dump(tmpdir_factory) -> Wiki:
-    """We download the Bavarian Wiki, as it is quite small."""
+    """We download the Bavarian Wiki, as it is quite small. Tests using it have to be marked
+    with `network`.
+    """
 
     dumpname = "barwiki-latest"
     path = tmpdir_factory.mktemp("dumps").strpath
@@ -26,3 +55,99 @@ def bavarian_wiki_index(tmpdir_factory, bavarian_wiki_dump: Wiki) -> str:
 @pytest.fixture
 def bavarian_wiki_mapper(bavarian_wiki_index) -> WikiMapper:
     return WikiMapper(bavarian_wiki_index)
+
+
+@pytest.fixture(scope="package")
+def dump_mirror(tmpdir_factory) -> MirrorServer:
+    with MirrorServer(tmpdir_factory.mktemp("mirror").strpath) as server:
+        yield server
+
+
+@pytest.fixture(scope="package")
+def synthetic_wiki_dump(tmpdir_factory, dump_mirror: MirrorServer) -> Wiki:
+    """Synthetic dumps are downloaded from a local mirror, so that tests using them do not
+    need network access.
+    """
+
+    dumpname = "synwiki-20240101"
+    pages = write_wikidumps(
+        dumpname, dump_mirror.dump_dir(dumpname), num_pages=2000, statement_size=64 * 1024
+    )
+    path = tmpdir_factory.mktemp("dumps").strpath
+    download_wikidumps(dumpname, path, dump_mirror.url)
+    return Wiki(dumpname=dumpname, path=path, pages=pages)
+
+
+@pytest.fixture(scope="package")
+def redirect_chains_dump(tmpdir_factory) -> Wiki:
+    """Dumps of a tiny wiki with redirects to redirects in both directions of page ids, a cycle
+    of redirects, a redirect with a Wikidata id of its own and a redirect to a missing page.
+    All pages are articles.
+    """
+    dumpname = "chainwiki-20240101"
+    path = tmpdir_factory.mktemp("dumps").strpath
+
+    # (wikipedia_id, title, own Wikidata id, target title)
+    pages = [
+        (1, "A", None, "B"),
+        (2, "B", None, "C"),
+        (3, "C", "Q1", None),
+        (5, "E", None, "F"),
+        (6, "F", "Q2", None),
+        (10, "D", None, "E"),
+        (20, "G", "Q3", "H"),
+        (21, "H", None, "G"),
+        (30, "I", "Q4", "J"),
+        (31, "J", None, None),
+        (40, "K", None, "Missing"),
+    ]
+    rows = {
+        "page": [
+            (i, 0, title, int(target is not None), 0, 0.5, "20240101000000", None, 1, 10, "", None)
+            for i, title, _, target in pages
+        ],
+        "page_props": [(i, "wikibase_item", q, None) for i, _, q, _ in pages if q is not None],
+        "redirect": [(i, 0, target, "", "") for i, _, _, target in pages if target is not None],
+    }
+    for table, table_rows in rows.items():
+        path_to_dump = os.path.join(path, "{0}-{1}.sql.gz".format(dumpname, table))
+        _write_dump(path_to_dump, "chainwiki", table, table_rows, 1024)
+
+    expected = {"A": "Q1", "B": "Q1", "D": "Q2", "E": "Q2", "G": "Q3", "H": "Q3", "I": "Q4"}
+    pages = [SyntheticPage(i, 0, title, expected.get(title, q), {}) for i, title, q, _ in pages]
+    return Wiki(dumpname=dumpname, path=path, pages=pages)
+
+
+@pytest.fixture(scope="package")
+def synthetic_wiki_index(tmpdir_factory, synthetic_wiki_dump: Wiki) -> str:
+    path_to_db = tmpdir_factory.mktemp("indices").join("index_synwiki-20240101.db").strpath
+    return create_index(
+        synthetic_wiki_dump.dumpname,
+        synthetic_wiki_dump.path,
+        path_to_db,
+        namespaces=[0, 14],
+        page_props=["wikibase-shortdesc", "disambiguation"],
+    )
+
+
+@pytest.fixture
+def synthetic_wiki_mapper(synthetic_wiki_index) -> WikiMapper:
+    return WikiMapper(synthetic_wiki_index)
+
+
+@pytest.fixture(scope="package")
+def synthetic_wiki_bloom_index(tmpdir_factory, synthetic_wiki_dump: Wiki) -> str:
+    path_to_db = tmpdir_factory.mktemp("indices").join("index_synwiki-20240101_bloom.db").strpath
+    return create_index(
+        synthetic_wiki_dump.dumpname,
+        synthetic_wiki_dump.path,
+        path_to_db,
+        namespaces=[0, 14],
+        page_props=["wikibase-shortdesc", "disambiguation"],
+        bloom_filter_error_rate=0.01,
+    )
+
+
+@pytest.fixture
+def synthetic_wiki_bloom_mapper(synthetic_wiki_bloom_index) -> WikiMapper:
+    return WikiMapper(synthetic_wiki_bloom_index, use_bloom_filter=True)
@@ -0,0 +1,67 @@
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+# Prints the result of the lookup and then which heavy modules have been imported for it
+_RUN_CLI = """
+import sys
+from wikimapper.cli import main
+
+sys.argv = ["wikimapper"] + sys.argv[1:]
+main()
+heavy = [
+    "wikimapper.download",
+    "wikimapper.processor",
+    "wikimapper.compressed",
+    "wikimapper.sharding",
+    "urllib.request",
+    "logging",
+    "csv",
+]
+print(sorted(m for m in heavy if m in sys.modules))
+"""
+
+
+@pytest.fixture
+def small_index(tmpdir) -> str:
+    path_to_db = tmpdir.join("index.db").strpath
+    with sqlite3.connect(path_to_db) as conn:
+        conn.execute(
+            "CREATE TABLE mapping (wikipedia_id int PRIMARY KEY, wikipedia_title text, wikidata_id text)"
+        )
+        conn.executemany(
+            "INSERT INTO mapping VALUES (?, ?, ?)",
+            [(1, "Manatee", "Q42797"), (2, "Sea_cow", "Q42797")],
+        )
+    return path_to_db
+
+
+def _run(*args: str) -> str:
+    result = subprocess.run(
+        [sys.executable, "-c", _RUN_CLI] + list(args), check=True, stdout=subprocess.PIPE
+    )
+    return result.stdout.decode("utf-8")
+
+
+def test_title2id_imports_only_the_mapper(small_index):
+    assert _run("title2id", small_index, "Manatee") == "Q42797\n[]\n"
+
+
+def test_title2id_with_several_titles(small_index):
+    assert _run("title2id", small_index, "Manatee", "Dugong") == "Manatee\tQ42797\nDugong\t\n[]\n"
+
+
+def test_title2id_in_compressed_index(small_index):
+    from wikimapper.compressed import compress_index
+
+    path = compress_index(small_index)
+    assert _run("title2id", path, "Manatee") == "Q42797\n['wikimapper.compressed']\n"
+
+
+def test_import_is_lazy():
+    code = "import sys, wikimapper; print([m for m in sys.modules if m.startswith('wikimapper')])"
+    result = subprocess.run([sys.executable, "-c", code], check=True, stdout=subprocess.PIPE)
+
+    assert result.stdout.decode("utf-8").strip() == "['wikimapper']"
@@ -0,0 +1,98 @@
+import sqlite3
+
+import pytest
+
+from wikimapper import CompressedWikiMapper, WikiMapper, compress_index
+from wikimapper.compressed import is_compressed_index
+
+
+@pytest.fixture(scope="module")
+def synthetic_wiki_compressed(tmpdir_factory, synthetic_wiki_index) -> str:
+    path = tmpdir_factory.mktemp("compressed").join("index_synwiki-20240101.wmz").strpath
+    return compress_index(synthetic_wiki_index, path, block_size=32)
+
+
+def test_compressed_mapper(synthetic_wiki_compressed, synthetic_wiki_index, synthetic_wiki_mapper):
+    mapper = CompressedWikiMapper(synthetic_wiki_compressed, cache_size=8)
+    expected = synthetic_wiki_mapper
+
+    with sqlite3.connect(synthetic_wiki_index) as conn:
+        rows = conn.execute(
+            "SELECT wikipedia_id, namespace, wikipedia_title, wikidata_id FROM mapping"
+        ).fetchall()
+    conn.close()
+
+    for wikipedia_id, namespace, title, wikidata_id in rows:
+        assert mapper.title_to_id(title, namespace) == wikidata_id
+        assert mapper.title_to_wikipedia_id(title, namespace) == wikipedia_id
+        assert mapper.wikipedia_id_to_id(wikipedia_id) == wikidata_id
+        assert mapper.wikipedia_id_to_title(wikipedia_id) == title
+        if wikidata_id is not None:
+            assert mapper.id_to_titles(wikidata_id, namespace) == expected.id_to_titles(
+                wikidata_id, namespace
+            )
+
+    titles = [title for _, _, title, _ in rows[:100]] + ["I am not in the Wiki"]
+    wikidata_ids = [wikidata_id for _, _, _, wikidata_id in rows[:100] if wikidata_id]
+    wikidata_ids += ["Q0", "12345678909876543210"]
+    assert mapper.titles_to_ids(titles) == expected.titles_to_ids(titles)
+    assert mapper.ids_to_titles(wikidata_ids) == expected.ids_to_titles(wikidata_ids)
+    assert mapper.ids_to_wikipedia_ids(wikidata_ids) == expected.ids_to_wikipedia_ids(wikidata_ids)
+
+    mapper.close()
+
+
+def test_compressed_mapper_spans_blocks(tmpdir):
+    path_to_db = tmpdir.join("index.db").strpath
+    with sqlite3.connect(path_to_db) as conn:
+        conn.execute(
+            "CREATE TABLE mapping (wikipedia_id int PRIMARY KEY, wikipedia_title text, wikidata_id text)"
+        )
+        conn.executemany(
+            "INSERT INTO mapping VALUES (?, ?, ?)",
+            [
+                (7, "Manatee", "Q42797"),
+                (3, "Sea_cow", "Q42797"),
+                (12, "Trichechus", "Q42797"),
+                (5, "Dugong", "Q9181"),
+                (40, "Dugongidae", None),
+                (41, "Gürteltier", "Q16350"),
+                (100000, "Gürtel", "Q1524"),
+            ],
+        )
+    conn.close()
+
+    path = compress_index(path_to_db, block_size=2)
+    assert path == tmpdir.join("index.wmz").strpath
+    assert is_compressed_index(path)
+    assert not is_compressed_index(path_to_db)
+
+    mapper = CompressedWikiMapper(path, cache_size=1)
+    expected = WikiMapper(path_to_db)
+
+    assert mapper.id_to_titles("Q42797") == expected.id_to_titles("Q42797")
+    assert mapper.id_to_wikipedia_ids("Q42797") == expected.id_to_wikipedia_ids("Q42797")
+    assert mapper.id_to_wikipedia_ids("Q42797") == [7, 3, 12]
+    assert mapper.title_to_id("Gürteltier") == "Q16350"
+    assert mapper.title_to_id("Dugongidae") is None
+    assert mapper.title_to_wikipedia_id("Dugongidae") == 40
+    assert mapper.title_to_id("Aardvark") is None
+    assert mapper.title_to_id("Manatee", namespace=14) is None
+    assert mapper.wikipedia_id_to_title("100000") == "Gürtel"
+    assert mapper.wikipedia_id_to_title(6) is None
+    assert mapper.id_to_titles("Q0") == []
+    assert mapper.id_to_titles("Q9181", namespace=14) == []
+
+
+def test_compress_index_requires_wikidata_ids(tmpdir):
+    path_to_db = tmpdir.join("index.db").strpath
+    with sqlite3.connect(path_to_db) as conn:
+        conn.execute(
+            "CREATE TABLE mapping (wikipedia_id int PRIMARY KEY, wikipedia_title text, wikidata_id text)"
+        )
+        conn.execute("INSERT INTO mapping VALUES (1, 'Manatee', 'P31')")
+    conn.close()
+
+    with pytest.raises(ValueError):
+        compress_index(path_to_db)
+    assert not tmpdir.join("index.wmz").exists()
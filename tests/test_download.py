@@ -1,8 +1,12 @@
 import os
 
+import pytest
+
 from wikimapper import download_wikidumps
+from wikimapper.testing import write_wikidumps
 
 
+@pytest.mark.network
 def test_download(tmpdir):
     path = tmpdir.mkdir("download").strpath
 
@@ -19,3 +23,17 @@ def test_download(tmpdir):
     for e in files:
         statinfo = os.stat(os.path.join(path, e))
         assert statinfo.st_size > 0, "[{0}] should be a non-empty file".format(e)
+
+
+def test_download_from_mirror(tmpdir, dump_mirror):
+    dumpname = "mirrorwiki-20240101"
+    write_wikidumps(dumpname, dump_mirror.dump_dir(dumpname), num_pages=10)
+    path = tmpdir.mkdir("download").strpath
+
+    download_wikidumps(dumpname, path, dump_mirror.url)
+
+    for name in os.listdir(dump_mirror.dump_dir(dumpname)):
+        with open(os.path.join(dump_mirror.dump_dir(dumpname), name), "rb") as expected:
+            with open(os.path.join(path, name), "rb") as downloaded:
+                assert downloaded.read() == expected.read()
+    assert len(os.listdir(path)) == 3
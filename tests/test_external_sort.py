@@ -0,0 +1,69 @@
+import os
+import random
+from operator import itemgetter
+
+from wikimapper.external_sort import ExternalSorter
+
+
+def test_external_sort_spills_and_merges(tmpdir):
+    tmp_dir = tmpdir.mkdir("runs").strpath
+    rnd = random.Random(42)
+    rows = [(rnd.randrange(10000), "title_{0}".format(i)) for i in range(5000)]
+
+    with ExternalSorter(itemgetter(0), memory_budget=10000, tmp_dir=tmp_dir) as sorter:
+        for row in rows:
+            sorter.add(row)
+
+        assert len(os.listdir(tmp_dir)) > 1
+        expected = sorted(rows, key=itemgetter(0))
+        assert list(sorter) == expected
+        # Sorting is stable and can be repeated
+        assert list(sorter) == expected
+
+    assert os.listdir(tmp_dir) == []
+
+
+def test_external_sort_in_memory(tmpdir):
+    tmp_dir = tmpdir.mkdir("runs").strpath
+    rows = [(3, "c"), (1, "a"), (2, "b")]
+
+    with ExternalSorter(itemgetter(0), memory_budget=1024 * 1024, tmp_dir=tmp_dir) as sorter:
+        for row in rows:
+            sorter.add(row)
+
+        assert list(sorter) == [(1, "a"), (2, "b"), (3, "c")]
+        assert os.listdir(tmp_dir) == []
+
+
+def test_external_sort_merges_in_passes(tmpdir, monkeypatch):
+    tmp_dir = tmpdir.mkdir("runs").strpath
+    rnd = random.Random(42)
+    rows = [(rnd.randrange(100), "title_{0}".format(i)) for i in range(5000)]
+
+    # Counts the runs that are read at the same time
+    read_run = ExternalSorter._read_run
+    open_runs = [0, 0]
+
+    def counting_read_run(path):
+        open_runs[0] += 1
+        open_runs[1] = max(open_runs)
+        yield from read_run(path)
+        open_runs[0] -= 1
+
+    monkeypatch.setattr(ExternalSorter, "_read_run", staticmethod(counting_read_run))
+
+    with ExternalSorter(itemgetter(0), 10000, tmp_dir, max_merge_runs=4) as sorter:
+        for row in rows:
+            sorter.add(row)
+
+        assert len(os.listdir(tmp_dir)) > 16
+        # A merge of four runs with one batch each has to fit into the budget
+        assert sorter._batch_size < 50
+
+        expected = sorted(rows, key=itemgetter(0))
+        assert list(sorter) == expected
+        assert list(sorter) == expected
+        assert len(os.listdir(tmp_dir)) <= 4
+        assert open_runs[1] <= 4
+
+    assert os.listdir(tmp_dir) == []
@@ -1,5 +1,11 @@
+import sqlite3
+from collections import defaultdict
+from typing import Dict, List, Set
+
 import pytest
-from typing import List
+
+from wikimapper import LookupStats, WikiMapper
+from wikimapper.mapper import BloomFilter
 
 BAVARIAN_PARAMS = [
     pytest.param("Stoaboog", "Q168327"),
@@ -15,6 +21,7 @@ BAVARIAN_PARAMS = [
 ]
 
 
+@pytest.mark.network
 @pytest.mark.parametrize("page_title, expected", BAVARIAN_PARAMS)
 def test_title_to_id(bavarian_wiki_mapper, page_title: str, expected: str):
     mapper = bavarian_wiki_mapper
@@ -24,6 +31,7 @@ def test_title_to_id(bavarian_wiki_mapper, page_title: str, expected: str):
     assert wikidata_id == expected
 
 
+@pytest.mark.network
 @pytest.mark.parametrize("page_title, expected", BAVARIAN_PARAMS)
 def test_url_to_id(bavarian_wiki_mapper, page_title: str, expected: str):
     mapper = bavarian_wiki_mapper
@@ -34,6 +42,7 @@ def test_url_to_id(bavarian_wiki_mapper, page_title: str, expected: str):
     assert wikidata_id == expected
 
 
+@pytest.mark.network
 @pytest.mark.parametrize(
     "wikidata_id, expected",
     [
@@ -51,6 +60,7 @@ def test_id_to_titles(bavarian_wiki_mapper, wikidata_id: str, expected: str):
     assert set(titles) == set(expected)
 
 
+@pytest.mark.network
 @pytest.mark.parametrize(
     "wikipedia_id, expected",
     [
@@ -79,6 +89,7 @@ def test_wikipedia_id_to_id(bavarian_wiki_mapper, wikipedia_id: int, expected: s
     assert wikidata_id == expected
 
 
+@pytest.mark.network
 @pytest.mark.parametrize(
     "wikidata_id, expected",
     [
@@ -96,6 +107,7 @@ def test_id_to_wikipedia_ids(bavarian_wiki_mapper, wikidata_id: str, expected: L
     assert set(wikipedia_ids) == set(expected)
 
 
+@pytest.mark.network
 @pytest.mark.parametrize(
     "wikipedia_id, expected",
     [
@@ -124,6 +136,7 @@ def test_wikipedia_id_to_title(bavarian_wiki_mapper, wikipedia_id: int, expected
     assert title == expected
 
 
+@pytest.mark.network
 @pytest.mark.parametrize(
     "title, expected",
     [
@@ -143,9 +156,176 @@ def test_wikipedia_id_to_title(bavarian_wiki_mapper, wikipedia_id: int, expected
         ("xxxxxxxxxx", None),
     ]
 )
-def test_wikipedia_id_to_title(bavarian_wiki_mapper, title: str, expected: int):
+def test_title_to_wikipedia_id(bavarian_wiki_mapper, title: str, expected: int):
     mapper = bavarian_wiki_mapper
 
     wikipedia_id = mapper.title_to_wikipedia_id(title)
 
     assert wikipedia_id == expected
+
+
+def test_lookups_with_bloom_filter(
+    synthetic_wiki_mapper, synthetic_wiki_bloom_mapper, synthetic_wiki_dump
+):
+    mapper = synthetic_wiki_bloom_mapper
+    expected = synthetic_wiki_mapper
+    titles = [page.title for page in synthetic_wiki_dump.pages]
+    titles += ["Missing_" + title for title in titles]
+    wikipedia_ids = [page.wikipedia_id for page in synthetic_wiki_dump.pages]
+    wikipedia_ids += [str(wikipedia_ids[0]), 0, 123456789]
+
+    assert mapper._bloom_filters
+    for namespace in [0, 14]:
+        assert mapper.titles_to_ids(titles, namespace) == expected.titles_to_ids(titles, namespace)
+    for wikipedia_id in wikipedia_ids:
+        assert mapper.wikipedia_id_to_title(wikipedia_id) == expected.wikipedia_id_to_title(
+            wikipedia_id
+        )
+        assert mapper.page_props(wikipedia_id) == expected.page_props(wikipedia_id)
+
+
+def test_bloom_filter_is_opt_in(synthetic_wiki_bloom_index):
+    assert not WikiMapper(synthetic_wiki_bloom_index)._bloom_filters
+    assert WikiMapper(synthetic_wiki_bloom_index, use_bloom_filter=True)._bloom_filters
+
+
+def test_bloom_filter():
+    bloom_filter = BloomFilter.for_capacity(1000, 0.01)
+    keys = ["title_{0}".format(i) for i in range(1000)]
+    for key in keys:
+        bloom_filter.add(key)
+
+    assert all(key in bloom_filter for key in keys)
+
+    false_positives = sum("other_{0}".format(i) in bloom_filter for i in range(10000))
+    assert false_positives < 300
+
+    restored = BloomFilter(bloom_filter.num_bits, bloom_filter.num_hashes, bytes(bloom_filter.bits))
+    assert all(key in restored for key in keys)
+
+
+def test_lookup_stats(tmpdir):
+    path_to_db = tmpdir.join("index.db").strpath
+    with sqlite3.connect(path_to_db) as conn:
+        conn.execute(
+            "CREATE TABLE mapping (wikipedia_id int PRIMARY KEY, wikipedia_title text, wikidata_id text)"
+        )
+        conn.execute("INSERT INTO mapping VALUES (1, 'Manatee', 'Q42797')")
+
+    observed = []
+    stats = LookupStats(callback=lambda method, seconds, hit: observed.append((method, hit)))
+    mapper = WikiMapper(path_to_db, stats=stats)
+
+    assert mapper.title_to_id("Manatee") == "Q42797"
+    assert mapper.title_to_id("Dugong") is None
+    assert mapper.id_to_titles("Q42797") == ["Manatee"]
+
+    snapshot = stats.snapshot()
+    assert snapshot["title_to_id"]["calls"] == 2
+    assert snapshot["title_to_id"]["hit_ratio"] == 0.5
+    assert snapshot["id_to_titles"]["calls"] == 1
+    assert sum(snapshot["id_to_titles"]["histogram"]) == 1
+    assert observed == [("title_to_id", True), ("title_to_id", False), ("id_to_titles", True)]
+    assert "title_to_id" in stats.summary()
+
+    stats.reset()
+    assert stats.snapshot() == {}
+
+
+def test_lookup_stats_record_url_lookups_once(tmpdir):
+    from wikimapper import CompressedWikiMapper, compress_index
+
+    path_to_db = tmpdir.join("index.db").strpath
+    with sqlite3.connect(path_to_db) as conn:
+        conn.execute(
+            "CREATE TABLE mapping (wikipedia_id int PRIMARY KEY, wikipedia_title text, wikidata_id text)"
+        )
+        conn.execute("INSERT INTO mapping VALUES (1, 'Manatee', 'Q42797')")
+    conn.close()
+
+    url = "https://en.wikipedia.org/wiki/Manatee"
+    for mapper_class, path in [
+        (WikiMapper, path_to_db),
+        (CompressedWikiMapper, compress_index(path_to_db)),
+    ]:
+        stats = LookupStats()
+        mapper = mapper_class(path, stats=stats)
+
+        assert mapper.url_to_id(url) == "Q42797"
+        assert mapper.urls_to_ids([url, url]) == ["Q42797", "Q42797"]
+        assert mapper.titles_to_ids(["Manatee"]) == ["Q42797"]
+
+        snapshot = stats.snapshot()
+        assert sorted(snapshot) == ["titles_to_ids", "url_to_id", "urls_to_ids"]
+        assert all(method["calls"] == 1 for method in snapshot.values())
+
+
+def test_lookup_stats_sampling():
+    stats = LookupStats(sample_rate=0.1)
+
+    sampled = sum(stats.should_sample("title_to_id") for _ in range(10000))
+
+    assert stats.snapshot()["title_to_id"]["calls"] == 10000
+    assert 500 < sampled < 1500
+
+
+def test_batch_lookups(synthetic_wiki_mapper, synthetic_wiki_dump):
+    mapper = synthetic_wiki_mapper
+    pages = synthetic_wiki_dump.pages[:300]
+    titles = [page.title for page in pages] + ["I am not in the Wiki"]
+    wikipedia_ids = [page.wikipedia_id for page in pages] + [str(pages[0].wikipedia_id), 0]
+    wikidata_ids = [page.wikidata_id for page in pages if page.wikidata_id] + ["Q0"]
+
+    assert mapper.titles_to_ids(titles) == [mapper.title_to_id(t) for t in titles]
+    assert mapper.titles_to_ids(titles, 14) == [mapper.title_to_id(t, 14) for t in titles]
+    assert mapper.titles_to_wikipedia_ids(titles) == [
+        mapper.title_to_wikipedia_id(t) for t in titles
+    ]
+    assert mapper.wikipedia_ids_to_ids(wikipedia_ids) == [
+        mapper.wikipedia_id_to_id(i) for i in wikipedia_ids
+    ]
+    assert mapper.wikipedia_ids_to_titles(wikipedia_ids) == [
+        mapper.wikipedia_id_to_title(i) for i in wikipedia_ids
+    ]
+    assert [set(t) for t in mapper.ids_to_titles(wikidata_ids)] == [
+        set(mapper.id_to_titles(i)) for i in wikidata_ids
+    ]
+    assert [set(t) for t in mapper.ids_to_wikipedia_ids(wikidata_ids)] == [
+        set(mapper.id_to_wikipedia_ids(i)) for i in wikidata_ids
+    ]
+
+
+def test_synthetic_lookups(synthetic_wiki_mapper, synthetic_wiki_dump):
+    mapper = synthetic_wiki_mapper
+
+    linked = defaultdict(set)  # type: Dict[tuple, Set[tuple]]
+    for page in synthetic_wiki_dump.pages:
+        if page.namespace in [0, 14] and page.wikidata_id is not None:
+            linked[page.wikidata_id, page.namespace].add((page.title, page.wikipedia_id))
+
+    for page in synthetic_wiki_dump.pages:
+        if page.namespace not in [0, 14]:
+            assert mapper.wikipedia_id_to_title(page.wikipedia_id) is None
+            assert mapper.wikipedia_id_to_id(page.wikipedia_id) is None
+            continue
+
+        assert mapper.title_to_id(page.title, page.namespace) == page.wikidata_id
+        assert mapper.title_to_wikipedia_id(page.title, page.namespace) == page.wikipedia_id
+        assert mapper.wikipedia_id_to_title(page.wikipedia_id) == page.title
+        assert mapper.wikipedia_id_to_id(page.wikipedia_id) == page.wikidata_id
+        if page.namespace == 0:
+            url = "https://bar.wikipedia.org/wiki/" + page.title
+            assert mapper.url_to_id(url) == page.wikidata_id
+
+        if page.wikidata_id is not None:
+            expected = linked[page.wikidata_id, page.namespace]
+            titles = mapper.id_to_titles(page.wikidata_id, page.namespace)
+            wikipedia_ids = mapper.id_to_wikipedia_ids(page.wikidata_id, page.namespace)
+            assert set(zip(titles, wikipedia_ids)) == expected
+            assert len(titles) == len(expected)
+
+    assert mapper.title_to_id("I am not in the Wiki") is None
+    assert mapper.title_to_wikipedia_id("I am not in the Wiki") is None
+    assert mapper.wikipedia_id_to_title(0) is None
+    assert mapper.id_to_titles("Q0") == []
+    assert mapper.id_to_wikipedia_ids("Q0") == []
@@ -1,21 +1,367 @@
+import gzip
 import os
 import sqlite3
+import sys
+from collections import defaultdict
+from typing import Dict
 
-from wikimapper import create_index
+import pytest
 
+from wikimapper import WikiMapper, create_index
+from wikimapper.testing import SyntheticPage, write_wikidumps
 
-def test_create_index(tmpdir, bavarian_wiki_dump):
+
+def _mapping(path_to_db: str) -> list:
+    query = "SELECT wikipedia_id, namespace, wikipedia_title, wikidata_id FROM mapping"
+    with sqlite3.connect(path_to_db) as conn:
+        rows = sorted(conn.execute(query).fetchall())
+    conn.close()
+    return rows
+
+
+def _page_props(path_to_db: str) -> list:
+    with sqlite3.connect(path_to_db) as conn:
+        rows = sorted(conn.execute("SELECT * FROM page_props").fetchall())
+    conn.close()
+    return rows
+
+
+def _mapped_page(wiki) -> SyntheticPage:
+    """Returns an article of `wiki` that has a Wikidata id."""
+    return next(p for p in wiki.pages if p.namespace == 0 and p.wikidata_id is not None)
+
+
+def _assert_same_lookups(mapper: WikiMapper, expected: WikiMapper, titles: list, ids: list):
+    wikidata_ids = {expected.title_to_id(title) for title in titles} - {None}
+    for title in titles:
+        assert mapper.title_to_id(title) == expected.title_to_id(title)
+        assert mapper.title_to_wikipedia_id(title) == expected.title_to_wikipedia_id(title)
+    for wikipedia_id in ids:
+        assert mapper.wikipedia_id_to_id(wikipedia_id) == expected.wikipedia_id_to_id(wikipedia_id)
+        assert mapper.wikipedia_id_to_title(wikipedia_id) == expected.wikipedia_id_to_title(
+            wikipedia_id
+        )
+        assert mapper.page_props(wikipedia_id) == expected.page_props(wikipedia_id)
+    for wikidata_id in sorted(wikidata_ids):
+        assert mapper.id_to_titles(wikidata_id) == expected.id_to_titles(wikidata_id)
+        assert mapper.id_to_wikipedia_ids(wikidata_id) == expected.id_to_wikipedia_ids(wikidata_id)
+
+
+def test_create_index(tmpdir, synthetic_wiki_dump):
     path_to_db = tmpdir.mkdir("processor").join("index_test.db").strpath
 
-    create_index(bavarian_wiki_dump.dumpname, bavarian_wiki_dump.path, path_to_db)
+    create_index(synthetic_wiki_dump.dumpname, synthetic_wiki_dump.path, path_to_db)
 
     # Check that the file is there
     assert os.path.isfile(path_to_db)
 
-    # Check that it is really a sqlite3 db
+    # Check that it is really a sqlite3 db with all articles
+    pages = [page for page in synthetic_wiki_dump.pages if page.namespace == 0]
+    assert _mapping(path_to_db) == [page[:4] for page in pages]
+
+
+@pytest.mark.network
+def test_create_index_with_namespaces_and_page_props(tmpdir, bavarian_wiki_dump):
+    path_to_db = tmpdir.mkdir("processor").join("index_test.db").strpath
+
+    create_index(
+        bavarian_wiki_dump.dumpname,
+        bavarian_wiki_dump.path,
+        path_to_db,
+        namespaces=[0, 14],
+        page_props=["disambiguation"],
+    )
+
     with sqlite3.connect(path_to_db) as conn:
-        c = conn.cursor()
-        c.execute("SELECT * FROM mapping LIMIT 1000")
-        results = c.fetchall()
+        namespaces = {ns for (ns,) in conn.execute("SELECT DISTINCT namespace FROM mapping")}
+        category_title, category_id = conn.execute(
+            "SELECT wikipedia_title, wikipedia_id FROM mapping WHERE namespace = 14 LIMIT 1"
+        ).fetchone()
+        (disambiguation_id,) = conn.execute(
+            "SELECT wikipedia_id FROM page_props LIMIT 1"
+        ).fetchone()
+
+    assert namespaces == {0, 14}
+
+    mapper = WikiMapper(path_to_db)
+    assert mapper.title_to_id("Stoaboog") == "Q168327"
+    assert mapper.title_to_wikipedia_id(category_title, namespace=14) == category_id
+    assert mapper.page_props(disambiguation_id) == {"disambiguation": ""}
+    assert mapper.page_props(24520) == {}
+
+
+def test_create_index_low_memory(tmpdir, synthetic_wiki_dump, synthetic_wiki_index):
+    path_to_db = tmpdir.mkdir("processor").join("index_test.db").strpath
+
+    # A tiny budget makes sure that the rows are really spilled to disk and merged
+    create_index(
+        synthetic_wiki_dump.dumpname,
+        synthetic_wiki_dump.path,
+        path_to_db,
+        namespaces=[0, 14],
+        page_props=["wikibase-shortdesc", "disambiguation"],
+        low_memory=True,
+        memory_budget=64 * 1024,
+    )
+
+    assert _mapping(path_to_db) == _mapping(synthetic_wiki_index)
+    assert _page_props(path_to_db) == _page_props(synthetic_wiki_index)
+
+
+def test_low_memory_gives_the_same_lookups(tmpdir, synthetic_wiki_dump, redirect_chains_dump):
+    for wiki in [synthetic_wiki_dump, redirect_chains_dump]:
+        paths = [tmpdir.join("{0}_{1}.db".format(wiki.dumpname, mode)).strpath for mode in "ab"]
+        for path_to_db, low_memory in zip(paths, [False, True]):
+            create_index(
+                wiki.dumpname, wiki.path, path_to_db, low_memory=low_memory, memory_budget=4096
+            )
+
+        mapper, expected = WikiMapper(paths[1]), WikiMapper(paths[0])
+        titles = [page.title for page in wiki.pages]
+        _assert_same_lookups(mapper, expected, titles, [page.wikipedia_id for page in wiki.pages])
+
+
+@pytest.mark.parametrize("low_memory", [False, True])
+def test_create_index_follows_redirect_chains(tmpdir, redirect_chains_dump, low_memory: bool):
+    path_to_db = tmpdir.join("index_test.db").strpath
+    create_index(
+        redirect_chains_dump.dumpname, redirect_chains_dump.path, path_to_db, low_memory=low_memory
+    )
+
+    mapper = WikiMapper(path_to_db)
+    for page in redirect_chains_dump.pages:
+        assert mapper.title_to_id(page.title) == page.wikidata_id
+    assert mapper.id_to_titles("Q1") == ["A", "B", "C"]
+    assert mapper.id_to_titles("Q2") == ["E", "F", "D"]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Windows does not replace files that are open")
+def test_create_index_replaces_existing_index_atomically(tmpdir, synthetic_wiki_dump):
+    folder = tmpdir.mkdir("processor")
+    path_to_db = folder.join("index_test.db").strpath
+    page = _mapped_page(synthetic_wiki_dump)
+
+    create_index(synthetic_wiki_dump.dumpname, synthetic_wiki_dump.path, path_to_db)
+    mapper = WikiMapper(path_to_db)
+
+    create_index(
+        synthetic_wiki_dump.dumpname, synthetic_wiki_dump.path, path_to_db, namespaces=[0, 14]
+    )
+
+    # The mapper still reads the old index until it is reloaded
+    assert mapper.title_to_id(page.title) == page.wikidata_id
+    (count,) = mapper.conn.execute("SELECT COUNT(*) FROM mapping WHERE namespace = 14").fetchone()
+    assert count == 0
+
+    mapper.reload()
+    (count,) = mapper.conn.execute("SELECT COUNT(*) FROM mapping WHERE namespace = 14").fetchone()
+    assert count > 0
+    assert mapper.title_to_id(page.title) == page.wikidata_id
+
+    assert os.listdir(folder.strpath) == ["index_test.db"]
+
+
+def test_replace_file_waits_for_readers(tmpdir, monkeypatch):
+    import wikimapper.processor
+
+    monkeypatch.setattr(wikimapper.processor, "_REPLACE_ATTEMPTS", 3)
+    monkeypatch.setattr(wikimapper.processor, "_REPLACE_DELAY", 0)
+    path = tmpdir.join("index.db").strpath
+    tmpdir.join("index.db.tmp").write("new")
+
+    # Fails like on Windows while a reader has the file open
+    replace, failures = os.replace, [PermissionError()] * 2
+
+    def replace_once_closed(src, dst):
+        if failures:
+            raise failures.pop()
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", replace_once_closed)
+    wikimapper.processor._replace_file(path + ".tmp", path)
+    assert tmpdir.join("index.db").read() == "new"
+
+    tmpdir.join("index.db.tmp").write("newer")
+    failures.extend([PermissionError()] * 3)
+    with pytest.raises(PermissionError, match="Close its readers"):
+        wikimapper.processor._replace_file(path + ".tmp", path)
+    assert tmpdir.join("index.db.tmp").read() == "newer"
+
+
+def test_create_index_resumes_interrupted_build(tmpdir, monkeypatch, synthetic_wiki_dump):
+    import wikimapper.processor
+
+    folder = tmpdir.mkdir("processor")
+    path_to_db = folder.join("index_test.db").strpath
+    monkeypatch.setattr(wikimapper.processor, "_COMMIT_INTERVAL", 1)
+
+    iter_statements = wikimapper.processor._iter_statements
+
+    def interrupted(path_to_dump, errors="strict", offset=0):
+        for i, statement in enumerate(iter_statements(path_to_dump, errors, offset)):
+            if path_to_dump.endswith("-page_props.sql.gz") and i == 3:
+                raise KeyboardInterrupt
+            yield statement
+
+    dumpname, path = synthetic_wiki_dump.dumpname, synthetic_wiki_dump.path
+    monkeypatch.setattr(wikimapper.processor, "_iter_statements", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        create_index(dumpname, path, path_to_db, page_props=["wikibase-shortdesc"])
+
+    # The partial build is kept and knows how far it got
+    assert os.listdir(folder.strpath) == ["index_test.db.tmp"]
+    conn = sqlite3.connect(path_to_db + ".tmp")
+    progress = dict(conn.execute("SELECT stage, completed FROM build_progress"))
+    conn.close()
+    assert progress == {"pages": 1, "title_index": 1, "page_props": 0}
+
+    monkeypatch.setattr(wikimapper.processor, "_iter_statements", iter_statements)
+    with pytest.raises(ValueError):
+        create_index(
+            dumpname,
+            path,
+            path_to_db,
+            namespaces=[0, 14],
+            page_props=["wikibase-shortdesc"],
+            resume=True,
+        )
+
+    create_index(dumpname, path, path_to_db, page_props=["wikibase-shortdesc"], resume=True)
+
+    assert os.listdir(folder.strpath) == ["index_test.db"]
+    with sqlite3.connect(path_to_db) as conn:
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master")}
+    conn.close()
+    assert "build_progress" not in tables
+
+    expected = tmpdir.join("expected.db").strpath
+    create_index(dumpname, path, expected, page_props=["wikibase-shortdesc"])
+    assert _mapping(path_to_db) == _mapping(expected)
+    assert _page_props(path_to_db) == _page_props(expected)
+
+
+def test_create_index_with_reverse_mapping(tmpdir, synthetic_wiki_dump, synthetic_wiki_mapper):
+    from wikimapper.processor import _iter_rows
+
+    path_to_db = tmpdir.mkdir("processor").join("index_test.db").strpath
+
+    create_index(
+        synthetic_wiki_dump.dumpname,
+        synthetic_wiki_dump.path,
+        path_to_db,
+        namespaces=[0, 14],
+        reverse_mapping=True,
+    )
+
+    mapper = WikiMapper(path_to_db)
+    assert mapper._has_reverse_mapping
+
+    redirects_dump = os.path.join(
+        synthetic_wiki_dump.path, synthetic_wiki_dump.dumpname + "-redirect.sql.gz"
+    )
+    redirected = {int(v[0]) for v in _iter_rows(redirects_dump, errors="ignore")}
+
+    # The pages that are not redirects come first, each part ordered by title
+    linked = defaultdict(list)  # type: Dict[tuple, list]
+    for page in synthetic_wiki_dump.pages:
+        if page.namespace in [0, 14] and page.wikidata_id is not None:
+            is_redirect = page.wikipedia_id in redirected
+            linked[page.wikidata_id, page.namespace].append((is_redirect, page.title, page))
+
+    for (wikidata_id, namespace), pages in linked.items():
+        pages = [page for _, _, page in sorted(pages)]
+        assert mapper.id_to_titles(wikidata_id, namespace) == [p.title for p in pages]
+        assert mapper.id_to_wikipedia_ids(wikidata_id, namespace) == [p.wikipedia_id for p in pages]
+
+    wikidata_ids = [wikidata_id for wikidata_id, _ in linked][:100] + ["Q0"]
+    assert [set(ids) for ids in mapper.ids_to_wikipedia_ids(wikidata_ids)] == [
+        set(synthetic_wiki_mapper.id_to_wikipedia_ids(i)) for i in wikidata_ids
+    ]
+    assert mapper.ids_to_titles(wikidata_ids) == [mapper.id_to_titles(i) for i in wikidata_ids]
+
+
+@pytest.mark.network
+def test_create_index_with_reverse_mapping_in_bavarian_wiki(tmpdir, bavarian_wiki_dump):
+    path_to_db = tmpdir.mkdir("processor").join("index_test.db").strpath
+
+    create_index(
+        bavarian_wiki_dump.dumpname, bavarian_wiki_dump.path, path_to_db, reverse_mapping=True
+    )
+
+    # The article comes first, followed by its redirects ordered by title
+    mapper = WikiMapper(path_to_db)
+    assert mapper.id_to_titles("Q160525") == ["Brezn", "Breze", "Brezel", "Brezen"]
+    assert mapper.id_to_wikipedia_ids("Q160525") == [1997, 2778, 24100, 28193]
+
+
+@pytest.mark.parametrize("low_memory", [False, True])
+def test_create_index_from_synthetic_dumps(tmpdir, synthetic_wiki_dump, low_memory: bool):
+    path_to_db = tmpdir.join("index_test.db").strpath
+    page_props = ["wikibase-shortdesc", "disambiguation", "templatedata"]
+
+    create_index(
+        synthetic_wiki_dump.dumpname,
+        synthetic_wiki_dump.path,
+        path_to_db,
+        namespaces=[0, 10],
+        page_props=page_props,
+        low_memory=low_memory,
+    )
+
+    query = "SELECT wikipedia_id, namespace, wikipedia_title, wikidata_id FROM mapping"
+    with sqlite3.connect(path_to_db) as conn:
+        rows = sorted(conn.execute(query).fetchall())
+    conn.close()
+
+    pages = [page for page in synthetic_wiki_dump.pages if page.namespace in [0, 10]]
+    assert rows == [page[:4] for page in pages]
+
+    mapper = WikiMapper(path_to_db)
+    for page in pages:
+        expected = {name: v for name, v in page.page_props.items() if name in page_props}
+        assert mapper.page_props(page.wikipedia_id) == expected
+
+
+@pytest.mark.parametrize("buffer_size", [1, 7, 4096])
+def test_iter_statements_in_small_chunks(tmpdir, monkeypatch, buffer_size: int):
+    import wikimapper.processor
+
+    path = tmpdir.strpath
+    write_wikidumps(
+        "synwiki-20240101", path, num_pages=200, statement_size=2000, long_value_size=300
+    )
+    path_to_dump = os.path.join(path, "synwiki-20240101-page_props.sql.gz")
+
+    def read(offset: int = 0) -> list:
+        statements = []
+        for statement in wikimapper.processor._iter_statements(path_to_dump, "ignore", offset):
+            rows = list(statement)
+            statements.append((statement.end, rows))
+        return statements
+
+    expected = read()
+    assert len(expected) > 3
+
+    monkeypatch.setattr(wikimapper.processor, "_BUFFER_SIZE", buffer_size)
+    assert read() == expected
+    # Resuming after a statement continues with the next one
+    assert read(expected[2][0]) == expected[3:]
+
+
+@pytest.mark.parametrize("end", [b";\n", b";"])
+def test_iter_statements_at_end_of_dump(tmpdir, end: bytes):
+    from wikimapper.processor import _iter_statements
+
+    path_to_dump = tmpdir.join("dump.sql.gz").strpath
+    dump = b"-- Header\nINSERT INTO `page` VALUES (1,0,'A'),(2,0,'B;)')" + end
+    with gzip.open(path_to_dump, "wb") as f:
+        f.write(dump)
+
+    statements = [(list(statement), statement.end) for statement in _iter_statements(path_to_dump)]
+    assert statements == [([["1", "0", "A"], ["2", "0", "B;)"]], len(dump))]
 
-    assert len(results) > 0
+    # A statement that is cut off is still an error
+    with gzip.open(path_to_dump, "wb") as f:
+        f.write(dump[: -len(end) - 1])
+    with pytest.raises(ValueError, match="Truncated"):
+        [list(statement) for statement in _iter_statements(path_to_dump)]
@@ -0,0 +1,127 @@
+import json
+import sqlite3
+import threading
+from urllib.request import Request, urlopen
+
+import pytest
+
+from wikimapper.server import LookupBatcher, MappingServer
+
+
+@pytest.fixture
+def small_index(tmpdir) -> str:
+    path_to_db = tmpdir.join("index.db").strpath
+    with sqlite3.connect(path_to_db) as conn:
+        conn.execute(
+            "CREATE TABLE mapping (wikipedia_id int PRIMARY KEY, wikipedia_title text, wikidata_id text)"
+        )
+        conn.executemany(
+            "INSERT INTO mapping VALUES (?, ?, ?)",
+            [(1, "Manatee", "Q42797"), (2, "Sea_cow", "Q42797"), (3, "Germany", "Q183")],
+        )
+        conn.execute("CREATE TABLE page_property (property int PRIMARY KEY, name text)")
+        conn.execute("CREATE TABLE page_props (wikipedia_id int, property int, value text)")
+        conn.execute("INSERT INTO page_property VALUES (1, 'wikibase-shortdesc')")
+        conn.execute("INSERT INTO page_props VALUES (1, 1, 'Aquatic mammal')")
+    return path_to_db
+
+
+@pytest.fixture
+def server_url(small_index):
+    server = MappingServer(small_index, port=0, workers=2)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://{0}:{1}".format(*server.server_address[:2])
+    server.shutdown()
+    server.server_close()
+
+
+def _get(url: str):
+    with urlopen(url) as response:
+        return json.loads(response.read())
+
+
+def _post(url: str, payload) -> dict:
+    request = Request(url, json.dumps(payload).encode("utf-8"), method="POST")
+    with urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def test_single_and_multi_key_requests(server_url):
+    assert _get(server_url + "/title_to_id?key=Manatee") == {"result": "Q42797"}
+    assert _post(server_url + "/title_to_id", {"keys": ["Germany", "Dugong"]}) == {
+        "results": ["Q183", None]
+    }
+    assert _post(server_url + "/wikipedia_id_to_title", {"key": 3}) == {"result": "Germany"}
+
+    result = _post(server_url + "/id_to_titles", {"key": "Q42797"})["result"]
+    assert sorted(result) == ["Manatee", "Sea_cow"]
+
+
+def test_page_props(server_url):
+    shortdesc = {"wikibase-shortdesc": "Aquatic mammal"}
+
+    assert _get(server_url + "/page_props?key=1") == {"result": shortdesc}
+    assert _post(server_url + "/page_props", {"keys": [1, 3]}) == {"results": [shortdesc, {}]}
+
+
+@pytest.mark.parametrize(
+    "method, payload",
+    [
+        ("title_to_id", {"key": ["Manatee"]}),
+        ("title_to_id", {"keys": ["Manatee", 3]}),
+        ("id_to_titles", {"key": None}),
+        ("wikipedia_id_to_title", {"key": "Germany"}),
+        ("wikipedia_id_to_title", {"key": True}),
+    ],
+)
+def test_invalid_keys(server_url, method: str, payload: dict):
+    with pytest.raises(Exception) as e:
+        _post(server_url + "/" + method, payload)
+    assert e.value.code == 400
+
+    assert _get(server_url + "/wikipedia_id_to_title?key=3") == {"result": "Germany"}
+
+
+def test_unknown_method(server_url):
+    with pytest.raises(Exception) as e:
+        _get(server_url + "/title_to_nothing?key=Manatee")
+    assert e.value.code == 404
+
+
+def test_metrics(server_url):
+    _get(server_url + "/title_to_id?key=Manatee")
+
+    metrics = _get(server_url + "/metrics")
+
+    assert metrics["requests"] == 1
+    assert metrics["keys"] == 1
+    assert metrics["request_latency"]["title_to_id"]["calls"] == 1
+    assert metrics["lookups"]["titles_to_ids"]["calls"] == 1
+
+
+def test_batcher_groups_concurrent_requests(small_index):
+    batcher = LookupBatcher(small_index, workers=1, batch_window=0.5, max_batch=3)
+
+    futures = [batcher.submit("title_to_id", [title]) for title in ["Manatee", "Germany", "x"]]
+    results = [f.result(timeout=5) for f in futures]
+    metrics = batcher.metrics()
+    batcher.close()
+
+    assert results == [["Q42797"], ["Q183"], [None]]
+    assert metrics["batches"] == 1
+    assert metrics["mean_batch_size"] == 3
+
+
+def test_batcher_isolates_failing_requests(small_index):
+    batcher = LookupBatcher(small_index, workers=1, batch_window=0.5, max_batch=2)
+
+    valid = batcher.submit("title_to_id", ["Manatee"])
+    invalid = batcher.submit("title_to_id", [["x"]])
+    result = valid.result(timeout=5)
+    error = invalid.exception(timeout=5)
+    metrics = batcher.metrics()
+    batcher.close()
+
+    assert result == ["Q42797"]
+    assert isinstance(error, TypeError)
+    assert metrics["batches"] == 1
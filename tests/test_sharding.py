@@ -0,0 +1,166 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from wikimapper import ShardedWikiMapper, WikiMapper, create_index, create_sharded_index
+from wikimapper.sharding import _find_shards
+
+
+@pytest.fixture(scope="module")
+def synthetic_wiki_shards(tmpdir_factory, synthetic_wiki_dump) -> str:
+    path_to_shards = tmpdir_factory.mktemp("shards").strpath
+    create_sharded_index(
+        synthetic_wiki_dump.dumpname,
+        synthetic_wiki_dump.path,
+        path_to_shards,
+        num_shards=3,
+        workers=2,
+        bloom_filter_error_rate=0.01,
+        namespaces=[0, 14],
+        page_props=["wikibase-shortdesc", "disambiguation"],
+    )
+    return path_to_shards
+
+
+def test_create_sharded_index(synthetic_wiki_shards, synthetic_wiki_index):
+    assert sorted(os.listdir(synthetic_wiki_shards)) == [
+        "routing.bin",
+        "shard-00000-of-00003.db",
+        "shard-00001-of-00003.db",
+        "shard-00002-of-00003.db",
+    ]
+
+    query = "SELECT wikipedia_id, wikipedia_title, wikidata_id, namespace FROM mapping"
+    rows = []
+    for path in _find_shards(synthetic_wiki_shards):
+        with sqlite3.connect(path) as conn:
+            rows.extend(conn.execute(query).fetchall())
+        conn.close()
+    with sqlite3.connect(synthetic_wiki_index) as conn:
+        expected = conn.execute(query).fetchall()
+    conn.close()
+
+    assert sorted(rows) == sorted(expected)
+
+
+@pytest.mark.parametrize("use_bloom_filter", [False, True])
+def test_sharded_mapper(
+    synthetic_wiki_shards, synthetic_wiki_mapper, synthetic_wiki_dump, use_bloom_filter: bool
+):
+    mapper = ShardedWikiMapper(synthetic_wiki_shards, use_bloom_filter)
+    expected = synthetic_wiki_mapper
+    pages = synthetic_wiki_dump.pages
+
+    titles = [page.title for page in pages] + ["I am not in the Wiki"]
+    wikipedia_ids = [page.wikipedia_id for page in pages] + [str(pages[0].wikipedia_id), 0]
+    wikidata_ids = [page.wikidata_id for page in pages if page.wikidata_id] + ["Q0"]
+
+    for namespace in [0, 14]:
+        for title in titles:
+            assert mapper.title_to_id(title, namespace) == expected.title_to_id(title, namespace)
+            assert mapper.title_to_wikipedia_id(title, namespace) == (
+                expected.title_to_wikipedia_id(title, namespace)
+            )
+        for wikidata_id in wikidata_ids:
+            assert mapper.id_to_titles(wikidata_id, namespace) == expected.id_to_titles(
+                wikidata_id, namespace
+            )
+            assert mapper.id_to_wikipedia_ids(wikidata_id, namespace) == (
+                expected.id_to_wikipedia_ids(wikidata_id, namespace)
+            )
+    for wikipedia_id in wikipedia_ids:
+        assert mapper.wikipedia_id_to_id(wikipedia_id) == expected.wikipedia_id_to_id(wikipedia_id)
+        assert mapper.wikipedia_id_to_title(wikipedia_id) == expected.wikipedia_id_to_title(
+            wikipedia_id
+        )
+        assert mapper.page_props(wikipedia_id) == expected.page_props(wikipedia_id)
+
+    assert mapper.titles_to_ids(titles) == expected.titles_to_ids(titles)
+    assert mapper.titles_to_wikipedia_ids(titles, 14) == expected.titles_to_wikipedia_ids(
+        titles, 14
+    )
+    assert mapper.wikipedia_ids_to_ids(wikipedia_ids) == expected.wikipedia_ids_to_ids(
+        wikipedia_ids
+    )
+    assert mapper.wikipedia_ids_to_titles(wikipedia_ids) == expected.wikipedia_ids_to_titles(
+        wikipedia_ids
+    )
+    # Batch lookups do not order the pages of a Wikidata id
+    assert [sorted(t) for t in mapper.ids_to_titles(wikidata_ids)] == [
+        sorted(t) for t in expected.ids_to_titles(wikidata_ids)
+    ]
+    assert [sorted(i) for i in mapper.ids_to_wikipedia_ids(wikidata_ids)] == [
+        sorted(i) for i in expected.ids_to_wikipedia_ids(wikidata_ids)
+    ]
+
+    mapper.close()
+
+
+def test_sharded_index_follows_redirect_chains(tmpdir, redirect_chains_dump):
+    dumpname, path = redirect_chains_dump.dumpname, redirect_chains_dump.path
+    path_to_shards = tmpdir.join("shards").strpath
+    create_sharded_index(dumpname, path, path_to_shards, num_shards=3, workers=2)
+    path_to_db = create_index(dumpname, path, tmpdir.join("index.db").strpath)
+
+    mapper, expected = ShardedWikiMapper(path_to_shards), WikiMapper(path_to_db)
+    for page in redirect_chains_dump.pages:
+        assert mapper.title_to_id(page.title) == page.wikidata_id
+        assert mapper.title_to_id(page.title) == expected.title_to_id(page.title)
+        assert mapper.wikipedia_id_to_id(page.wikipedia_id) == expected.wikipedia_id_to_id(
+            page.wikipedia_id
+        )
+    for wikidata_id in ["Q1", "Q2", "Q3", "Q4"]:
+        assert mapper.id_to_titles(wikidata_id) == expected.id_to_titles(wikidata_id)
+    # D redirects to E, a redirect with a lower page id
+    assert mapper.id_to_titles("Q2") == ["E", "F", "D"]
+
+    mapper.close()
+
+
+def test_sharded_mapper_routes_page_ids(synthetic_wiki_shards):
+    mapper = ShardedWikiMapper(synthetic_wiki_shards)
+
+    for shard, path in enumerate(_find_shards(synthetic_wiki_shards)):
+        with sqlite3.connect(path) as conn:
+            wikipedia_ids = [row[0] for row in conn.execute("SELECT wikipedia_id FROM mapping")]
+        conn.close()
+        for wikipedia_id in wikipedia_ids:
+            assert mapper._page_shard(wikipedia_id) == shard
+
+    assert mapper._page_shard(0) is None
+    assert mapper._page_shard(-1) is None
+    assert mapper._page_shard(10 ** 12) is None
+    assert mapper._page_shard("Not an id") is None
+
+    mapper.close()
+
+
+def test_sharded_mapper_without_routing_table(tmpdir, synthetic_wiki_shards, synthetic_wiki_dump):
+    folder = tmpdir.mkdir("shards")
+    for path in _find_shards(synthetic_wiki_shards):
+        shutil.copy(path, folder.strpath)
+
+    mapper = ShardedWikiMapper(folder.strpath)
+    routed = ShardedWikiMapper(synthetic_wiki_shards)
+    wikipedia_ids = [page.wikipedia_id for page in synthetic_wiki_dump.pages] + [0]
+
+    for wikipedia_id in wikipedia_ids:
+        assert mapper.wikipedia_id_to_title(wikipedia_id) == routed.wikipedia_id_to_title(
+            wikipedia_id
+        )
+        assert mapper.page_props(wikipedia_id) == routed.page_props(wikipedia_id)
+    assert mapper.wikipedia_ids_to_ids(wikipedia_ids) == routed.wikipedia_ids_to_ids(wikipedia_ids)
+
+    mapper.close()
+    routed.close()
+
+
+def test_sharded_mapper_requires_all_shards(tmpdir):
+    folder = tmpdir.mkdir("shards")
+    for i in [0, 2]:
+        sqlite3.connect(folder.join("shard-0000{0}-of-00003.db".format(i)).strpath).close()
+
+    with pytest.raises(ValueError):
+        ShardedWikiMapper(folder.strpath)
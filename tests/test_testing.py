@@ -0,0 +1,60 @@
+import gzip
+import os
+
+from wikimapper.processor import _iter_rows
+from wikimapper.testing import write_wikidumps
+
+
+def _read(path: str) -> dict:
+    contents = {}
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), "rb") as f:
+            contents[name] = gzip.decompress(f.read())
+    return contents
+
+
+def test_write_wikidumps_is_deterministic(tmpdir):
+    first = write_wikidumps("synwiki-20240101", tmpdir.join("first").strpath, num_pages=300)
+    second = write_wikidumps("synwiki-20240101", tmpdir.join("second").strpath, num_pages=300)
+
+    assert first == second
+    assert _read(tmpdir.join("first").strpath) == _read(tmpdir.join("second").strpath)
+    assert sorted(os.listdir(tmpdir.join("first").strpath)) == [
+        "synwiki-20240101-page.sql.gz",
+        "synwiki-20240101-page_props.sql.gz",
+        "synwiki-20240101-redirect.sql.gz",
+    ]
+
+
+def test_write_wikidumps_with_huge_statements(tmpdir):
+    path = tmpdir.strpath
+    pages = write_wikidumps("synwiki-20240101", path, num_pages=500, statement_size=2 ** 40)
+
+    for table in ["page", "page_props", "redirect"]:
+        dump = _read(path)["synwiki-20240101-{0}.sql.gz".format(table)]
+        assert dump.count(b"\nINSERT INTO ") == 1
+
+    rows = list(_iter_rows(os.path.join(path, "synwiki-20240101-page.sql.gz")))
+    assert [(int(v[0]), int(v[1]), v[2]) for v in rows] == [page[:3] for page in pages]
+
+
+def test_write_wikidumps_with_redirect_chains(tmpdir):
+    path = tmpdir.strpath
+    write_wikidumps("synwiki-20240101", path, num_pages=2000)
+
+    def rows(table: str) -> list:
+        path_to_dump = os.path.join(path, "synwiki-20240101-{0}.sql.gz".format(table))
+        return list(_iter_rows(path_to_dump, errors="ignore"))
+
+    ids = {(v[1], v[2]): int(v[0]) for v in rows("page")}
+    targets = {int(v[0]): ids[v[1], v[2]] for v in rows("redirect") if (v[1], v[2]) in ids}
+    chains = {source: target for source, target in targets.items() if target in targets}
+
+    # Redirects to redirects with smaller and larger page ids, and cycles of redirects
+    assert any(target < source for source, target in chains.items())
+    assert any(target > source for source, target in chains.items())
+    assert any(chains.get(chains[source]) == source for source in chains)
+
+    # Redirects with a Wikidata id of their own
+    wikidata_ids = {int(v[0]) for v in rows("page_props") if v[1] == "wikibase_item"}
+    assert wikidata_ids & set(targets)
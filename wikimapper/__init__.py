@@ -1,3 +1,37 @@
-from wikimapper.download import download_wikidumps
-from wikimapper.mapper import WikiMapper
-from wikimapper.processor import create_index
+import importlib
+from typing import TYPE_CHECKING
+
+# Submodules are only imported once one of their attributes is accessed, so that e.g. using
+# the mapper does not import what is needed for downloading dumps and creating indices.
+_ATTRIBUTES = {
+    "CompressedWikiMapper": "wikimapper.compressed",
+    "compress_index": "wikimapper.compressed",
+    "download_wikidumps": "wikimapper.download",
+    "LookupStats": "wikimapper.mapper",
+    "WikiMapper": "wikimapper.mapper",
+    "create_index": "wikimapper.processor",
+    "ShardedWikiMapper": "wikimapper.sharding",
+    "create_sharded_index": "wikimapper.sharding",
+}
+
+__all__ = list(_ATTRIBUTES)
+
+if TYPE_CHECKING:
+    from wikimapper.compressed import CompressedWikiMapper, compress_index
+    from wikimapper.download import download_wikidumps
+    from wikimapper.mapper import LookupStats, WikiMapper
+    from wikimapper.processor import create_index
+    from wikimapper.sharding import ShardedWikiMapper, create_sharded_index
+
+
+def __getattr__(name: str):
+    if name not in _ATTRIBUTES:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+
+    value = getattr(importlib.import_module(_ATTRIBUTES[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
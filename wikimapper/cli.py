@@ -1,128 +1,380 @@
 import argparse
-import logging
 import os
+import sys
+from typing import Callable, List
 
-from wikimapper import WikiMapper, create_index, download_wikidumps
 from wikimapper.__version__ import __version__
+from wikimapper.formats import is_compressed_index
 
 
 def main():
-    logging.basicConfig(
-        level=logging.DEBUG, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
-
     description = "Map Wikipedia page titles to Wikidata IDs and vice versa."
     parser = argparse.ArgumentParser(description=description)
 
     subparsers = parser.add_subparsers(help="sub-command help", dest="command")
 
-    # Downloda parser
-    parser_download = subparsers.add_parser(
-        "download", help="Download Wikipedia dumps for creating a custom index."
+    # Only the arguments of the invoked sub-command are needed, adding all of them takes
+    # about as long as a lookup itself.
+    invoked = sys.argv[1] if len(sys.argv) > 1 else None
+    for name, help, add_arguments in _COMMANDS:
+        subparser = subparsers.add_parser(name, help=help)
+        if name == invoked:
+            add_arguments(subparser)
+
+    # Version
+    parser.add_argument("--version", action="version", version="%(prog)s " + __version__)
+
+    # Do the work
+    args = parser.parse_args()
+
+    # Modules are imported by the sub-commands that need them, so that lookups do not
+    # pay for importing what is needed for downloading and creating indices.
+    if args.command == "download":
+        from wikimapper.download import download_wikidumps
+
+        _configure_logging()
+        download_wikidumps(args.dumpname, args.dir, args.mirror, args.overwrite)
+    elif args.command == "create":
+        _configure_logging()
+        kwargs = dict(
+            bloom_filter_error_rate=args.bloom_error_rate,
+            namespaces=args.namespaces,
+            page_props=args.page_props,
+            reverse_mapping=args.reverse_mapping,
+        )
+
+        if args.shards is None:
+            from wikimapper.processor import create_index
+
+            create_index(
+                args.dumpname,
+                args.dumpdir,
+                args.target,
+                low_memory=args.low_memory,
+                memory_budget=args.memory_budget * 1024 * 1024,
+                tmp_dir=args.tmpdir,
+                resume=args.resume,
+                **kwargs,
+            )
+        elif args.low_memory or args.resume:
+            parser.error("--low-memory and --resume can not be combined with --shards")
+        else:
+            from wikimapper.sharding import create_sharded_index
+
+            create_sharded_index(
+                args.dumpname, args.dumpdir, args.target, args.shards, args.workers, **kwargs
+            )
+    elif args.command == "compress":
+        from wikimapper.compressed import compress_index
+
+        compress_index(args.index, args.target, args.block_size, args.level)
+    elif args.command == "serve":
+        from wikimapper.server import serve
+
+        _configure_logging()
+        serve(
+            args.index,
+            args.host,
+            args.port,
+            args.workers,
+            args.batch_window / 1000,
+            args.max_batch,
+        )
+    elif args.command in ["title2id", "url2id", "id2titles"]:
+        from wikimapper.mapper import LookupStats
+
+        stats = LookupStats() if args.stats else None
+
+        if os.path.isdir(args.index):
+            from wikimapper.sharding import ShardedWikiMapper
+
+            mapper = ShardedWikiMapper(args.index, stats=stats)
+        elif is_compressed_index(args.index):
+            from wikimapper.compressed import CompressedWikiMapper
+
+            mapper = CompressedWikiMapper(args.index, stats=stats)
+        else:
+            from wikimapper.mapper import WikiMapper
+
+            mapper = WikiMapper(args.index, stats=stats)
+
+        if args.command == "title2id":
+            _print_results(args.title, lambda title: mapper.title_to_id(title, args.namespace))
+        elif args.command == "url2id":
+            _print_results(args.url, mapper.url_to_id)
+        elif args.command == "id2titles":
+            _print_results(args.id, lambda id_: mapper.id_to_titles(id_, args.namespace))
+
+        if stats is not None:
+            print(stats.summary(), file=sys.stderr)
+    else:
+        parser.print_help()
+
+
+def _configure_logging():
+    import logging
+
+    logging.basicConfig(
+        level=logging.DEBUG, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     )
-    parser_download.add_argument(
+
+
+def _add_download_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
         "dumpname",
         type=_dump_name,
         help='Name of the Wikipedia dump, e.g. "enwiki-latest" for the latest English Wikipedia dump or "barwiki-20190420" for a dump from the Bavarian Wikipedia taken at the 20th April, 2019',
     )
-    parser_download.add_argument(
+    parser.add_argument(
         "--overwrite",
         action="store_true",
         help='Overwrite existing files if they already exist (default: "False")',
     )
-    parser_download.add_argument(
+    parser.add_argument(
         "--dir",
         type=_dir_path,
         default=os.getcwd(),
         help="Path to the folder in which the dump should be stored (default: current directory)",
     )
-    parser_download.add_argument(
+    parser.add_argument(
         "--mirror",
         type=str,
         default="https://dumps.wikimedia.org",
         help='URL of the Wikipedia dump mirror to use (default: "https://dumps.wikimedia.org")',
     )
 
-    # Index creation parser
-    parser_create = subparsers.add_parser(
-        "create", help="Use a previously downloaded Wikipedia dump to create a custom index."
-    )
-    parser_create.add_argument(
+
+def _add_create_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
         "dumpname",
         type=_dump_name,
         help='Name of the Wikipedia dump, e.g. "enwiki-latest" for the latest English Wikipedia dump or "barwiki-20190420" for a dump from the Bavarian Wikipedia taken at the 20th April, 2019',
     )
-    parser_create.add_argument(
+    parser.add_argument(
         "--target",
         default=None,
         type=str,
-        help='Path and name of the index to create (default: "index_${dumpname}.db")',
+        help='Path and name of the index to create (default: "index_${dumpname}.db", or "index_${dumpname}_shards" with --shards)',
     )
-    parser_create.add_argument(
+    parser.add_argument(
         "--dumpdir",
         type=_dir_path,
         default=os.getcwd(),
         help="Path to the folder in which the dump was stored (default: current directory)",
     )
-
-    # Mapping parser
-    parser_title_to_id = subparsers.add_parser(
-        "title2id", help="Map a Wikipedia title to a Wikidata ID."
+    parser.add_argument(
+        "--bloom-error-rate",
+        default=None,
+        type=float,
+        help="Also store Bloom filters with this false positive rate (e.g. 0.01) in the index, so that lookups of unknown titles and ids skip the database (default: no filters)",
     )
-    parser_title_to_id.add_argument(
-        "index", type=str, help="Path to the index file that shall be used for the mapping."
+    parser.add_argument(
+        "--low-memory",
+        action="store_true",
+        help="Sort the parsed dumps on disk and join them sequentially instead of updating the index randomly, for wikis whose index is much larger than the available memory (not with --shards)",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        default=512,
+        help="Memory in MiB that parsed rows may use in --low-memory mode before they are spilled to disk (default: 512)",
+    )
+    parser.add_argument(
+        "--tmpdir",
+        type=_dir_path,
+        default=None,
+        help="Path to the folder for temporary files of --low-memory mode (default: folder of the index)",
+    )
+    parser.add_argument(
+        "--namespaces",
+        nargs="+",
+        type=int,
+        default=[0],
+        help="Namespaces whose pages are indexed, e.g. 0 14 10 for articles, categories and templates (default: 0)",
+    )
+    parser.add_argument(
+        "--page-props",
+        nargs="+",
+        type=str,
+        default=[],
+        help='Page properties to store in addition to the Wikidata ID, e.g. "wikibase-shortdesc disambiguation" (default: none)',
+    )
+    parser.add_argument(
+        "--reverse-mapping",
+        action="store_true",
+        help="Also store the pages clustered by Wikidata ID, which speeds up id2titles and returns pages that are not redirects first",
     )
-    parser_title_to_id.add_argument(
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=None,
+        help="Split the index into this many shards by page title, --target is then a folder for the shard files (default: no sharding)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of processes creating shards in parallel (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted build of the same index from its last checkpoint instead of starting over (not with --shards)",
+    )
+
+
+def _add_title2id_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "index",
+        type=str,
+        help="Path to the index file, compressed index or folder of shards, that shall be used for the mapping.",
+    )
+    parser.add_argument(
         "title",
         type=str,
+        nargs="+",
         help="Page title to map. Spaces are replaced by underscores, the title should not be escaped.",
     )
+    parser.add_argument(
+        "--namespace",
+        type=int,
+        default=0,
+        help="Namespace of the page, the title has no namespace prefix (default: 0)",
+    )
 
-    parser_url_to_id = subparsers.add_parser("url2id", help="Map a Wikipedia URL to a Wikidata ID.")
-    parser_url_to_id.add_argument(
-        "index", type=str, help="Path to the index file that shall be used for the mapping."
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print call counts, hit ratios and latencies of the lookups to stderr afterwards",
     )
-    parser_url_to_id.add_argument(
+
+
+def _add_url2id_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "index",
+        type=str,
+        help="Path to the index file, compressed index or folder of shards, that shall be used for the mapping.",
+    )
+    parser.add_argument(
         "url",
         type=str,
+        nargs="+",
         help="URL to map. It is not checked whether the URL comes from the same Wiki as the index.",
     )
 
-    parser_id_to_title = subparsers.add_parser(
-        "id2titles", help="Map a Wikidata ID to one or more Wikipedia titles."
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print call counts, hit ratios and latencies of the lookups to stderr afterwards",
+    )
+
+
+def _add_id2titles_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "index",
+        type=str,
+        help="Path to the index file, compressed index or folder of shards, that shall be used for the mapping.",
+    )
+    parser.add_argument("id", type=str, nargs="+", help="Wikidata ID to map.")
+    parser.add_argument(
+        "--namespace", type=int, default=0, help="Namespace of the titles to return (default: 0)",
+    )
+
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print call counts, hit ratios and latencies of the lookups to stderr afterwards",
     )
-    parser_id_to_title.add_argument(
+
+
+def _add_compress_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("index", type=str, help="Path to the index file that shall be compressed.")
+    parser.add_argument(
+        "--target",
+        default=None,
+        type=str,
+        help='Path and name of the compressed index (default: the index with the extension ".wmz")',
+    )
+    parser.add_argument(
+        "--block-size",
+        type=int,
+        default=64,
+        help="Number of entries that are compressed together, larger blocks give smaller files but slower lookups (default: 64)",
+    )
+    parser.add_argument(
+        "--level",
+        type=int,
+        default=9,
+        help="zlib compression level from 1 (fastest) to 9 (smallest) (default: 9)",
+    )
+
+
+def _add_serve_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
         "index", type=str, help="Path to the index file that shall be used for the mapping."
     )
-    parser_id_to_title.add_argument("id", type=str, help="Wikidata ID to map.")
+    parser.add_argument(
+        "--host", type=str, default="127.0.0.1", help='Address to listen on (default: "127.0.0.1")'
+    )
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on (default: 8080)")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of threads with their own read-only connection answering lookups (default: 4)",
+    )
+    parser.add_argument(
+        "--batch-window",
+        type=float,
+        default=2.0,
+        help="Milliseconds to wait for further requests to look up together with the first one (default: 2)",
+    )
+    parser.add_argument(
+        "--max-batch",
+        type=int,
+        default=256,
+        help="Maximum number of keys looked up in one batch (default: 256)",
+    )
 
-    # Version
-    parser.add_argument("--version", action="version", version="%(prog)s " + __version__)
 
-    # Do the work
-    args = parser.parse_args()
+_COMMANDS = [
+    ("download", "Download Wikipedia dumps for creating a custom index.", _add_download_arguments),
+    (
+        "create",
+        "Use a previously downloaded Wikipedia dump to create a custom index.",
+        _add_create_arguments,
+    ),
+    (
+        "compress",
+        "Compress an index into a smaller, read-only file for distribution.",
+        _add_compress_arguments,
+    ),
+    ("title2id", "Map a Wikipedia title to a Wikidata ID.", _add_title2id_arguments),
+    ("url2id", "Map a Wikipedia URL to a Wikidata ID.", _add_url2id_arguments),
+    ("id2titles", "Map a Wikidata ID to one or more Wikipedia titles.", _add_id2titles_arguments),
+    (
+        "serve",
+        "Serve all lookups of an index as JSON over HTTP, batching concurrent requests.",
+        _add_serve_arguments,
+    ),
+]
 
-    if args.command == "download":
-        download_wikidumps(args.dumpname, args.dir, args.mirror, args.overwrite)
-    elif args.command == "create":
-        create_index(args.dumpname, args.dumpdir, args.target)
-    elif args.command == "title2id":
-        mapper = WikiMapper(args.index)
-        result = mapper.title_to_id(args.title)
-        if result:
-            print(result)
-    elif args.command == "url2id":
-        mapper = WikiMapper(args.index)
-        result = mapper.url_to_id(args.url)
-        if result:
-            print(result)
-    elif args.command == "id2titles":
-        mapper = WikiMapper(args.index)
-        results = mapper.id_to_titles(args.id)
-        for result in results:
-            print(result)
-    else:
-        parser.print_help()
+
+def _print_results(keys: List[str], lookup: Callable):
+    """Prints the results of looking up every key. A single key only prints its results, which
+    are omitted if there are none. Several keys print one `key<TAB>result` line per result and
+    key, the result is empty if there is none.
+    """
+    for key in keys:
+        result = lookup(key)
+        results = result if isinstance(result, list) else [result] if result else []
+
+        if len(keys) == 1:
+            for r in results:
+                print(r)
+        else:
+            for r in results or [""]:
+                print("{0}\t{1}".format(key, r))
 
 
 def _dir_path(path) -> str:
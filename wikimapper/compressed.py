@@ -0,0 +1,528 @@
+""" Stores an index in a compact, read-only file for distribution and looks up keys in it.
+
+The pages are stored three times, ordered by title, by page id and by Wikidata id, in blocks of
+`block_size` entries that are compressed on their own. A directory with the first key of every
+block locates the block of a key, so a lookup only decompresses the blocks it touches.
+
+Within a block, titles are front coded and ids are stored column by column, as deltas to the
+previous entry where they are ordered, which zlib compresses well and which are decoded at once
+by `struct`. Pages in the other orders refer to their title by its position in the title order.
+Wikidata ids are stored as their number.
+"""
+
+import bisect
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import accumulate, islice
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from wikimapper.formats import COMPRESSED_MAGIC as _MAGIC
+from wikimapper.formats import is_compressed_index
+from wikimapper.mapper import LookupStats, WikiMapper, _as_int, _instrumented
+
+_FOOTER = struct.Struct("<Q")
+_HEADER = struct.Struct("<IIII")
+_COUNT = struct.Struct("<I")
+
+# Namespaces are big endian, so that keys sort by namespace and then by title
+_NAMESPACE = struct.Struct(">I")
+
+_TITLES, _PAGES, _WIKIDATA = 0, 1, 2
+
+# Every this many titles, a title is stored in full, so that a lookup only decodes the titles
+# from the closest such restart point on instead of all titles of a block
+_RESTART_INTERVAL = 16
+
+_WIKIDATA_ID = re.compile(r"^Q[1-9][0-9]*$")
+
+
+@lru_cache(maxsize=None)
+def _columns(codes: str, n: int) -> struct.Struct:
+    """Returns the struct of `n` values per column, e.g. `HI` for a column of `n` unsigned shorts
+    followed by a column of `n` unsigned ints.
+    """
+    return struct.Struct("<" + "".join("{0}{1}".format(n, code) for code in codes))
+
+
+def _pack(codes: str, columns: List[list]) -> bytes:
+    n = len(columns[0])
+    return _COUNT.pack(n) + _columns(codes, n).pack(*(v for column in columns for v in column))
+
+
+def _unpack(codes: str, data: bytes, pos: int = 0) -> Tuple[List[tuple], int]:
+    """Returns the columns packed by `_pack` at `pos` in `data` and the position after them."""
+    (n,) = _COUNT.unpack_from(data, pos)
+    columns = _columns(codes, n)
+    values = columns.unpack_from(data, pos + _COUNT.size)
+    pos += _COUNT.size + columns.size
+    return [values[i * n : (i + 1) * n] for i in range(len(codes))], pos
+
+
+def _title_key(namespace: int, page_title: str) -> bytes:
+    return _NAMESPACE.pack(namespace) + page_title.encode("utf-8")
+
+
+def _as_wikidata_number(wikidata_id) -> Optional[int]:
+    """Returns the number of `wikidata_id`, e.g. `42` for `Q42`, and `None` for anything that
+    can not be in the index.
+    """
+    if isinstance(wikidata_id, str) and _WIKIDATA_ID.match(wikidata_id):
+        return int(wikidata_id[1:])
+    return None
+
+
+def _encode_titles(entries: List[tuple]) -> Tuple[bytes, bytes]:
+    # (namespace, wikipedia_title, wikipedia_id, wikidata number) ordered by title key
+    keys = [_title_key(namespace, title) for namespace, title, _, _ in entries]
+
+    prefixes = []
+    suffixes = []
+    previous = b""
+    for i, key in enumerate(keys):
+        prefix = len(os.path.commonprefix([previous, key])) if i % _RESTART_INTERVAL else 0
+        prefixes.append(prefix)
+        suffixes.append(key[prefix:])
+        previous = key
+
+    lengths = [len(suffix) for suffix in suffixes]
+    columns = [prefixes, lengths, [e[2] for e in entries], [e[3] for e in entries]]
+    return _pack("HHII", columns) + b"".join(suffixes), keys[0]
+
+
+def _decode_titles(data: bytes) -> tuple:
+    (prefixes, lengths, wikipedia_ids, numbers), pos = _unpack("HHII", data)
+
+    # Titles are only decoded when they are looked up, see `_keys_from`
+    starts = list(accumulate((pos,) + lengths))
+    restarts = [data[starts[i] : starts[i + 1]] for i in range(0, len(prefixes), _RESTART_INTERVAL)]
+    return restarts, wikipedia_ids, numbers, data, prefixes, starts
+
+
+def _keys_from(block: tuple, restart: int) -> Iterable[Tuple[int, bytes]]:
+    """Yields the positions and keys of the titles in `block` from the restart point `restart`
+    up to the next one.
+    """
+    restarts, _, _, data, prefixes, starts = block
+
+    i = restart * _RESTART_INTERVAL
+    key = restarts[restart]
+    yield i, key
+
+    for i in range(i + 1, min(i + _RESTART_INTERVAL, len(prefixes))):
+        key = key[: prefixes[i]] + data[starts[i] : starts[i + 1]]
+        yield i, key
+
+
+def _encode_pages(entries: List[tuple]) -> Tuple[bytes, int]:
+    # (wikipedia_id, title position, wikidata number) ordered by `wikipedia_id`
+    ids = [wikipedia_id for wikipedia_id, _, _ in entries]
+    deltas = [ids[0]] + [b - a for a, b in zip(ids, ids[1:])]
+    return _pack("III", [deltas, [e[1] for e in entries], [e[2] for e in entries]]), ids[0]
+
+
+def _decode_pages(data: bytes) -> Tuple[List[int], tuple, tuple]:
+    (deltas, positions, numbers), _ = _unpack("III", data)
+    return list(accumulate(deltas)), positions, numbers
+
+
+def _encode_wikidata(entries: List[tuple]) -> Tuple[bytes, int]:
+    # (wikidata number, namespace, title position) ordered by wikidata number
+    numbers = [number for number, _, _ in entries]
+    deltas = [numbers[0]] + [b - a for a, b in zip(numbers, numbers[1:])]
+    return _pack("III", [deltas, [e[1] for e in entries], [e[2] for e in entries]]), numbers[0]
+
+
+def _decode_wikidata(data: bytes) -> Tuple[List[int], tuple, tuple]:
+    (deltas, namespaces, positions), _ = _unpack("III", data)
+    return list(accumulate(deltas)), namespaces, positions
+
+
+def _write_blocks(
+    f, entries: Iterable[tuple], block_size: int, level: int, encode: Callable
+) -> List[tuple]:
+    """Writes `entries` to `f` in compressed blocks of `block_size` entries.
+
+    Returns:
+        List[tuple]: The compressed length and the first key of every block.
+    """
+    blocks = []
+    entries = iter(entries)
+    while True:
+        block = list(islice(entries, block_size))
+        if not block:
+            return blocks
+
+        data, first_key = encode(block)
+        data = zlib.compress(data, level)
+        f.write(data)
+        blocks.append((len(data), first_key))
+
+
+def _encode_directory(block_size: int, sections: List[List[tuple]]) -> bytes:
+    titles, pages, wikidata = sections
+    parts = [_HEADER.pack(block_size, len(titles), len(pages), len(wikidata))]
+    for section in sections:
+        parts.append(_pack("I", [[length for length, _ in section]]))
+
+    keys = [key for _, key in titles]
+    parts.append(_pack("H", [[len(key) for key in keys]]) + b"".join(keys))
+    parts.append(_pack("I", [[key for _, key in pages]]))
+    parts.append(_pack("I", [[key for _, key in wikidata]]))
+
+    return zlib.compress(b"".join(parts), 9)
+
+
+def compress_index(
+    path_to_db: str, path_to_compressed: str = None, block_size: int = 64, level: int = 9
+) -> str:
+    """Stores the index `path_to_db` created by `create_index` in the compact, read-only format
+    read by `CompressedWikiMapper`. Page properties and Bloom filters are not stored.
+
+    Args:
+        path_to_db(str): Path to the index created by `create_index`.
+        path_to_compressed(str): Path where the compressed index will be saved to. Defaults to
+            `path_to_db` with the extension `.wmz`.
+        block_size(int): Number of entries that are compressed together. Larger blocks compress
+            better, but every lookup has to decompress a whole block.
+        level(int): The zlib compression level from `1` (fastest) to `9` (smallest).
+
+    Returns:
+        str: The path to the compressed index.
+
+    """
+    from wikimapper.processor import _replace_file
+
+    if path_to_compressed is None:
+        path_to_compressed = os.path.splitext(path_to_db)[0] + ".wmz"
+
+    if block_size < 1:
+        raise ValueError("Block size has to be positive, got [{0}]".format(block_size))
+
+    conn = sqlite3.connect(path_to_db)
+
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master")}
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(mapping)")}
+
+    # Indices created before namespaces were supported only contain articles
+    if "namespace" in columns:
+        namespace, title_order = "m.namespace", "m.namespace, m.wikipedia_title"
+    else:
+        namespace, title_order = "0", "m.wikipedia_title"
+
+    # Pages of a Wikidata id are stored in the order in which `WikiMapper` returns them, which
+    # is the order of the rows in the mapping table without the reverse mapping
+    if "reverse_mapping" in tables:
+        is_redirect = """EXISTS (SELECT 1 FROM reverse_mapping AS r
+            WHERE r.wikidata_id = m.wikidata_id AND r.namespace = m.namespace
+            AND r.is_redirect = 1 AND r.wikipedia_title = m.wikipedia_title)"""
+        order = "is_redirect, position"
+    else:
+        is_redirect = "0"
+        order = "source_rowid"
+
+    path_to_tmp = path_to_compressed + ".tmp"
+
+    try:
+        invalid = conn.execute(
+            """SELECT wikidata_id FROM mapping WHERE wikidata_id IS NOT NULL
+            AND NOT (wikidata_id GLOB 'Q[1-9]*' AND substr(wikidata_id, 2) NOT GLOB '*[^0-9]*'
+            AND CAST(substr(wikidata_id, 2) AS INTEGER) <= 4294967295) LIMIT 1"""
+        ).fetchone()
+        if invalid is not None:
+            raise ValueError("Can only store Wikidata ids like [Q42], got [{0}]".format(*invalid))
+
+        # The position of a page in the title order is its row id, the other orders refer to it
+        conn.execute(
+            """CREATE TEMP TABLE page (
+            position INTEGER PRIMARY KEY,
+            namespace int,
+            wikipedia_title text,
+            wikipedia_id int,
+            number int,
+            is_redirect int,
+            source_rowid int)"""
+        )
+        conn.execute(
+            """INSERT INTO temp.page
+            SELECT NULL, {0}, m.wikipedia_title, m.wikipedia_id,
+            IFNULL(CAST(substr(m.wikidata_id, 2) AS INTEGER), 0), {1}, m.rowid
+            FROM mapping AS m ORDER BY {2}""".format(
+                namespace, is_redirect, title_order
+            )
+        )
+
+        with open(path_to_tmp, "wb") as f:
+            f.write(_MAGIC)
+
+            titles = conn.execute(
+                """SELECT namespace, wikipedia_title, wikipedia_id, number FROM temp.page
+                ORDER BY position"""
+            )
+            pages = conn.execute(
+                "SELECT wikipedia_id, position - 1, number FROM temp.page ORDER BY wikipedia_id"
+            )
+            wikidata = conn.execute(
+                """SELECT number, namespace, position - 1 FROM temp.page
+                WHERE number > 0 ORDER BY number, namespace, {0}""".format(
+                    order
+                )
+            )
+
+            sections = [
+                _write_blocks(f, titles, block_size, level, _encode_titles),
+                _write_blocks(f, pages, block_size, level, _encode_pages),
+                _write_blocks(f, wikidata, block_size, level, _encode_wikidata),
+            ]
+
+            directory_offset = f.tell()
+            f.write(_encode_directory(block_size, sections))
+            f.write(_FOOTER.pack(directory_offset))
+            f.write(_MAGIC)
+    except BaseException:
+        try:
+            os.remove(path_to_tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    finally:
+        conn.close()
+
+    _replace_file(path_to_tmp, path_to_compressed)
+
+    return path_to_compressed
+
+
+class CompressedWikiMapper:
+    """Has the same lookup methods as `WikiMapper`, except for `page_props`, and returns the same
+    results for an index compressed by `compress_index` as `WikiMapper` does for the original.
+
+    Decompressed blocks are kept in a cache of `cache_size` blocks, so that repeated lookups of
+    popular keys do not decompress the same block over and over.
+    """
+
+    _INSTRUMENTED = tuple(name for name in WikiMapper._INSTRUMENTED if name != "page_props")
+
+    def __init__(
+        self, path_to_compressed: str, cache_size: int = 256, stats: Optional[LookupStats] = None,
+    ):
+        """
+        Args:
+            path_to_compressed (str): Path to the index created by `compress_index`.
+            cache_size (int): Maximum number of decompressed blocks that are kept.
+            stats (LookupStats): If given, then record calls, latencies and hit ratios of
+                all lookups in it.
+        """
+        if not is_compressed_index(path_to_compressed):
+            raise ValueError("[{0}] is not a compressed index".format(path_to_compressed))
+
+        # Only the blocks that are looked up are read from disk
+        with open(path_to_compressed, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        footer = len(self._data) - _FOOTER.size - len(_MAGIC)
+        (directory_offset,) = _FOOTER.unpack_from(self._data, footer)
+        directory = zlib.decompress(self._data[directory_offset:footer])
+
+        self._block_size = _HEADER.unpack_from(directory)[0]
+        pos = _HEADER.size
+
+        # Blocks are stored one after the other, section by section
+        self._offsets = []  # type: List[List[int]]
+        offset = len(_MAGIC)
+        for _ in range(3):
+            (lengths,), pos = _unpack("I", directory, pos)
+            self._offsets.append(list(accumulate((offset,) + lengths)))
+            offset = self._offsets[-1][-1]
+
+        (lengths,), pos = _unpack("H", directory, pos)
+        title_keys = []
+        for length in lengths:
+            title_keys.append(directory[pos : pos + length])
+            pos += length
+        (page_keys,), pos = _unpack("I", directory, pos)
+        (wikidata_keys,), pos = _unpack("I", directory, pos)
+        self._first_keys = [title_keys, page_keys, wikidata_keys]
+
+        self._decoders = [_decode_titles, _decode_pages, _decode_wikidata]
+        self._cache = OrderedDict()  # type: OrderedDict
+        self._cache_size = cache_size
+        self._cache_lock = threading.Lock()
+
+        self.stats = stats
+        if stats is not None:
+            for name in self._INSTRUMENTED:
+                setattr(self, name, _instrumented(getattr(self, name), stats))
+
+    def close(self):
+        """Closes the index file, the mapper can not be used afterwards."""
+        self._data.close()
+        self._cache.clear()
+
+    def _block(self, section: int, i: int) -> tuple:
+        """Returns the decoded block `i` of `section`, decompressing it if it is not cached."""
+        key = (section, i)
+        with self._cache_lock:
+            block = self._cache.get(key)
+            if block is not None:
+                self._cache.move_to_end(key)
+                return block
+
+        offsets = self._offsets[section]
+        block = self._decoders[section](zlib.decompress(self._data[offsets[i] : offsets[i + 1]]))
+
+        with self._cache_lock:
+            self._cache[key] = block
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return block
+
+    def _find_title(self, page_title: str, namespace: int) -> Tuple[Optional[tuple], int]:
+        """Returns the title block containing the page and the position of the page in it, or
+        `None` if the page is not in the index.
+        """
+        try:
+            key = _title_key(int(namespace), page_title)
+        except (AttributeError, TypeError, ValueError, struct.error):
+            return None, 0
+
+        i = bisect.bisect_right(self._first_keys[_TITLES], key) - 1
+        if i < 0:
+            return None, 0
+
+        block = self._block(_TITLES, i)
+        for j, candidate in _keys_from(block, bisect.bisect_right(block[0], key) - 1):
+            if candidate >= key:
+                return (block, j) if candidate == key else (None, 0)
+        return None, 0
+
+    def _find_page(self, wikipedia_id: int) -> Tuple[Optional[tuple], int]:
+        """Returns the page block containing the page and the position of the page in it, or
+        `None` if the page is not in the index.
+        """
+        wikipedia_id = _as_int(wikipedia_id)
+        if not isinstance(wikipedia_id, int):
+            return None, 0
+
+        i = bisect.bisect_right(self._first_keys[_PAGES], wikipedia_id) - 1
+        if i < 0:
+            return None, 0
+
+        block = self._block(_PAGES, i)
+        j = bisect.bisect_left(block[0], wikipedia_id)
+        if j < len(block[0]) and block[0][j] == wikipedia_id:
+            return block, j
+        return None, 0
+
+    def _title_at(self, position: int) -> Tuple[str, int]:
+        """Returns the title and page id of the page at `position` in the title order."""
+        block = self._block(_TITLES, position // self._block_size)
+        i = position % self._block_size
+
+        for j, key in _keys_from(block, i // _RESTART_INTERVAL):
+            if j == i:
+                return key[_NAMESPACE.size :].decode("utf-8"), block[1][i]
+
+    def _positions(self, wikidata_id: str, namespace: int) -> List[int]:
+        """Returns the title positions of all pages in `namespace` linked to `wikidata_id`."""
+        number = _as_wikidata_number(wikidata_id)
+        namespace = _as_int(namespace)
+        if number is None or not isinstance(namespace, int):
+            return []
+
+        # The pages of a Wikidata id can continue in the following blocks
+        first_keys = self._first_keys[_WIKIDATA]
+        i = max(bisect.bisect_left(first_keys, number) - 1, 0)
+
+        result = []
+        while i < len(first_keys) and first_keys[i] <= number:
+            numbers, namespaces, positions = self._block(_WIKIDATA, i)
+            start = bisect.bisect_left(numbers, number)
+            end = bisect.bisect_right(numbers, number, start)
+            result.extend(positions[j] for j in range(start, end) if namespaces[j] == namespace)
+            i += 1
+        return result
+
+    def title_to_id(self, page_title: str, namespace: int = 0) -> Optional[str]:
+        """See `WikiMapper.title_to_id`."""
+        block, i = self._find_title(page_title, namespace)
+        if block is None or block[2][i] == 0:
+            return None
+        return "Q{0}".format(block[2][i])
+
+    def url_to_id(self, wiki_url: str) -> Optional[str]:
+        """See `WikiMapper.url_to_id`."""
+        return type(self).title_to_id(self, wiki_url.rsplit("/", 1)[-1])
+
+    def id_to_titles(self, wikidata_id: str, namespace: int = 0) -> List[str]:
+        """See `WikiMapper.id_to_titles`."""
+        return [self._title_at(p)[0] for p in self._positions(wikidata_id, namespace)]
+
+    def wikipedia_id_to_id(self, wikipedia_id: int) -> Optional[str]:
+        """See `WikiMapper.wikipedia_id_to_id`."""
+        block, i = self._find_page(wikipedia_id)
+        if block is None or block[2][i] == 0:
+            return None
+        return "Q{0}".format(block[2][i])
+
+    def id_to_wikipedia_ids(self, wikidata_id: str, namespace: int = 0) -> List[int]:
+        """See `WikiMapper.id_to_wikipedia_ids`."""
+        return [self._title_at(p)[1] for p in self._positions(wikidata_id, namespace)]
+
+    def wikipedia_id_to_title(self, wikipedia_id: int) -> Optional[str]:
+        """See `WikiMapper.wikipedia_id_to_title`."""
+        block, i = self._find_page(wikipedia_id)
+        if block is None:
+            return None
+        return self._title_at(block[1][i])[0]
+
+    def title_to_wikipedia_id(self, page_title: str, namespace: int = 0) -> Optional[int]:
+        """See `WikiMapper.title_to_wikipedia_id`."""
+        block, i = self._find_title(page_title, namespace)
+        return block[1][i] if block is not None else None
+
+    # The batch methods call the unwrapped single key methods, so that statistics record each
+    # batch call once
+
+    def titles_to_ids(self, page_titles: List[str], namespace: int = 0) -> List[Optional[str]]:
+        """See `WikiMapper.titles_to_ids`."""
+        lookup = type(self).title_to_id
+        return [lookup(self, page_title, namespace) for page_title in page_titles]
+
+    def urls_to_ids(self, wiki_urls: List[str]) -> List[Optional[str]]:
+        """See `WikiMapper.urls_to_ids`."""
+        lookup = type(self).url_to_id
+        return [lookup(self, wiki_url) for wiki_url in wiki_urls]
+
+    def ids_to_titles(self, wikidata_ids: List[str], namespace: int = 0) -> List[List[str]]:
+        """See `WikiMapper.ids_to_titles`."""
+        lookup = type(self).id_to_titles
+        return [lookup(self, wikidata_id, namespace) for wikidata_id in wikidata_ids]
+
+    def wikipedia_ids_to_ids(self, wikipedia_ids: List[int]) -> List[Optional[str]]:
+        """See `WikiMapper.wikipedia_ids_to_ids`."""
+        lookup = type(self).wikipedia_id_to_id
+        return [lookup(self, wikipedia_id) for wikipedia_id in wikipedia_ids]
+
+    def ids_to_wikipedia_ids(self, wikidata_ids: List[str], namespace: int = 0) -> List[List[int]]:
+        """See `WikiMapper.ids_to_wikipedia_ids`."""
+        lookup = type(self).id_to_wikipedia_ids
+        return [lookup(self, wikidata_id, namespace) for wikidata_id in wikidata_ids]
+
+    def wikipedia_ids_to_titles(self, wikipedia_ids: List[int]) -> List[Optional[str]]:
+        """See `WikiMapper.wikipedia_ids_to_titles`."""
+        lookup = type(self).wikipedia_id_to_title
+        return [lookup(self, wikipedia_id) for wikipedia_id in wikipedia_ids]
+
+    def titles_to_wikipedia_ids(
+        self, page_titles: List[str], namespace: int = 0
+    ) -> List[Optional[int]]:
+        """See `WikiMapper.titles_to_wikipedia_ids`."""
+        lookup = type(self).title_to_wikipedia_id
+        return [lookup(self, page_title, namespace) for page_title in page_titles]
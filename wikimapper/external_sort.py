@@ -0,0 +1,166 @@
+""" Sorts more rows than fit into memory by spilling sorted runs to disk and merging them."""
+
+import heapq
+import logging
+import os
+import pickle
+import sys
+import tempfile
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, List
+
+_logger = logging.getLogger(__name__)
+
+# Rows are written to run files in batches, pickling every row on its own is much slower
+_BATCH_SIZE = 4096
+
+# Runs merged at once, more runs are first merged in several passes into fewer, longer runs
+_MAX_MERGE_RUNS = 64
+
+
+def _row_size(row: tuple) -> int:
+    """Estimates how much memory `row` occupies while it is buffered."""
+    return sys.getsizeof(row) + sum(sys.getsizeof(x) for x in row) + 8
+
+
+def _batches(rows: Iterable[tuple], size: int) -> Iterator[List[tuple]]:
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class ExternalSorter:
+    """Buffers rows in memory until `memory_budget` bytes are used, then writes them sorted to
+    a temporary run file. Iterating over the sorter merges all runs into one sorted stream.
+
+    Use it as a context manager so that the run files are removed afterwards.
+    """
+
+    def __init__(
+        self,
+        key: Callable[[Any], Any],
+        memory_budget: int,
+        tmp_dir: str = None,
+        max_merge_runs: int = _MAX_MERGE_RUNS,
+    ):
+        """
+        Args:
+            key: Function extracting the sort key from a row.
+            memory_budget (int): Approximate number of bytes that buffered rows may occupy.
+            tmp_dir (str): Folder for the run files. Defaults to the system default.
+            max_merge_runs (int): Maximum number of runs that are read at the same time when
+                merging. Every run being read holds one batch of rows in memory.
+        """
+        if max_merge_runs < 2:
+            raise ValueError("Have to merge at least [2] runs, got [{0}]".format(max_merge_runs))
+
+        self._key = key
+        self._memory_budget = memory_budget
+        self._tmp_dir = tmp_dir
+        self._max_merge_runs = max_merge_runs
+
+        self._buffer = []  # type: List[tuple]
+        self._buffer_size = 0
+        self._runs = []  # type: List[str]
+        self._buffer_sorted = False
+
+        # Number of rows per batch in the run files, so that a merge fits into the budget
+        self._batch_size = _BATCH_SIZE
+
+    def add(self, row: tuple):
+        self._buffer.append(row)
+        self._buffer_size += _row_size(row)
+        self._buffer_sorted = False
+
+        if self._buffer_size >= self._memory_budget:
+            self._spill()
+
+    def _spill(self):
+        self._buffer.sort(key=self._key)
+
+        # The merge holds one batch of each run in memory, which has to fit into the budget
+        row_size = self._buffer_size / len(self._buffer)
+        batch_size = int(self._memory_budget / (self._max_merge_runs * row_size))
+        self._batch_size = max(1, min(_BATCH_SIZE, batch_size))
+
+        self._runs.append(self._write_run(self._buffer))
+
+        self._buffer = []
+        self._buffer_size = 0
+
+    def _write_run(self, rows: Iterable[tuple]) -> str:
+        fd, path = tempfile.mkstemp(suffix=".run", dir=self._tmp_dir)
+        _logger.debug("Writing run [%s]", path)
+
+        with os.fdopen(fd, "wb") as f:
+            for batch in _batches(rows, self._batch_size):
+                pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+
+        return path
+
+    @staticmethod
+    def _read_run(path: str) -> Iterator[tuple]:
+        with open(path, "rb") as f:
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    return
+                yield from batch
+
+    def _merge(self, runs: List[str]) -> Iterator[tuple]:
+        return heapq.merge(*[self._read_run(path) for path in runs], key=self._key)
+
+    def _merge_pass(self):
+        """Merges every `max_merge_runs` consecutive runs into one. Runs stay in the order they
+        were written, so that rows with equal keys keep the order in which they were added.
+        """
+        runs = []
+        for i in range(0, len(self._runs), self._max_merge_runs):
+            group = self._runs[i : i + self._max_merge_runs]
+            if len(group) == 1:
+                runs.extend(group)
+                continue
+
+            runs.append(self._write_run(self._merge(group)))
+            for path in group:
+                os.remove(path)
+
+        _logger.debug("Merged [%d] runs into [%d]", len(self._runs), len(runs))
+        self._runs = runs
+
+    def __iter__(self) -> Iterator[tuple]:
+        """Yields all rows added so far sorted by key. The sorter can be iterated more than once."""
+        if not self._runs:
+            if not self._buffer_sorted:
+                self._buffer.sort(key=self._key)
+                self._buffer_sorted = True
+            return iter(self._buffer)
+
+        if self._buffer:
+            self._spill()
+
+        while len(self._runs) > self._max_merge_runs:
+            self._merge_pass()
+
+        return self._merge(self._runs)
+
+    def close(self):
+        for path in self._runs:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        self._runs = []
+        self._buffer = []
+        self._buffer_size = 0
+
+    def __enter__(self) -> "ExternalSorter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,17 @@
+""" Recognizes the formats that indices are stored in.
+
+This module has no dependencies, so that the command line can tell which reader an index needs
+without importing the readers of other formats.
+"""
+
+# First bytes of indices created by `compress_index`
+COMPRESSED_MAGIC = b"WMAPZ001"
+
+
+def is_compressed_index(path: str) -> bool:
+    """Checks whether `path` is an index created by `compress_index`."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(COMPRESSED_MAGIC)) == COMPRESSED_MAGIC
+    except OSError:
+        return False
@@ -1,15 +1,473 @@
+import bisect
+import functools
+import math
+import os
 import sqlite3
-from typing import List, Optional
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+
+class BloomFilter:
+    """A compact probabilistic set membership filter.
+
+    Lookups of keys that were added always return `True`. Lookups of keys that were not
+    added return `False` except for a small, configurable fraction of false positives.
+    This lets `WikiMapper` answer most misses without touching the database.
+    """
+
+    def __init__(self, num_bits: int, num_hashes: int, bits: Optional[bytes] = None):
+        # Imported here as loading the hash functions is slow and only needed with filters
+        from hashlib import blake2b
+
+        self._blake2b = blake2b
+
+        num_bytes = (num_bits + 7) // 8
+        self.num_bits = num_bytes * 8
+        self.num_hashes = num_hashes
+        self.bits = bytearray(bits) if bits is not None else bytearray(num_bytes)
+
+        if len(self.bits) != num_bytes:
+            raise ValueError("Expected [{0}] bytes, got [{1}]".format(num_bytes, len(self.bits)))
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float) -> "BloomFilter":
+        """Creates a filter sized to hold `capacity` keys with the given false positive rate.
+
+        Args:
+            capacity (int): The expected number of keys that will be added.
+            error_rate (float): The desired false positive rate, e.g. `0.01` for 1%.
+
+        Returns:
+            BloomFilter: An empty filter.
+        """
+        if not 0 < error_rate < 1:
+            raise ValueError("Error rate has to be in (0, 1), got [{0}]".format(error_rate))
+
+        capacity = max(capacity, 1)
+        num_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        return cls(num_bits, num_hashes)
+
+    def _positions(self, key: str):
+        # Double hashing (Kirsch and Mitzenmacher), both hashes are taken from one digest
+        digest = self._blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str):
+        bits = self.bits
+        for pos in self._positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        for pos in self._positions(key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class LookupStats:
+    """Collects call counts, latencies and hit ratios of `WikiMapper` lookups per method.
+
+    Pass an instance to `WikiMapper` to enable it. Every call is counted, but only a random
+    `sample_rate` fraction of calls is timed and recorded in the latency histograms, which
+    keeps the overhead negligible for high lookup rates. Statistics can be shared between
+    several mappers and threads.
+    """
+
+    # Upper bounds of the latency histogram buckets in seconds, the last bucket is unbounded
+    DEFAULT_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 1e-1)
+
+    def __init__(
+        self,
+        sample_rate: float = 1.0,
+        callback: Optional[Callable[[str, float, bool], Any]] = None,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        """
+        Args:
+            sample_rate (float): Fraction of calls that are timed, in (0, 1]. Defaults to all.
+            callback: Called as `callback(method, seconds, hit)` for every timed call, e.g.
+                to observe a Prometheus histogram or to send a StatsD timer.
+            buckets (Sequence[float]): Sorted upper bounds of the latency histogram buckets.
+        """
+        if not 0 < sample_rate <= 1:
+            raise ValueError("Sample rate has to be in (0, 1], got [{0}]".format(sample_rate))
+
+        # Imported here so that using the mapper without statistics does not pay for them
+        import random
+        import threading
+
+        self._random = random.random
+        self.sample_rate = sample_rate
+        self.callback = callback
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._methods = {}  # type: Dict[str, Dict[str, Any]]
+
+    def _method(self, method: str) -> Dict[str, Any]:
+        entry = self._methods.get(method)
+        if entry is None:
+            entry = {
+                "calls": 0,
+                "sampled": 0,
+                "hits": 0,
+                "time": 0.0,
+                "max": 0.0,
+                "histogram": [0] * (len(self.buckets) + 1),
+            }
+            self._methods[method] = entry
+        return entry
+
+    def should_sample(self, method: str) -> bool:
+        """Counts a call of `method` and returns whether it should be timed."""
+        with self._lock:
+            self._method(method)["calls"] += 1
+        return self.sample_rate >= 1 or self._random() < self.sample_rate
+
+    def record(self, method: str, seconds: float, hit: bool):
+        """Records a timed call of `method` that took `seconds` and did (not) find a result."""
+        with self._lock:
+            entry = self._method(method)
+            entry["sampled"] += 1
+            entry["hits"] += hit
+            entry["time"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            entry["histogram"][bisect.bisect_left(self.buckets, seconds)] += 1
+
+        if self.callback is not None:
+            self.callback(method, seconds, hit)
+
+    def _percentile(self, entry: Dict[str, Any], q: float) -> float:
+        # Upper bound of the bucket containing the percentile, the maximum for the last bucket
+        rank = q * entry["sampled"]
+        seen = 0
+        for bound, count in zip(self.buckets, entry["histogram"]):
+            seen += count
+            if seen >= rank:
+                return min(bound, entry["max"])
+        return entry["max"]
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Returns a consistent copy of the statistics of every method called so far.
+
+        For each method, this contains the number of `calls`, the number of timed calls
+        (`sampled`), their `hit_ratio`, cumulative `time`, `mean`, `p50`, `p99` and `max`
+        latency in seconds and the `histogram` counts per bucket of `buckets`.
+        """
+        with self._lock:
+            result = {}
+            for method, entry in self._methods.items():
+                sampled = entry["sampled"]
+                result[method] = {
+                    "calls": entry["calls"],
+                    "sampled": sampled,
+                    "hit_ratio": entry["hits"] / sampled if sampled else 0.0,
+                    "time": entry["time"],
+                    "mean": entry["time"] / sampled if sampled else 0.0,
+                    "p50": self._percentile(entry, 0.5),
+                    "p99": self._percentile(entry, 0.99),
+                    "max": entry["max"],
+                    "histogram": list(entry["histogram"]),
+                }
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._methods = {}
+
+    def summary(self) -> str:
+        """Formats the current statistics as a human readable table."""
+        header = "{0:<24}{1:>10}{2:>8}{3:>12}{4:>12}{5:>12}{6:>12}".format(
+            "method", "calls", "hits", "mean (us)", "p50 (us)", "p99 (us)", "max (us)"
+        )
+        lines = [header]
+        for method, e in sorted(self.snapshot().items()):
+            lines.append(
+                "{0:<24}{1:>10}{2:>8.1%}{3:>12.1f}{4:>12.1f}{5:>12.1f}{6:>12.1f}".format(
+                    method,
+                    e["calls"],
+                    e["hit_ratio"],
+                    e["mean"] * 1e6,
+                    e["p50"] * 1e6,
+                    e["p99"] * 1e6,
+                    e["max"] * 1e6,
+                )
+            )
+        return "\n".join(lines)
+
+
+def _is_hit(result) -> bool:
+    # Batch lookups count as a hit if any of their keys was found
+    if isinstance(result, list):
+        return any(_is_hit(r) for r in result)
+    return result is not None and result != {}
+
+
+def _instrumented(method: Callable, stats: LookupStats) -> Callable:
+    """Wraps the bound lookup `method` so that its calls are recorded in `stats`."""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if not stats.should_sample(name):
+            return method(*args, **kwargs)
+
+        start = time.perf_counter()
+        result = method(*args, **kwargs)
+        stats.record(name, time.perf_counter() - start, _is_hit(result))
+        return result
+
+    return wrapper
+
+
+def _as_int(wikipedia_id):
+    """Page ids are stored as integers, this normalizes e.g. `"123"` to `123`."""
+    try:
+        return int(wikipedia_id)
+    except (TypeError, ValueError):
+        return wikipedia_id
+
+
+def _title_key(namespace: int, page_title: str) -> str:
+    """Returns the key under which a page title is stored in the Bloom filter."""
+    return "{0}:{1}".format(namespace, page_title)
+
+
+# Maximum number of keys per query, older versions of SQLite allow at most 999 variables
+_MAX_VARIABLES = 500
 
 
 class WikiMapper:
     """Uses a precomputed database created by `create_wikipedia_wikidata_mapping_db`."""
 
-    def __init__(self, path_to_db: str):
+    # Public lookup methods that are recorded when statistics are enabled
+    _INSTRUMENTED = (
+        "title_to_id",
+        "url_to_id",
+        "id_to_titles",
+        "wikipedia_id_to_id",
+        "id_to_wikipedia_ids",
+        "wikipedia_id_to_title",
+        "title_to_wikipedia_id",
+        "page_props",
+        "titles_to_ids",
+        "urls_to_ids",
+        "ids_to_titles",
+        "wikipedia_ids_to_ids",
+        "ids_to_wikipedia_ids",
+        "wikipedia_ids_to_titles",
+        "titles_to_wikipedia_ids",
+    )
+
+    def __init__(
+        self,
+        path_to_db: str,
+        use_bloom_filter: bool = False,
+        stats: Optional[LookupStats] = None,
+        read_only: bool = False,
+    ):
+        """
+        Args:
+            path_to_db (str): Path to the index created by `create_index`.
+            use_bloom_filter (bool): If true and the index contains Bloom filters, then check them
+                before querying, so that lookups of unknown titles and ids skip the database.
+                This makes lookups that hit slower, so it only pays off if most lookups miss.
+            stats (LookupStats): If given, then record calls, latencies and hit ratios of
+                all lookups in it. Without it, lookups are not slowed down at all.
+            read_only (bool): If true, then open the database read-only, which fails if it
+                does not exist instead of creating an empty one.
+        """
         self._path_to_db = path_to_db
-        self.conn = sqlite3.connect(self._path_to_db)
+        self._use_bloom_filter = use_bloom_filter
+        self._read_only = read_only
+        self.stats = stats
+        self._open()
+
+        # Only instances with statistics get wrapped methods, so that the others pay nothing
+        if stats is not None:
+            for name in self._INSTRUMENTED:
+                setattr(self, name, _instrumented(getattr(self, name), stats))
+
+    def _open(self):
+        if self._read_only:
+            # Imported here as `urllib.request` alone takes longer to import than a lookup
+            from urllib.request import pathname2url
+
+            uri = "file:{0}?mode=ro".format(pathname2url(os.path.abspath(self._path_to_db)))
+            self.conn = sqlite3.connect(uri, uri=True)
+        else:
+            self.conn = sqlite3.connect(self._path_to_db)
+
+        c = self.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        tables = {name for (name,) in c}
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(mapping)")}
+
+        # Indices created before namespaces were supported only contain articles
+        self._has_namespaces = "namespace" in columns
+        self._has_page_props = "page_props" in tables
+        self._has_reverse_mapping = "reverse_mapping" in tables
 
-    def title_to_id(self, page_title: str) -> Optional[str]:
+        if self._use_bloom_filter and "bloom_filter" in tables:
+            self._bloom_filters = self._load_bloom_filters()
+        else:
+            self._bloom_filters = {}
+
+    def reload(self):
+        """Closes the database and opens the file at `path_to_db` again.
+
+        `create_index` replaces an existing index by atomically renaming the new one over it.
+        An open `WikiMapper` keeps reading the old file until `reload` is called.
+        """
+        old_conn = self.conn
+        self._open()
+        old_conn.close()
+
+    def close(self):
+        """Closes the underlying database connection."""
+        self.conn.close()
+
+    def _load_bloom_filters(self) -> Dict[str, BloomFilter]:
+        c = self.conn.execute("SELECT name, num_bits, num_hashes, bits FROM bloom_filter")
+        return {
+            name: BloomFilter(num_bits, num_hashes, bits) for name, num_bits, num_hashes, bits in c
+        }
+
+    def _may_contain_title(self, page_title: str, namespace: int) -> bool:
+        bloom_filter = self._bloom_filters.get("wikipedia_title")
+        return bloom_filter is None or _title_key(namespace, page_title) in bloom_filter
+
+    def _may_contain_wikipedia_id(self, wikipedia_id: int) -> bool:
+        bloom_filter = self._bloom_filters.get("wikipedia_id")
+        if bloom_filter is None:
+            return True
+
+        try:
+            key = str(int(wikipedia_id))
+        except (TypeError, ValueError):
+            # Let the database decide what to make of it
+            return True
+
+        return key in bloom_filter
+
+    def _select_by_title(self, column: str, page_title: str, namespace: int):
+        """Returns the first value of `column` for the page `page_title` in `namespace`."""
+        if not self._may_contain_title(page_title, namespace):
+            return None
+
+        if self._has_namespaces:
+            c = self.conn.execute(
+                "SELECT {0} FROM mapping WHERE namespace=? AND wikipedia_title=?".format(column),
+                (namespace, page_title),
+            )
+        elif namespace == 0:
+            c = self.conn.execute(
+                "SELECT {0} FROM mapping WHERE wikipedia_title=?".format(column), (page_title,)
+            )
+        else:
+            return None
+
+        result = c.fetchone()
+
+        if result is not None and result[0] is not None:
+            return result[0]
+        else:
+            return None
+
+    def _select_by_wikidata_id(self, column: str, wikidata_id: str, namespace: int) -> list:
+        """Returns all values of `column` for pages in `namespace` linked to `wikidata_id`."""
+        if self._has_reverse_mapping:
+            # Reads a single range of the primary key, which puts pages that are not redirects first
+            c = self.conn.execute(
+                "SELECT {0} FROM reverse_mapping WHERE wikidata_id=? AND namespace=? "
+                "ORDER BY is_redirect, wikipedia_title".format(column),
+                (wikidata_id, namespace),
+            )
+        elif self._has_namespaces:
+            c = self.conn.execute(
+                "SELECT {0} FROM mapping WHERE wikidata_id=? AND namespace=?".format(column),
+                (wikidata_id, namespace),
+            )
+        elif namespace == 0:
+            c = self.conn.execute(
+                "SELECT {0} FROM mapping WHERE wikidata_id=?".format(column), (wikidata_id,)
+            )
+        else:
+            return []
+
+        results = c.fetchall()
+
+        return [e[0] for e in results]
+
+    def _select_many(
+        self,
+        key_column: str,
+        value_column: str,
+        keys: list,
+        namespace: Optional[int] = None,
+        table: str = "mapping",
+        order: Optional[str] = None,
+    ) -> Dict[Any, list]:
+        """Returns all values of `value_column` grouped by `key_column` for rows of `table` whose
+        key is in `keys` and that are in `namespace`, if given. The values of a key are ordered
+        by `order`, if given. Keys are queried in chunks that stay below the maximum number of
+        variables SQLite allows in a statement.
+        """
+        condition = ""
+        params = []  # type: list
+        if namespace is not None:
+            if self._has_namespaces:
+                condition = " AND namespace=?"
+                params = [namespace]
+            elif namespace != 0:
+                return {}
+
+        if order is not None:
+            condition += " ORDER BY {0}".format(order)
+
+        result = {}  # type: Dict[Any, list]
+        for i in range(0, len(keys), _MAX_VARIABLES):
+            chunk = keys[i : i + _MAX_VARIABLES]
+            c = self.conn.execute(
+                "SELECT {0}, {1} FROM {2} WHERE {0} IN ({3}){4}".format(
+                    key_column, value_column, table, ",".join("?" * len(chunk)), condition
+                ),
+                chunk + params,
+            )
+            for row in c:
+                # A comma separated `value_column` selects several values, they become a tuple
+                result.setdefault(row[0], []).append(row[1] if len(row) == 2 else row[1:])
+
+        return result
+
+    def _select_many_by_title(self, column: str, page_titles: List[str], namespace: int) -> list:
+        candidates = [t for t in set(page_titles) if self._may_contain_title(t, namespace)]
+        found = self._select_many("wikipedia_title", column, candidates, namespace)
+        return [found.get(t, [None])[0] for t in page_titles]
+
+    def _select_many_by_wikipedia_id(self, column: str, wikipedia_ids: List[int]) -> list:
+        keys = [_as_int(i) for i in wikipedia_ids]
+        candidates = [k for k in set(keys) if self._may_contain_wikipedia_id(k)]
+        found = self._select_many("wikipedia_id", column, candidates)
+        return [found.get(k, [None])[0] for k in keys]
+
+    def _select_many_by_wikidata_id(
+        self, column: str, wikidata_ids: List[str], namespace: int
+    ) -> List[list]:
+        keys = list(set(wikidata_ids))
+        if self._has_reverse_mapping:
+            order = "wikidata_id, is_redirect, wikipedia_title"
+            found = self._select_many(
+                "wikidata_id", column, keys, namespace, "reverse_mapping", order
+            )
+        else:
+            found = self._select_many("wikidata_id", column, keys, namespace)
+        return [list(found.get(k, [])) for k in wikidata_ids]
+
+    def title_to_id(self, page_title: str, namespace: int = 0) -> Optional[str]:
         """Given a Wikipedia page title, returns the corresponding Wikidata ID.
 
         The page title is the last part of a Wikipedia url **unescaped** and spaces
@@ -18,6 +476,8 @@ class WikiMapper:
 
         Args:
             page_title: The page title of the Wikipedia entry, e.g. `Manatee`.
+            namespace: The namespace of the page, e.g. `14` for categories. The title does
+                       not contain the namespace prefix. Defaults to `0` (articles).
 
         Returns:
             Optional[str]: If a mapping could be found for `wiki_page_title`, then return
@@ -25,13 +485,7 @@ class WikiMapper:
 
         """
 
-        c = self.conn.execute("SELECT wikidata_id FROM mapping WHERE wikipedia_title=?", (page_title,))
-        result = c.fetchone()
-
-        if result is not None and result[0] is not None:
-            return result[0]
-        else:
-            return None
+        return self._select_by_title("wikidata_id", page_title, namespace)
 
     def url_to_id(self, wiki_url: str) -> Optional[str]:
         """Given an URL to a Wikipedia page, returns the corresponding Wikidata ID.
@@ -48,28 +502,26 @@ class WikiMapper:
 
         """
 
+        # The unwrapped method, so that statistics record this call only once
         title = wiki_url.rsplit("/", 1)[-1]
-        return self.title_to_id(title)
+        return type(self).title_to_id(self, title)
 
-    def id_to_titles(self, wikidata_id: str) -> List[str]:
+    def id_to_titles(self, wikidata_id: str, namespace: int = 0) -> List[str]:
         """Given a Wikidata ID, return a list of corresponding pages that are linked to it.
 
         Due to redirects, the mapping from Wikidata ID to Wikipedia title is not unique.
 
         Args:
             wikidata_id (str): The Wikidata ID to map, e.g. `Q42797`.
+            namespace (int): The namespace of the pages to return. Defaults to `0` (articles).
 
         Returns:
             List[str]: A list of Wikipedia pages that are linked to this Wikidata ID.
 
         """
 
-        c = self.conn.execute(
-            "SELECT DISTINCT wikipedia_title FROM mapping WHERE wikidata_id =?", (wikidata_id,)
-        )
-        results = c.fetchall()
-
-        return [e[0] for e in results]
+        # no need for `DISTINCT` as titles are unique per namespace
+        return self._select_by_wikidata_id("wikipedia_title", wikidata_id, namespace)
 
     def wikipedia_id_to_id(self, wikipedia_id: int) -> Optional[str]:
         """Given a Wikipedia ID (in other words Page ID), returns the corresponding Wikidata ID.
@@ -85,6 +537,9 @@ class WikiMapper:
                            it, else return `None`.
         """
 
+        if not self._may_contain_wikipedia_id(wikipedia_id):
+            return None
+
         c = self.conn.execute(
             "SELECT wikidata_id FROM mapping WHERE wikipedia_id=?", (wikipedia_id,)
         )
@@ -95,25 +550,21 @@ class WikiMapper:
         else:
             return None
 
-    def id_to_wikipedia_ids(self, wikidata_id: str) -> List[int]:
+    def id_to_wikipedia_ids(self, wikidata_id: str, namespace: int = 0) -> List[int]:
         """Given a Wikidata ID, returns the corresponding list of Wikipedia IDs (or Page IDs).
 
         Due to redirects, there can be multiple Wikipedia IDs for the same Wikidata item.
 
         Args:
             wikidata_id (str): The Wikidata ID to map, e.g. `Q7553`
+            namespace (int): The namespace of the pages to return. Defaults to `0` (articles).
 
         Returns:
             List[int]: A list of Wikipedia IDs linked to the given Wikidata ID.
         """
 
         # no need for `DISTINCT` as `wikipedia_id` is a PRIMARY KEY, thus we have no duplicates there
-        c = self.conn.execute(
-            "SELECT wikipedia_id FROM mapping WHERE wikidata_id=?", (wikidata_id,)
-        )
-        results = c.fetchall()
-
-        return [e[0] for e in results]
+        return self._select_by_wikidata_id("wikipedia_id", wikidata_id, namespace)
 
     def wikipedia_id_to_title(self, wikipedia_id: int) -> Optional[str]:
         """Given a Wikipedia ID (in other words Page ID), returns the corresponding page title.
@@ -126,6 +577,9 @@ class WikiMapper:
                            it, else return `None`.
         """
 
+        if not self._may_contain_wikipedia_id(wikipedia_id):
+            return None
+
         c = self.conn.execute(
             "SELECT wikipedia_title FROM mapping WHERE wikipedia_id=?", (wikipedia_id,)
         )
@@ -136,24 +590,137 @@ class WikiMapper:
         else:
             return None
 
-    def title_to_wikipedia_id(self, page_title: str) -> Optional[int]:
+    def title_to_wikipedia_id(self, page_title: str, namespace: int = 0) -> Optional[int]:
         """Given a Wikipedia page title, returns the corresponding Wikipedia id.
 
         Args:
             page_title (str): The Wikipedia page title to map, e.g. `Germany`
+            namespace (int): The namespace of the page. Defaults to `0` (articles).
 
         Returns:
             Optional[str]: If a mapping found for `page_title`, then return
                            it, else return `None`.
         """
 
-        # no need for `DISTINCT` as `wikipedia_id` is a PRIMARY KEY, thus we have no duplicates there
+        return self._select_by_title("wikipedia_id", page_title, namespace)
+
+    def page_props(self, wikipedia_id: int) -> Dict[str, str]:
+        """Given a Wikipedia ID (in other words Page ID), returns the stored page properties.
+
+        Only properties that were selected when creating the index are available, e.g.
+        `wikibase-shortdesc`. Markers like `disambiguation` are returned with an empty value.
+
+        Args:
+            wikipedia_id (int): The Wikipedia ID to look up, e.g. `11867`
+
+        Returns:
+            Dict[str, str]: A mapping from property name to value, empty if there are none.
+        """
+
+        if not self._has_page_props or not self._may_contain_wikipedia_id(wikipedia_id):
+            return {}
+
         c = self.conn.execute(
-            "SELECT wikipedia_id FROM mapping WHERE wikipedia_title=?", (page_title,)
+            """SELECT page_property.name, page_props.value FROM page_props
+            JOIN page_property ON page_props.property = page_property.property
+            WHERE page_props.wikipedia_id=?""",
+            (wikipedia_id,),
         )
-        result = c.fetchone()
 
-        if result is not None and result[0] is not None:
-            return result[0]
-        else:
-            return None
+        return dict(c.fetchall())
+
+    def titles_to_ids(self, page_titles: List[str], namespace: int = 0) -> List[Optional[str]]:
+        """Batch version of `title_to_id`, which queries the database once for many titles.
+
+        Args:
+            page_titles (List[str]): The page titles to map.
+            namespace (int): The namespace of the pages. Defaults to `0` (articles).
+
+        Returns:
+            List[Optional[str]]: The Wikidata ID for every title in the same order, `None` if
+                                 no mapping could be found.
+        """
+
+        return self._select_many_by_title("wikidata_id", page_titles, namespace)
+
+    def urls_to_ids(self, wiki_urls: List[str]) -> List[Optional[str]]:
+        """Batch version of `url_to_id`.
+
+        Args:
+            wiki_urls (List[str]): The URLs to Wikipedia entries.
+
+        Returns:
+            List[Optional[str]]: The Wikidata ID for every URL in the same order, `None` if
+                                 no mapping could be found.
+        """
+
+        titles = [url.rsplit("/", 1)[-1] for url in wiki_urls]
+        return type(self).titles_to_ids(self, titles)
+
+    def ids_to_titles(self, wikidata_ids: List[str], namespace: int = 0) -> List[List[str]]:
+        """Batch version of `id_to_titles`.
+
+        Args:
+            wikidata_ids (List[str]): The Wikidata IDs to map.
+            namespace (int): The namespace of the pages to return. Defaults to `0` (articles).
+
+        Returns:
+            List[List[str]]: The linked Wikipedia pages for every Wikidata ID in the same order.
+        """
+
+        return self._select_many_by_wikidata_id("wikipedia_title", wikidata_ids, namespace)
+
+    def wikipedia_ids_to_ids(self, wikipedia_ids: List[int]) -> List[Optional[str]]:
+        """Batch version of `wikipedia_id_to_id`.
+
+        Args:
+            wikipedia_ids (List[int]): The Wikipedia IDs to map.
+
+        Returns:
+            List[Optional[str]]: The Wikidata ID for every Wikipedia ID in the same order,
+                                 `None` if no mapping could be found.
+        """
+
+        return self._select_many_by_wikipedia_id("wikidata_id", wikipedia_ids)
+
+    def ids_to_wikipedia_ids(self, wikidata_ids: List[str], namespace: int = 0) -> List[List[int]]:
+        """Batch version of `id_to_wikipedia_ids`.
+
+        Args:
+            wikidata_ids (List[str]): The Wikidata IDs to map.
+            namespace (int): The namespace of the pages to return. Defaults to `0` (articles).
+
+        Returns:
+            List[List[int]]: The linked Wikipedia IDs for every Wikidata ID in the same order.
+        """
+
+        return self._select_many_by_wikidata_id("wikipedia_id", wikidata_ids, namespace)
+
+    def wikipedia_ids_to_titles(self, wikipedia_ids: List[int]) -> List[Optional[str]]:
+        """Batch version of `wikipedia_id_to_title`.
+
+        Args:
+            wikipedia_ids (List[int]): The Wikipedia IDs to map.
+
+        Returns:
+            List[Optional[str]]: The page title for every Wikipedia ID in the same order,
+                                 `None` if no mapping could be found.
+        """
+
+        return self._select_many_by_wikipedia_id("wikipedia_title", wikipedia_ids)
+
+    def titles_to_wikipedia_ids(
+        self, page_titles: List[str], namespace: int = 0
+    ) -> List[Optional[int]]:
+        """Batch version of `title_to_wikipedia_id`.
+
+        Args:
+            page_titles (List[str]): The page titles to map.
+            namespace (int): The namespace of the pages. Defaults to `0` (articles).
+
+        Returns:
+            List[Optional[int]]: The Wikipedia ID for every title in the same order, `None` if
+                                 no mapping could be found.
+        """
+
+        return self._select_many_by_title("wikipedia_id", page_titles, namespace)
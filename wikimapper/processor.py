@@ -2,229 +2,1082 @@
     Credit: Uses parts of https://github.com/jamesmishra/mysqldump-to-csv
 """
 
+import codecs
 import csv
 import ctypes as ct
 import gzip
 import logging
 import os
+import re
 import sqlite3
+import sys
+import time
+from collections import deque
+from contextlib import ExitStack
+from functools import partial
+from itertools import islice
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from wikimapper.external_sort import ExternalSorter
+from wikimapper.mapper import BloomFilter, _title_key
 
 _logger = logging.getLogger(__name__)
 
+# Size of the page cache of SQLite while building the index in the default mode
+_BULK_LOAD_CACHE_SIZE = 1024 * 1024 * 1024
+
+# Number of rows after which a build commits and records its progress
+_COMMIT_INTERVAL = 100000
+
+# Windows does not replace a file that is open, so replacing an index is attempted this many
+# times, this many seconds apart, to give its readers time to close it
+_REPLACE_ATTEMPTS = 10 if sys.platform == "win32" else 1
+_REPLACE_DELAY = 0.5
+
+# Redirects to redirects are followed for at most this many redirects in a row, which also
+# ends cycles of redirects
+_MAX_REDIRECT_HOPS = 8
+
+
+# Size of the chunks in which dumps are decompressed and parsed. Only the current chunk and the
+# row it ends in are held in memory, rather than whole INSERT statements, which span a single
+# line each and can be hundreds of MB long.
+_BUFFER_SIZE = 1024 * 1024
+
+_INSERT = "INSERT INTO "
+_VALUES = " VALUES "
+
+# A quoted MySQL string; the unrolled loop keeps matching linear even on incomplete input
+_QUOTED = r"'[^'\\]*(?:\\.[^'\\]*)*'"
+
+# A complete row and the `,` or `;` after it
+_ROW = re.compile(r"\(((?:" + _QUOTED + r"|[^()'])*)\)[,;]", re.DOTALL)
 
-def _is_insert(line):
+# The fields of a row, quoted strings or unquoted numbers and NULL
+_FIELDS = re.compile(r"(?:^|,)(?:" + _QUOTED + r"|[^,']*)", re.DOTALL)
+
+
+class _Statement:
+    """The rows of an INSERT statement, which are parsed while they are iterated. Once they
+    all have been, `end` is the uncompressed byte offset right after the statement.
     """
-    Returns true if the line begins a SQL insert statement.
+
+    def __init__(self):
+        self.rows = iter(())
+        self.end = None
+
+    def __iter__(self):
+        return self.rows
+
+
+class _DumpReader:
+    """Parses the INSERT statements of a SQL dump in chunks of `_BUFFER_SIZE` bytes."""
+
+    def __init__(self, f, errors: str, offset: int):
+        self._f = f
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors)
+        self._text = ""
+        self._pos = 0
+        self._offset = offset
+        # Offsets in the dump right after the newlines in the buffer. Newlines decode to one
+        # character each, so they tell where statements end in the dump.
+        self._line_ends = deque()
+
+    def _fill(self) -> bool:
+        """Drops the parsed part of the buffer and appends the next chunk of the dump to it.
+        Returns false at the end of the dump.
+        """
+        chunk = self._f.read(_BUFFER_SIZE)
+        newline = chunk.find(b"\n")
+        while newline >= 0:
+            self._line_ends.append(self._offset + newline + 1)
+            newline = chunk.find(b"\n", newline + 1)
+        self._offset += len(chunk)
+
+        self._text = self._text[self._pos :] + self._decoder.decode(chunk, final=not chunk)
+        self._pos = 0
+        return bool(chunk)
+
+    def _skip_line(self) -> Optional[int]:
+        """Skips to the start of the next line and returns its offset in the dump, or `None` at
+        the end of the dump.
+        """
+        while True:
+            newline = self._text.find("\n", self._pos)
+            if newline >= 0:
+                self._pos = newline + 1
+                return self._line_ends.popleft()
+            self._pos = len(self._text)
+            if not self._fill():
+                return None
+
+    def _error(self, message: str) -> ValueError:
+        return ValueError("{0} before byte [{1}] of the dump".format(message, self._offset))
+
+    def _num_fields(self) -> int:
+        """Returns the number of fields of the first row of the statement."""
+        while True:
+            match = _ROW.match(self._text, self._pos)
+            if match is not None:
+                return len(_FIELDS.findall(match.group(1)))
+            # Rows never contain a raw newline, mysqldump escapes them
+            if self._text.find("\n", self._pos) >= 0:
+                raise self._error("Malformed row")
+            if not self._fill():
+                raise self._error("Truncated INSERT statement")
+
+    def _pieces(self, statement: _Statement):
+        """Yields the values of the statement in pieces. All but the last end with the `,`
+        after a `)`, which is either the end of a row or inside a quoted string.
+        """
+        while True:
+            newline = self._text.find("\n", self._pos)
+            if newline >= 0:
+                piece = self._text[self._pos : newline]
+                self._pos = newline
+                statement.end = self._skip_line()
+                yield piece
+                return
+
+            cut = self._text.rfind("),(", self._pos)
+            if cut >= 0:
+                piece = self._text[self._pos : cut + 2]
+                self._pos = cut + 2
+                yield piece
+
+            if not self._fill():
+                # The last statement may end the dump without a newline
+                if not self._text.endswith(");"):
+                    raise self._error("Truncated INSERT statement")
+                piece = self._text[self._pos :]
+                self._pos = len(self._text)
+                statement.end = self._offset
+                yield piece
+                return
+
+    def _rows(self, statement: _Statement):
+        num_fields = self._num_fields()
+
+        # The reader ends a record at the end of a piece unless it is inside a quoted string,
+        # so records hold complete rows.
+        reader = csv.reader(
+            self._pieces(statement),
+            delimiter=",",
+            doublequote=False,
+            escapechar="\\",
+            quotechar="'",
+            strict=True,
+        )
+        for record in reader:
+            # After the `,` that ends a piece comes an empty field
+            if not record[-1]:
+                del record[-1]
+            else:
+                # The `;` that ends the statement
+                record[-1] = record[-1][:-1]
+
+            first = record[::num_fields]
+            if len(record) % num_fields or any(v[:1] != "(" for v in first):
+                raise self._error("Malformed row")
+
+            # Strip the parentheses around the rows
+            record[::num_fields] = [v[1:] for v in first]
+            record[num_fields - 1 :: num_fields] = [
+                v[:-1] for v in record[num_fields - 1 :: num_fields]
+            ]
+            record = [chr(0) if not v or v == "NULL" else v for v in record]
+            for i in range(0, len(record), num_fields):
+                yield record[i : i + num_fields]
+
+    def statements(self):
+        while True:
+            while len(self._text) - self._pos < len(_INSERT):
+                if not self._fill():
+                    return
+
+            if not self._text.startswith(_INSERT, self._pos):
+                if self._skip_line() is None:
+                    return
+                continue
+
+            values = self._text.find(_VALUES, self._pos)
+            while values < 0:
+                if self._text.find("\n", self._pos) >= 0 or not self._fill():
+                    raise self._error("Malformed INSERT statement")
+                values = self._text.find(_VALUES, self._pos)
+            self._pos = values + len(_VALUES)
+
+            statement = _Statement()
+            statement.rows = self._rows(statement)
+            yield statement
+            # Skip the rows that the caller has not consumed
+            for _ in statement.rows:
+                pass
+
+
+def _iter_statements(path_to_dump: str, errors: str = "strict", offset: int = 0):
+    """Yields a `_Statement` for every INSERT statement in the gzipped SQL dump `path_to_dump`.
+    Passing the `end` of a statement as `offset` continues reading with the next statement.
+    """
+    # Values in page_props can be larger than the default limit of the csv module
+    # https://stackoverflow.com/a/54517228
+    csv.field_size_limit(int(ct.c_ulong(-1).value // 2))
+
+    with gzip.open(path_to_dump, "rb") as f:
+        # Gzip streams cannot be entered in the middle, seeking decompresses up to `offset`
+        f.seek(offset)
+        yield from _DumpReader(f, errors, offset).statements()
+
+
+def _iter_rows(path_to_dump: str, errors: str = "strict"):
+    """Yields the rows of all INSERT statements in the gzipped SQL dump `path_to_dump`."""
+    for statement in _iter_statements(path_to_dump, errors):
+        yield from statement
+
+
+def _create_bloom_filters(conn: sqlite3.Connection, error_rate: float):
+    """Stores Bloom filters over all page titles and page ids of the `mapping` table in the index.
+    `WikiMapper` checks them before querying so that lookups which miss can skip the database.
     """
-    return line.startswith("INSERT INTO")
+    _logger.info("Creating Bloom filters with error rate [%s]", error_rate)
+    (count,) = conn.execute("SELECT COUNT(*) FROM mapping").fetchone()
+
+    titles = BloomFilter.for_capacity(count, error_rate)
+    wikipedia_ids = BloomFilter.for_capacity(count, error_rate)
+
+    for wikipedia_id, namespace, wikipedia_title in conn.execute(
+        "SELECT wikipedia_id, namespace, wikipedia_title FROM mapping"
+    ):
+        titles.add(_title_key(namespace, wikipedia_title))
+        wikipedia_ids.add(str(wikipedia_id))
+
+    with conn:
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS bloom_filter (
+            name text PRIMARY KEY,
+            num_bits int,
+            num_hashes int,
+            bits blob)"""
+        )
+        conn.executemany(
+            """INSERT OR REPLACE INTO bloom_filter (name, num_bits, num_hashes, bits)
+            VALUES (?, ?, ?, ?)""",
+            [
+                (name, f.num_bits, f.num_hashes, bytes(f.bits))
+                for name, f in [("wikipedia_title", titles), ("wikipedia_id", wikipedia_ids)]
+            ],
+        )
+
+
+def _create_tables(conn: sqlite3.Connection, page_props: List[str]):
+    with conn:
+        conn.execute(
+            """CREATE TABLE mapping (
+            wikipedia_id int PRIMARY KEY ,
+            wikipedia_title text,
+            wikidata_id text,
+            namespace int)"""
+        )
+        # Page properties are stored narrow: one row per page and property, with the property
+        # name interned into a small integer instead of one wide text column per property.
+        conn.execute(
+            """CREATE TABLE page_property (
+            property int PRIMARY KEY,
+            name text UNIQUE)"""
+        )
+        conn.execute(
+            """CREATE TABLE page_props (
+            wikipedia_id int,
+            property int,
+            value text,
+            PRIMARY KEY (wikipedia_id, property)) WITHOUT ROWID"""
+        )
+        conn.executemany(
+            "INSERT INTO page_property (property, name) VALUES (?, ?)", enumerate(page_props)
+        )
+
+
+def _create_title_index(conn: sqlite3.Connection):
+    _logger.info("Creating database index on 'namespace, wikipedia_title'")
+    conn.execute(
+        """CREATE UNIQUE INDEX IF NOT EXISTS idx_wikipedia_title
+        ON mapping(namespace, wikipedia_title);"""
+    )
+
+
+def _create_wikidata_index(conn: sqlite3.Connection):
+    _logger.info("Creating database index on 'wikidata_id'")
+    conn.execute("""CREATE INDEX IF NOT EXISTS idx_wikidata_id ON mapping(wikidata_id);""")
 
 
-def _get_values(line):
+def _create_reverse_mapping_table(conn: sqlite3.Connection):
+    conn.execute(
+        """CREATE TABLE reverse_mapping (
+        wikidata_id text,
+        namespace int,
+        is_redirect int,
+        wikipedia_title text,
+        wikipedia_id int,
+        PRIMARY KEY (wikidata_id, namespace, is_redirect, wikipedia_title)) WITHOUT ROWID"""
+    )
+
+
+def _create_redirect_source_table(conn: sqlite3.Connection):
+    conn.execute(
+        """CREATE TEMP TABLE IF NOT EXISTS redirect_source (
+        wikipedia_id int PRIMARY KEY) WITHOUT ROWID"""
+    )
+
+
+def _add_redirect_sources(conn: sqlite3.Connection, wikipedia_ids: Iterable[tuple]):
+    conn.executemany(
+        "INSERT OR IGNORE INTO redirect_source (wikipedia_id) VALUES (?)", wikipedia_ids
+    )
+
+
+def _create_reverse_mapping(conn: sqlite3.Connection, redirects_dump: str):
+    """Materializes the `reverse_mapping` table, see `_fill_reverse_mapping`. A page is a
+    redirect if it is the source of a redirect in `redirects_dump`.
     """
-    Returns the portion of an INSERT statement containing values
+    _logger.info("Creating reverse mapping")
+
+    _create_redirect_source_table(conn)
+    _add_redirect_sources(conn, ((int(v[0]),) for v in _iter_rows(redirects_dump, errors="ignore")))
+    _fill_reverse_mapping(conn)
+
+
+def _fill_reverse_mapping(conn: sqlite3.Connection):
+    """Materializes the `reverse_mapping` table, which clusters all pages by Wikidata id so that
+    looking up the pages of a Wikidata id reads a single range instead of probing an index and
+    then fetching every row. Within a Wikidata id and namespace, pages that are not redirects
+    come first. A page is a redirect if it is in the temporary table `redirect_source`, which
+    is dropped afterwards.
     """
-    return line[line.find("` VALUES ") + 9 :]
+    # Remove what an interrupted previous attempt created already
+    conn.execute("DROP TABLE IF EXISTS reverse_mapping")
+    _create_reverse_mapping_table(conn)
+
+    conn.execute(
+        """INSERT INTO reverse_mapping
+        (wikidata_id, namespace, is_redirect, wikipedia_title, wikipedia_id)
+        SELECT wikidata_id, namespace, wikipedia_id IN redirect_source,
+        wikipedia_title, wikipedia_id
+        FROM mapping WHERE wikidata_id IS NOT NULL
+        ORDER BY 1, 2, 3, 4"""
+    )
+    conn.execute("DROP TABLE redirect_source")
 
 
-def _values_sanity_check(values):
+def _create_redirect_target_table(conn: sqlite3.Connection):
+    """Creates the table that holds the page id and Wikidata id of the target of every indexed
+    redirect to an indexed page, until `_apply_redirects` passes the Wikidata ids on.
     """
-    Ensures that values from the INSERT statement meet basic checks.
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS redirect_target (
+        wikipedia_id int PRIMARY KEY,
+        target_id int,
+        wikidata_id text) WITHOUT ROWID"""
+    )
+
+
+def _redirect_wikidata_ids(
+    conn: sqlite3.Connection, wikipedia_ids: Iterable[int]
+) -> List[Tuple[int, Optional[str], Optional[str]]]:
+    """Returns `(wikipedia_id, wikidata_id, first_hop)` of the pages `wikipedia_ids`, see
+    `_follow_redirects`. Pages that are not indexed are left out.
     """
-    assert values
-    assert values[0] == "("
-    # Assertions have not been raised
-    return True
+    c = conn.cursor()
+    rows = []
+    for wikipedia_id in wikipedia_ids:
+        c.execute(
+            """SELECT m.wikipedia_id, m.wikidata_id, COALESCE(r.wikidata_id, m.wikidata_id)
+            FROM mapping AS m LEFT JOIN redirect_target AS r ON r.wikipedia_id = m.wikipedia_id
+            WHERE m.wikipedia_id = ?""",
+            (wikipedia_id,),
+        )
+        rows.extend(c.fetchall())
+    c.close()
+    return rows
 
 
-def _parse_values(values):
+def _follow_redirects(
+    chains: Dict[int, int], pages: Iterable[Tuple[int, Optional[str], Optional[str]]]
+) -> Dict[int, Optional[str]]:
+    """Returns the Wikidata ids of redirects to redirects. A redirect gets the Wikidata id that
+    its target ends up with, and keeps its own if the target ends up without one. So a chain
+    of redirects gets the Wikidata id of the last page in it that has one of its own, looking
+    at no more than `_MAX_REDIRECT_HOPS` redirects in a row.
+
+    Every builder resolves single redirects in bulk, so this only has to deal with the chains,
+    which are rare as Wikipedia bots fix them quickly.
+
+    Args:
+        chains: Maps redirects to their targets that are redirects themselves.
+        pages: `(wikipedia_id, wikidata_id, first_hop)` of the pages in `chains`, their own
+            Wikidata id and the one they get from their target's own Wikidata id alone.
+            Redirects that are not indexed are left out.
     """
-    Given a file handle and the raw values from a MySQL INSERT
-    statement, write the equivalent CSV to the file
+    wikidata_ids = {}  # type: Dict[int, Optional[str]]
+    resolved = {}  # type: Dict[int, Optional[str]]
+    for wikipedia_id, wikidata_id, first_hop in pages:
+        wikidata_ids[wikipedia_id] = wikidata_id
+        resolved[wikipedia_id] = first_hop
+
+    chains = {source: target for source, target in chains.items() if source in resolved}
+    for _ in range(_MAX_REDIRECT_HOPS - 1):
+        hop = {
+            source: wikidata_ids[source] if resolved[target] is None else resolved[target]
+            for source, target in chains.items()
+        }
+        if all(resolved[source] == wikidata_id for source, wikidata_id in hop.items()):
+            break
+        resolved.update(hop)
+
+    return {source: resolved[source] for source in chains}
+
+
+def _apply_redirects(conn: sqlite3.Connection, resolved: Iterable[Tuple[int, Optional[str]]]):
+    """Gives every redirect in `redirect_target` the Wikidata id of its target, if the target
+    has one, or the one in `resolved` for redirects to redirects. Drops `redirect_target`.
     """
-    latest_row = []
+    conn.execute(
+        """CREATE TEMP TABLE redirected (
+        wikipedia_id int PRIMARY KEY,
+        wikidata_id text) WITHOUT ROWID"""
+    )
+    conn.executemany(
+        "INSERT INTO redirected (wikipedia_id, wikidata_id) VALUES (?, ?)",
+        (row for row in resolved if row[1] is not None),
+    )
+    conn.execute(
+        """INSERT OR IGNORE INTO redirected (wikipedia_id, wikidata_id)
+        SELECT wikipedia_id, wikidata_id FROM redirect_target WHERE wikidata_id IS NOT NULL"""
+    )
 
-    reader = csv.reader(
-        [values], delimiter=",", doublequote=False, escapechar="\\", quotechar="'", strict=True
+    # The Wikidata ids are all looked up before the first is updated, so that no redirect
+    # sees what another one got
+    conn.execute(
+        """UPDATE mapping SET wikidata_id = (
+            SELECT r.wikidata_id FROM redirected AS r WHERE r.wikipedia_id = mapping.wikipedia_id
+        ) WHERE wikipedia_id IN (SELECT wikipedia_id FROM redirected)"""
     )
+    conn.execute("DROP TABLE redirected")
+    conn.execute("DROP TABLE redirect_target")
 
-    for reader_row in reader:
-        for column in reader_row:
-            # If our current string is empty...
-            if len(column) == 0 or column == "NULL":
-                latest_row.append(chr(0))
-                continue
-            # If our string starts with an open paren
-            if column[0] == "(":
-                # Assume that this column does not begin
-                # a new row.
-                new_row = False
-                # If we've been filling out a row
-                if len(latest_row) > 0:
-                    # Check if the previous entry ended in
-                    # a close paren. If so, the row we've
-                    # been filling out has been COMPLETED
-                    # as:
-                    #    1) the previous entry ended in a )
-                    #    2) the current entry starts with a (
-                    if latest_row[-1][-1] == ")":
-                        # Remove the close paren.
-                        latest_row[-1] = latest_row[-1][:-1]
-                        new_row = True
-                # If we've found a new row, write it out
-                # and begin our new one
-                if new_row:
-                    yield latest_row
-                    latest_row = []
-                # If we're beginning a new row, eliminate the
-                # opening parentheses.
-                if len(latest_row) == 0:
-                    column = column[1:]
-            # Add our column to the row we're working on.
-            latest_row.append(column)
-        # At the end of an INSERT statement, we'll
-        # have the semicolon.
-        # Make sure to remove the semicolon and
-        # the close paren.
-        if latest_row[-1][-2:] == ");":
-            latest_row[-1] = latest_row[-1][:-2]
-            yield latest_row
-
-
-def create_index(dumpname: str, path_to_dumps: str, path_to_db: str = None) -> str:
-    """Creates an index mapping Wikipedia page titles to Wikidata IDs and vice versa.
-    This requires a previously downloaded dump `dumpname` in `path_to_dumps`.
 
-    Args:
-        dumpname(str): Name of the Wikipedia SQL  dump that should be used for creating an index.
-        path_to_dumps(str): Folder in which the dump has been downloaded to.
-        path_to_db(str): Path where the index will be saved to. Defaults to `index_${dump_name}.db`.
+def _resolve_redirects(conn: sqlite3.Connection):
+    """Passes the Wikidata ids of the targets in `redirect_target` on to the redirects."""
+    _logger.info("Resolving redirects")
 
-    Returns:
-        str: The path to the created database.
+    chains = dict(
+        conn.execute(
+            """SELECT wikipedia_id, target_id FROM redirect_target
+            WHERE target_id IN (SELECT wikipedia_id FROM redirect_target)"""
+        )
+    )
+    pages = _redirect_wikidata_ids(conn, set(chains) | set(chains.values()))
+    _apply_redirects(conn, _follow_redirects(chains, pages).items())
+
+
+def _prop_value(value: str) -> str:
+    # Markers like `disambiguation` have an empty value which the parser reports as NUL
+    return "" if value == chr(0) else value
 
+
+class _BuildProgress:
+    """Records in the index being built which stages are completed and up to which offset the
+    dump of the current stage has been committed, so that an interrupted build can be resumed.
+    The progress is written in the same transaction as the rows it describes.
     """
-    if path_to_db is None:
-        path_to_db = "index_{0}.db".format(dumpname)
 
-    _logger.info("Creating index for [%s] in [%s]", dumpname, path_to_db)
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
 
-    wiki_name, date = dumpname.split("-")
+    @staticmethod
+    def exists(conn: sqlite3.Connection) -> bool:
+        query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'build_progress'"
+        return conn.execute(query).fetchone() is not None
 
-    pages_dump = os.path.join(path_to_dumps, dumpname + "-page.sql.gz")
-    page_props_dump = os.path.join(path_to_dumps, dumpname + "-page_props.sql.gz")
-    redirects_dump = os.path.join(path_to_dumps, dumpname + "-redirect.sql.gz")
+    def create(self, settings: str):
+        with self._conn:
+            self._conn.execute(
+                """CREATE TABLE build_progress (
+                stage text PRIMARY KEY,
+                completed int,
+                offset int)"""
+            )
+            self._conn.execute("CREATE TABLE build_settings (settings text)")
+            self._conn.execute("INSERT INTO build_settings (settings) VALUES (?)", (settings,))
 
-    # https://stackoverflow.com/a/54517228
-    csv.field_size_limit(int(ct.c_ulong(-1).value // 2))
+    def settings(self) -> str:
+        (settings,) = self._conn.execute("SELECT settings FROM build_settings").fetchone()
+        return settings
 
-    # (Re)Create the database file
-    try:
-        os.remove(path_to_db)
-    except FileNotFoundError:
-        pass
+    def is_completed(self, stage: str) -> bool:
+        query = "SELECT completed FROM build_progress WHERE stage = ?"
+        row = self._conn.execute(query, (stage,)).fetchone()
+        return row is not None and bool(row[0])
 
-    conn = sqlite3.connect(path_to_db, isolation_level="EXCLUSIVE")
+    def offset(self, stage: str) -> int:
+        query = "SELECT offset FROM build_progress WHERE stage = ?"
+        row = self._conn.execute(query, (stage,)).fetchone()
+        return row[0] if row is not None else 0
 
-    with conn:
-        conn.execute(
-            """CREATE TABLE mapping (
-            wikipedia_id int PRIMARY KEY ,
-            wikipedia_title text,
-            wikidata_id text)"""
+    def save(self, stage: str, offset: int = 0, completed: bool = False):
+        """Records the progress of `stage`, it is persisted by the next commit."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO build_progress (stage, completed, offset) VALUES (?, ?, ?)",
+            (stage, int(completed), offset),
         )
 
-    c = conn.cursor()
+    def drop(self):
+        with self._conn:
+            self._conn.execute("DROP TABLE build_progress")
+            self._conn.execute("DROP TABLE build_settings")
 
-    # Parse the Wikipedia page dump; extract page id and page title from the sql
-    # https://www.mediawiki.org/wiki/Manual:Page_table
-    _logger.info("Parsing pages dump")
-    with gzip.open(pages_dump, "rt", encoding="utf-8", newline="\n") as f:
-        for line in f:
-            # Look for an INSERT statement and parse it.
-            if not _is_insert(line):
-                continue
 
-            values = _get_values(line)
+def _run_stage(
+    conn: sqlite3.Connection,
+    progress: _BuildProgress,
+    stage: str,
+    run: Callable[[sqlite3.Connection], None],
+):
+    """Runs `run` unless `stage` has been completed by a previous attempt of the build."""
+    if progress.is_completed(stage):
+        _logger.info("Skipping completed stage [%s]", stage)
+        return
+
+    run(conn)
+    progress.save(stage, completed=True)
+    conn.commit()
 
-            for v in _parse_values(values):
-                # Filter the namespace; only use real articles
-                # https://www.mediawiki.org/wiki/Manual:Namespace
-                if v[1] == "0":
-                    c.execute(
-                        "INSERT INTO mapping (wikipedia_id, wikipedia_title) VALUES (?, ?)",
-                        (v[0], v[2]),
-                    )
 
+def _load_dump(
+    conn: sqlite3.Connection,
+    progress: _BuildProgress,
+    stage: str,
+    path_to_dump: str,
+    errors: str,
+    load_row: Callable[[List[str]], None],
+):
+    """Calls `load_row` for every row of the dump, starting after the last INSERT statement that
+    a previous attempt of `stage` committed. Commits after every statement that brings the
+    number of uncommitted rows to `_COMMIT_INTERVAL`, together with the offset to resume from.
+    """
+    if progress.is_completed(stage):
+        _logger.info("Skipping completed stage [%s]", stage)
+        return
+
+    offset = progress.offset(stage)
+    if offset:
+        _logger.info("Resuming stage [%s] at byte [%d] of the dump", stage, offset)
+
+    uncommitted = 0
+    for statement in _iter_statements(path_to_dump, errors, offset):
+        for v in statement:
+            load_row(v)
+            uncommitted += 1
+
+        offset = statement.end
+        if uncommitted >= _COMMIT_INTERVAL:
+            progress.save(stage, offset)
+            conn.commit()
+            uncommitted = 0
+
+    progress.save(stage, offset, completed=True)
     conn.commit()
 
+
+def _fill_in_place(
+    conn: sqlite3.Connection,
+    progress: _BuildProgress,
+    pages_dump: str,
+    page_props_dump: str,
+    redirects_dump: str,
+    namespaces: Set[str],
+    property_ids: Dict[str, int],
+):
+    """Fills the index by inserting pages and then updating them with random access queries."""
+    c = conn.cursor()
+
+    # Parse the Wikipedia page dump; extract page id, namespace and page title from the sql
+    # https://www.mediawiki.org/wiki/Manual:Page_table
+    def load_page(v: List[str]):
+        # Filter the namespace; by default, only use real articles
+        # https://www.mediawiki.org/wiki/Manual:Namespace
+        if v[1] in namespaces:
+            c.execute(
+                "INSERT INTO mapping (wikipedia_id, wikipedia_title, namespace) VALUES (?, ?, ?)",
+                (v[0], v[2], v[1]),
+            )
+
+    _logger.info("Parsing pages dump")
+    _load_dump(conn, progress, "pages", pages_dump, "strict", load_page)
+
     # We create this index here as all titles have been inserted now.
     # Doing it earlier would recreate the index on every title insert.
-    _logger.info("Creating database index on 'wikipedia_title'")
-    conn.execute("""CREATE UNIQUE INDEX idx_wikipedia_title ON mapping(wikipedia_title);""")
-    conn.commit()
+    _run_stage(conn, progress, "title_index", _create_title_index)
 
     # Parse the Wikipedia page property dump; extract page id and Wikidata id from the sql
     # https://www.mediawiki.org/wiki/Manual:Page_props_table/en
+    def load_page_prop(v: List[str]):
+        # The page property table contains many properties, we only care about the Wikidata id
+        # and the ones that were explicitly selected
+        if v[1] == "wikibase_item":
+            c.execute("UPDATE mapping SET wikidata_id = ? WHERE wikipedia_id = ?", (v[2], v[0]))
+        elif v[1] in property_ids:
+            c.execute(
+                """INSERT INTO page_props (wikipedia_id, property, value)
+                SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM mapping WHERE wikipedia_id = ?)""",
+                (v[0], property_ids[v[1]], _prop_value(v[2]), v[0]),
+            )
+
     _logger.info("Parsing page properties dump")
-    with gzip.open(page_props_dump, "r") as f:
-        for line in f:
-            line = line.decode("utf-8", "ignore")
+    _load_dump(conn, progress, "page_props", page_props_dump, "ignore", load_page_prop)
 
-            # Look for an INSERT statement and parse it.
-            if not _is_insert(line):
-                continue
+    # Parse the Wikipedia redirect dump; look up the targets of the redirects, their Wikidata
+    # ids are only passed on once all targets are known, so that redirects to redirects get the
+    # same Wikidata id whichever comes first in the dump
+    # https://www.mediawiki.org/wiki/Manual:Redirect_table
+    def load_redirect(v: List[str]):
+        source_wikipedia_id = v[0]
+        target_title = v[2]
+        namespace = v[1]
 
-            values = _get_values(line)
-            for v in _parse_values(values):
-                # The page property table contains many properties, we only care about the Wikidata id
-                if v[1] == "wikibase_item":
-                    c.execute(
-                        "UPDATE mapping SET wikidata_id = ? WHERE wikipedia_id = ?", (v[2], v[0])
-                    )
-    conn.commit()
+        # We only care about targets in the selected namespaces
+        if namespace not in namespaces:
+            return
+
+        c.execute(
+            """INSERT INTO redirect_target (wikipedia_id, target_id, wikidata_id)
+            SELECT ?, wikipedia_id, wikidata_id FROM mapping
+            WHERE namespace = ? AND wikipedia_title = ?
+            AND EXISTS (SELECT 1 FROM mapping WHERE wikipedia_id = ?)""",
+            (source_wikipedia_id, namespace, target_title, source_wikipedia_id),
+        )
 
-    # Parse the Wikipedia redirect dump; fill in missing Wikidata ids
-    # https://www.mediawiki.org/wiki/Manual:Redirect_table
     _logger.info("Parsing redirects dump")
-    with gzip.open(redirects_dump, "r") as f:
-        for line in f:
-            line = line.decode("utf-8", "ignore")
-            # Look for an INSERT statement and parse it.
-            if not _is_insert(line):
-                continue
+    _run_stage(conn, progress, "redirect_target_table", _create_redirect_target_table)
+    _load_dump(conn, progress, "redirects", redirects_dump, "ignore", load_redirect)
+    _run_stage(conn, progress, "resolve_redirects", _resolve_redirects)
+
+    c.close()
 
-            values = _get_values(line)
 
-            for v in _parse_values(values):
-                source_wikipedia_id = v[0]
-                target_title = v[2]
-                namespace = v[1]
+def _merge_join(left: Iterable, right: Iterable, left_key: Callable, right_key: Callable):
+    """Joins two iterables that are sorted by key, keys in `right` have to be unique.
+    Yields `(left_row, right_row)` for every row in `left`, `right_row` is `None` if
+    there is no row in `right` with the same key.
+    """
+    right = iter(right)
+    r = next(right, None)
+    for row in left:
+        key = left_key(row)
+        while r is not None and right_key(r) < key:
+            r = next(right, None)
 
-                # We only care about main articles
-                if namespace != "0":
-                    continue
+        if r is not None and right_key(r) == key:
+            yield row, r
+        else:
+            yield row, None
 
-                c.execute(
-                    "SELECT wikidata_id FROM mapping WHERE wikipedia_title = ?", (target_title,)
-                )
-                result = c.fetchone()
 
-                if result is None or result[0] is None:
-                    continue
+def _fill_by_merging(
+    conn: sqlite3.Connection,
+    progress: _BuildProgress,
+    pages_dump: str,
+    page_props_dump: str,
+    redirects_dump: str,
+    namespaces: Set[str],
+    property_ids: Dict[str, int],
+    memory_budget: int,
+    tmp_dir: str,
+):
+    """Fills the index by externally sorting the parsed dumps and joining them sequentially, so
+    that the database is only written once in primary key order. Buffered rows occupy at most
+    `memory_budget` bytes in total, everything else is spilled to run files in `tmp_dir`.
 
-                wikidata_id = result[0]
-                c.execute(
-                    "UPDATE mapping SET wikidata_id = ? WHERE wikipedia_id = ?",
-                    (wikidata_id, source_wikipedia_id),
+    Redirects get the same Wikidata ids as with `_fill_in_place`. Chains of redirects are
+    followed in memory, see `_follow_redirects`.
+
+    The sorted runs do not outlive the process, so an interrupted merge is started over when
+    the build is resumed. Only the stages after it are skipped.
+    """
+
+    def merge(conn: sqlite3.Connection):
+        _merge_dumps(
+            conn,
+            pages_dump,
+            page_props_dump,
+            redirects_dump,
+            namespaces,
+            property_ids,
+            memory_budget,
+            tmp_dir,
+        )
+
+    _run_stage(conn, progress, "merge", merge)
+    _run_stage(conn, progress, "title_index", _create_title_index)
+
+
+def _insert_in_batches(conn: sqlite3.Connection, sql: str, rows: Iterable[tuple]):
+    """Inserts `rows` with `sql`, committing every `_COMMIT_INTERVAL` rows."""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, _COMMIT_INTERVAL))
+        if not batch:
+            break
+
+        conn.executemany(sql, batch)
+        conn.commit()
+
+
+def _merge_dumps(
+    conn: sqlite3.Connection,
+    pages_dump: str,
+    page_props_dump: str,
+    redirects_dump: str,
+    namespaces: Set[str],
+    property_ids: Dict[str, int],
+    memory_budget: int,
+    tmp_dir: str,
+):
+    # Remove what an interrupted previous attempt loaded already
+    with conn:
+        conn.execute("DELETE FROM mapping")
+        conn.execute("DELETE FROM page_props")
+
+    # At most all of the sorters below hold rows in memory at the same time
+    budget = max(memory_budget // 8, 1)
+    by_first = itemgetter(0)
+    by_first_two = itemgetter(0, 1)
+
+    with ExitStack() as stack:
+
+        def sorter(key: Callable) -> ExternalSorter:
+            return stack.enter_context(ExternalSorter(key, budget, tmp_dir))
+
+        # (wikipedia_id, namespace, wikipedia_title)
+        pages = sorter(by_first)
+        # (wikipedia_id, wikidata_id)
+        wikidata_ids = sorter(by_first)
+        # (wikipedia_id, property, value)
+        props = sorter(by_first_two)
+        # (namespace, target_title, source_wikipedia_id)
+        redirects = sorter(by_first_two)
+        # (namespace, wikipedia_title, wikipedia_id, wikidata_id)
+        targets = sorter(by_first_two)
+        # (source_wikipedia_id, target_wikipedia_id, wikidata_id of the target)
+        hops = sorter(by_first)
+        # (target_wikipedia_id, source_wikipedia_id)
+        hop_targets = sorter(by_first)
+        # (wikipedia_id, namespace, wikipedia_title, wikidata_id)
+        joined = sorter(by_first)
+
+        _logger.info("Parsing and sorting pages dump")
+        for v in _iter_rows(pages_dump):
+            if v[1] in namespaces:
+                pages.add((int(v[0]), int(v[1]), v[2]))
+
+        _logger.info("Parsing and sorting page properties dump")
+        for v in _iter_rows(page_props_dump, errors="ignore"):
+            if v[1] == "wikibase_item":
+                wikidata_ids.add((int(v[0]), v[2]))
+            elif v[1] in property_ids:
+                props.add((int(v[0]), property_ids[v[1]], _prop_value(v[2])))
+
+        _logger.info("Parsing and sorting redirects dump")
+        for v in _iter_rows(redirects_dump, errors="ignore"):
+            if v[1] in namespaces:
+                redirects.add((int(v[1]), v[2], int(v[0])))
+
+        _logger.info("Joining pages with Wikidata ids")
+        pages_with_ids = _merge_join(pages, wikidata_ids, by_first, by_first)
+        for (wikipedia_id, namespace, title), r in pages_with_ids:
+            wikidata_id = r[1] if r is not None else None
+            joined.add((wikipedia_id, namespace, title, wikidata_id))
+            targets.add((namespace, title, wikipedia_id, wikidata_id))
+
+        pages.close()
+        wikidata_ids.close()
+
+        _logger.info("Joining redirects with their targets")
+        for (_, _, source_id), r in _merge_join(redirects, targets, by_first_two, by_first_two):
+            if r is not None:
+                hops.add((source_id, r[2], r[3]))
+                hop_targets.add((r[2], source_id))
+
+        redirects.close()
+        targets.close()
+
+        _logger.info("Following redirects to redirects")
+        chains = {}  # type: Dict[int, int]
+        for (target_id, source_id), hop in _merge_join(hop_targets, hops, by_first, by_first):
+            if hop is not None:
+                chains[source_id] = target_id
+
+        hop_targets.close()
+
+        def first_hop(wikidata_id: Optional[str], hop: Optional[tuple]) -> Optional[str]:
+            return hop[2] if hop is not None and hop[2] is not None else wikidata_id
+
+        resolved = {}  # type: Dict[int, Optional[str]]
+        if chains:
+            in_chains = set(chains) | set(chains.values())
+            pages_in_chains = [
+                (wikipedia_id, wikidata_id, first_hop(wikidata_id, hop))
+                for (wikipedia_id, _, _, wikidata_id), hop in _merge_join(
+                    joined, hops, by_first, by_first
                 )
+                if wikipedia_id in in_chains
+            ]
+            resolved = _follow_redirects(chains, pages_in_chains)
+
+        _logger.info("Loading pages into the database")
+        rows = (
+            (
+                wikipedia_id,
+                title,
+                resolved.get(wikipedia_id, first_hop(wikidata_id, hop)),
+                namespace,
+            )
+            for (wikipedia_id, namespace, title, wikidata_id), hop in _merge_join(
+                joined, hops, by_first, by_first
+            )
+        )
+        _insert_in_batches(
+            conn,
+            """INSERT INTO mapping (wikipedia_id, wikipedia_title, wikidata_id, namespace)
+            VALUES (?, ?, ?, ?)""",
+            rows,
+        )
+
+        _logger.info("Loading page properties into the database")
+        # A page can have several properties, so the pages are on the right side of the join
+        props_of_pages = _merge_join(props, joined, by_first, by_first)
+        rows = (row for row, page in props_of_pages if page is not None)
+        _insert_in_batches(
+            conn, "INSERT INTO page_props (wikipedia_id, property, value) VALUES (?, ?, ?)", rows
+        )
+
 
+def _replace_file(path_to_tmp: str, path: str):
+    """Atomically renames `path_to_tmp` to `path`. Readers that have `path` open keep reading
+    the old file, except on Windows, where SQLite connections and memory maps keep files from
+    being replaced. There, the readers have to close `path` first.
+    """
+    for attempt in range(1, _REPLACE_ATTEMPTS + 1):
+        try:
+            os.replace(path_to_tmp, path)
+            return
+        except PermissionError as e:
+            if attempt == _REPLACE_ATTEMPTS:
+                raise PermissionError(
+                    "Can not replace [{0}], on Windows it must not be open, e.g. by a WikiMapper. "
+                    "Close its readers and rename [{1}] to it".format(path, path_to_tmp)
+                ) from e
+            time.sleep(_REPLACE_DELAY)
+
+
+def _remove_if_exists(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _remove_database(path: str):
+    for suffix in ["", "-wal", "-journal"]:
+        _remove_if_exists(path + suffix)
+
+
+def _interrupted_build_settings(path_to_tmp_db: str) -> Optional[str]:
+    """Returns the settings of the interrupted build in `path_to_tmp_db`, if there is one."""
+    if not os.path.isfile(path_to_tmp_db):
+        return None
+
+    conn = sqlite3.connect(path_to_tmp_db)
+    try:
+        if not _BuildProgress.exists(conn):
+            return None
+        return _BuildProgress(conn).settings()
+    finally:
+        conn.close()
+
+
+def _configure_for_bulk_load(conn: sqlite3.Connection, cache_size: int):
+    """Trades durability for speed while building. The write-ahead log keeps every commit
+    intact when the process dies, which is what resuming a build relies on. Syncing to disk
+    only protects against the machine going down and is skipped.
+    """
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA locking_mode = EXCLUSIVE")
+    conn.execute("PRAGMA cache_size = -{0}".format(cache_size // 1024))
+
+
+def _finalize(conn: sqlite3.Connection):
+    """Gathers statistics for the query planner and compacts the finished index."""
     conn.commit()
 
-    _logger.info("Creating database index on 'wikidata_id'")
-    conn.execute("""CREATE INDEX idx_wikidata_id ON mapping(wikidata_id);""")
+    _logger.info("Analyzing database")
+    conn.execute("ANALYZE")
     conn.commit()
 
-    c.close()
+    _logger.info("Compacting database")
+    conn.execute("VACUUM")
+
+    # The finished index is a single file that readers may open read-only
+    conn.execute("PRAGMA journal_mode = DELETE")
+
+
+def create_index(
+    dumpname: str,
+    path_to_dumps: str,
+    path_to_db: str = None,
+    bloom_filter_error_rate: float = None,
+    namespaces: Iterable[int] = (0,),
+    page_props: Iterable[str] = (),
+    low_memory: bool = False,
+    memory_budget: int = 512 * 1024 * 1024,
+    tmp_dir: str = None,
+    resume: bool = False,
+    reverse_mapping: bool = False,
+) -> str:
+    """Creates an index mapping Wikipedia page titles to Wikidata IDs and vice versa.
+    This requires a previously downloaded dump `dumpname` in `path_to_dumps`.
+
+    Args:
+        dumpname(str): Name of the Wikipedia SQL  dump that should be used for creating an index.
+        path_to_dumps(str): Folder in which the dump has been downloaded to.
+        path_to_db(str): Path where the index will be saved to. Defaults to `index_${dump_name}.db`.
+            The index is built in `${path_to_db}.tmp` and then atomically renamed to `path_to_db`,
+            so an existing index at that path stays readable until the new one is complete. On
+            Windows, the existing index must be closed by its readers before it is replaced.
+        bloom_filter_error_rate(float): If given, then also store Bloom filters over page titles
+            and page ids with this false positive rate, e.g. `0.01`. These let `WikiMapper`
+            answer lookups of unknown titles and ids without querying the database.
+        namespaces(Iterable[int]): The namespaces whose pages are indexed, e.g. `(0, 14)` for
+            articles and categories. Defaults to articles only.
+        page_props(Iterable[str]): Names of page properties that are stored in addition to the
+            Wikidata id, e.g. `("wikibase-shortdesc", "disambiguation")`. Defaults to none.
+        low_memory(bool): If true, then sort the parsed dumps externally and join them
+            sequentially instead of updating the database randomly. This is slower for small
+            wikis, but does not thrash when the index is much larger than the available memory.
+            The index is the same in both modes.
+        memory_budget(int): Number of bytes the parsed rows may occupy in `low_memory` mode
+            before they are spilled to disk. Defaults to 512 MiB.
+        tmp_dir(str): Folder for the temporary files of `low_memory` mode. Defaults to the
+            folder of `path_to_db`, as the system default is often a small or in-memory disk.
+        resume(bool): If true, then continue an interrupted build from the last checkpoint
+            recorded in `${path_to_db}.tmp` instead of starting over. The build has to be
+            resumed with the same dump, namespaces, page properties and `low_memory` mode.
+        reverse_mapping(bool): If true, then also store the pages clustered by Wikidata id,
+            which speeds up `id_to_titles` and `id_to_wikipedia_ids` for the price of
+            storing every title twice. It also lets `WikiMapper` return pages that are not
+            redirects first.
+
+    Returns:
+        str: The path to the created database.
+
+    """
+    if path_to_db is None:
+        path_to_db = "index_{0}.db".format(dumpname)
+
+    if bloom_filter_error_rate is not None and not 0 < bloom_filter_error_rate < 1:
+        raise ValueError(
+            "Bloom filter error rate has to be in (0, 1), got [{0}]".format(bloom_filter_error_rate)
+        )
+
+    if tmp_dir is None:
+        tmp_dir = os.path.dirname(os.path.abspath(path_to_db))
+
+    # Values from the dump are compared as strings, so we do not need to convert every row
+    namespaces = {str(int(ns)) for ns in namespaces}
+    page_props = sorted(set(page_props) - {"wikibase_item"})
+    property_ids = {name: i for i, name in enumerate(page_props)}
+
+    _logger.info("Creating index for [%s] in [%s]", dumpname, path_to_db)
+
+    wiki_name, date = dumpname.split("-")
+
+    pages_dump = os.path.join(path_to_dumps, dumpname + "-page.sql.gz")
+    page_props_dump = os.path.join(path_to_dumps, dumpname + "-page_props.sql.gz")
+    redirects_dump = os.path.join(path_to_dumps, dumpname + "-redirect.sql.gz")
+
+    # Build into a temporary file next to the target and only rename it over the target once
+    # it is complete, so that readers of the target never see a partially built index.
+    path_to_tmp_db = path_to_db + ".tmp"
+    settings = repr((dumpname, sorted(namespaces), page_props, low_memory))
+
+    resuming = False
+    if resume:
+        interrupted_settings = _interrupted_build_settings(path_to_tmp_db)
+        if interrupted_settings is None:
+            _logger.info("No build to resume in [%s], starting over", path_to_tmp_db)
+        elif interrupted_settings != settings:
+            raise ValueError(
+                "Can not resume [{0}], it was started with different settings [{1}]".format(
+                    path_to_tmp_db, interrupted_settings
+                )
+            )
+        else:
+            _logger.info("Resuming the build in [%s]", path_to_tmp_db)
+            resuming = True
+
+    if not resuming:
+        _remove_database(path_to_tmp_db)
+
+    conn = sqlite3.connect(path_to_tmp_db, isolation_level="EXCLUSIVE")
+    progress = _BuildProgress(conn)
+
+    try:
+        if low_memory:
+            # Keep the page cache of SQLite within the budget as well, it is used for sorting
+            # while creating the indices.
+            cache_size = max(memory_budget // 4, 8 * 1024 * 1024)
+        else:
+            cache_size = _BULK_LOAD_CACHE_SIZE
+        _configure_for_bulk_load(conn, cache_size)
+
+        if not resuming:
+            _create_tables(conn, page_props)
+            progress.create(settings)
+
+        dumps = (pages_dump, page_props_dump, redirects_dump)
+        if low_memory:
+            _fill_by_merging(
+                conn, progress, *dumps, namespaces, property_ids, memory_budget, tmp_dir
+            )
+        else:
+            _fill_in_place(conn, progress, *dumps, namespaces, property_ids)
+
+        _run_stage(conn, progress, "wikidata_index", _create_wikidata_index)
+
+        if reverse_mapping:
+            create_reverse_mapping = partial(_create_reverse_mapping, redirects_dump=redirects_dump)
+            _run_stage(conn, progress, "reverse_mapping", create_reverse_mapping)
+
+        if bloom_filter_error_rate is not None:
+            create_bloom_filters = partial(
+                _create_bloom_filters, error_rate=bloom_filter_error_rate
+            )
+            _run_stage(conn, progress, "bloom_filters", create_bloom_filters)
+
+        progress.drop()
+        _finalize(conn)
+    except BaseException:
+        conn.close()
+        _logger.error(
+            "Building the index failed, pass `resume` to continue the build in [%s]",
+            path_to_tmp_db,
+        )
+        raise
+
     conn.close()
 
+    _logger.info("Moving [%s] to [%s]", path_to_tmp_db, path_to_db)
+    _replace_file(path_to_tmp_db, path_to_db)
+
     return path_to_db
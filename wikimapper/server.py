@@ -0,0 +1,376 @@
+""" Serves the lookups of a `WikiMapper` over HTTP.
+
+Concurrent requests are collected into micro batches, which are answered with one query per
+batch by a pool of worker threads, each holding its own read-only connection to the index.
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+from wikimapper.mapper import LookupStats, WikiMapper, _is_hit
+
+_logger = logging.getLogger(__name__)
+
+
+def _check_text(key: Any) -> str:
+    if not isinstance(key, str):
+        raise ValueError("Expected a string, got [{0}]".format(key))
+    return key
+
+
+def _check_wikipedia_id(key: Any) -> int:
+    # Query strings only contain strings, so page ids may also be sent as digits
+    if isinstance(key, str) and key.isascii() and key.isdigit():
+        return int(key)
+    if not isinstance(key, int) or isinstance(key, bool):
+        raise ValueError("Expected a page id, got [{0}]".format(key))
+    return key
+
+
+# Lookup method exposed by the server -> (batch method of `WikiMapper`, takes a namespace,
+# checks and normalizes a key). Methods without a batch method are answered key by key.
+_METHODS = {
+    "title_to_id": ("titles_to_ids", True, _check_text),
+    "url_to_id": ("urls_to_ids", False, _check_text),
+    "id_to_titles": ("ids_to_titles", True, _check_text),
+    "wikipedia_id_to_id": ("wikipedia_ids_to_ids", False, _check_wikipedia_id),
+    "id_to_wikipedia_ids": ("ids_to_wikipedia_ids", True, _check_text),
+    "wikipedia_id_to_title": ("wikipedia_ids_to_titles", False, _check_wikipedia_id),
+    "title_to_wikipedia_id": ("titles_to_wikipedia_ids", True, _check_text),
+    "page_props": (None, False, _check_wikipedia_id),
+}
+
+
+def _call(mapper: WikiMapper, method: str, keys: list, namespace: int) -> list:
+    batch_method, takes_namespace, _ = _METHODS[method]
+
+    if batch_method is None:
+        lookup = getattr(mapper, method)
+        return [lookup(key) for key in keys]
+    elif takes_namespace:
+        return getattr(mapper, batch_method)(keys, namespace)
+    else:
+        return getattr(mapper, batch_method)(keys)
+
+
+class _Request:
+    __slots__ = ["method", "keys", "namespace", "future"]
+
+    def __init__(self, method: str, keys: list, namespace: int):
+        self.method = method
+        self.keys = keys
+        self.namespace = namespace
+        self.future = Future()  # type: Future
+
+
+class LookupBatcher:
+    """Groups lookups that arrive within `batch_window` seconds of each other into batches of
+    at most `max_batch` keys and answers them with the batch methods of `WikiMapper`.
+    """
+
+    def __init__(
+        self, path_to_db: str, workers: int = 4, batch_window: float = 0.002, max_batch: int = 256,
+    ):
+        """
+        Args:
+            path_to_db (str): Path to the index created by `create_index`.
+            workers (int): Number of threads, and thereby connections, answering batches.
+            batch_window (float): Seconds to wait for further requests after the first one.
+            max_batch (int): Maximum number of keys per batch.
+        """
+        self._path_to_db = path_to_db
+        self._batch_window = batch_window
+        self._max_batch = max_batch
+
+        self.lookup_stats = LookupStats()
+        self._requests = queue.Queue()  # type: queue.Queue
+        self._batches = queue.Queue()  # type: queue.Queue
+
+        self._lock = threading.Lock()
+        self._num_batches = 0
+        self._num_keys = 0
+
+        # Open the index once up front, so that a wrong path fails here and not in the workers
+        WikiMapper(path_to_db, read_only=True).close()
+
+        self._threads = [threading.Thread(target=self._collect, name="batcher", daemon=True)]
+        for i in range(workers):
+            name = "worker-{0}".format(i)
+            self._threads.append(threading.Thread(target=self._work, name=name, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, method: str, keys: list, namespace: int = 0) -> Future:
+        """Enqueues looking up all `keys` with `method`, e.g. `title_to_id`.
+
+        Returns:
+            Future: Resolves to the list of results for `keys` in the same order.
+        """
+        if method not in _METHODS:
+            raise ValueError("Unknown method [{0}]".format(method))
+
+        request = _Request(method, keys, namespace)
+        self._requests.put(request)
+        return request.future
+
+    def _collect(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                break
+
+            batch = [request]
+            size = len(request.keys)
+            deadline = time.monotonic() + self._batch_window
+
+            while size < self._max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._requests.put(None)
+                    break
+
+                batch.append(request)
+                size += len(request.keys)
+
+            self._batches.put(batch)
+
+        for _ in self._threads[1:]:
+            self._batches.put(None)
+
+    def _work(self):
+        mapper = WikiMapper(self._path_to_db, stats=self.lookup_stats, read_only=True)
+        try:
+            while True:
+                batch = self._batches.get()
+                if batch is None:
+                    break
+                self._execute(mapper, batch)
+        finally:
+            mapper.close()
+
+    def _execute(self, mapper: WikiMapper, batch: List[_Request]):
+        groups = defaultdict(list)  # type: Dict[Any, List[_Request]]
+        for request in batch:
+            groups[(request.method, request.namespace)].append(request)
+
+        for (method, namespace), requests in groups.items():
+            keys = [key for request in requests for key in request.keys]
+
+            try:
+                results = _call(mapper, method, keys, namespace)
+            except Exception as e:
+                if len(requests) == 1:
+                    requests[0].future.set_exception(e)
+                    continue
+
+                # Look up every request on its own, so that a bad key only fails its request
+                for request in requests:
+                    try:
+                        request.future.set_result(_call(mapper, method, request.keys, namespace))
+                    except Exception as request_error:
+                        request.future.set_exception(request_error)
+                continue
+
+            offset = 0
+            for request in requests:
+                request.future.set_result(results[offset : offset + len(request.keys)])
+                offset += len(request.keys)
+
+        with self._lock:
+            self._num_batches += 1
+            self._num_keys += sum(len(request.keys) for request in batch)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            batches, keys = self._num_batches, self._num_keys
+
+        return {
+            "batches": batches,
+            "keys": keys,
+            "mean_batch_size": keys / batches if batches else 0.0,
+            "lookups": self.lookup_stats.snapshot(),
+        }
+
+    def close(self):
+        self._requests.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, which would otherwise wait for delayed ACKs
+    disable_nagle_algorithm = True
+    server = None  # type: MappingServer
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        method = url.path.strip("/")
+
+        if method == "metrics":
+            self._send(200, self.server.metrics())
+        elif method == "health":
+            self._send(200, {"status": "ok"})
+        else:
+            params = parse_qs(url.query)
+            keys = params.get("key", [])
+            namespace = params.get("namespace", ["0"])[0]
+            self._lookup(method, keys, namespace, single=len(keys) == 1)
+
+    def do_POST(self):
+        method = urlsplit(self.path).path.strip("/")
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length).decode("utf-8"))
+        except ValueError as e:
+            self._send(400, {"error": "Invalid JSON: {0}".format(e)})
+            return
+
+        if not isinstance(body, dict) or ("key" in body) == ("keys" in body):
+            self._send(400, {"error": "Expected an object with either 'key' or 'keys'"})
+        elif "key" in body:
+            self._lookup(method, [body["key"]], body.get("namespace", 0), single=True)
+        else:
+            self._lookup(method, body["keys"], body.get("namespace", 0), single=False)
+
+    def _lookup(self, method: str, keys: list, namespace: Any, single: bool):
+        if method not in _METHODS:
+            self._send(404, {"error": "Unknown method [{0}]".format(method)})
+            return
+        if not isinstance(keys, list) or not keys:
+            self._send(400, {"error": "No keys given"})
+            return
+        try:
+            namespace = int(namespace)
+        except (TypeError, ValueError):
+            self._send(400, {"error": "Invalid namespace [{0}]".format(namespace)})
+            return
+
+        # Invalid keys are rejected here, as they would fail the whole batch they end up in
+        check = _METHODS[method][2]
+        try:
+            keys = [check(key) for key in keys]
+        except ValueError as e:
+            self._send(400, {"error": "Invalid key: {0}".format(e)})
+            return
+
+        start = time.perf_counter()
+        try:
+            results = self.server.batcher.submit(method, keys, namespace).result()
+        except Exception as e:
+            _logger.exception("Looking up [%s] failed", method)
+            self._send(500, {"error": str(e)})
+            return
+
+        stats = self.server.request_stats
+        if stats.should_sample(method):
+            stats.record(method, time.perf_counter() - start, _is_hit(results))
+
+        if single:
+            self._send(200, {"result": results[0]})
+        else:
+            self._send(200, {"results": results})
+
+    def _send(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args):
+        _logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class MappingServer(ThreadingHTTPServer):
+    """HTTP server exposing the lookup methods of `WikiMapper` as JSON endpoints.
+
+    Every lookup method, e.g. `title_to_id`, is served under its name. A single key is
+    looked up via `GET /title_to_id?key=Germany` or `POST /title_to_id` with the body
+    `{"key": "Germany"}` and answered with `{"result": "Q183"}`. Several keys are sent as
+    `{"keys": [...]}` and answered with `{"results": [...]}` in the same order. Title based
+    methods accept an optional `namespace`. `GET /metrics` reports throughput and latencies.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        path_to_db: str,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        workers: int = 4,
+        batch_window: float = 0.002,
+        max_batch: int = 256,
+    ):
+        self.batcher = LookupBatcher(path_to_db, workers, batch_window, max_batch)
+        self.request_stats = LookupStats()
+        self._started = time.monotonic()
+        super().__init__((host, port), _Handler)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Returns request counts, throughput, batching and latency statistics."""
+        uptime = time.monotonic() - self._started
+        requests = self.request_stats.snapshot()
+        num_requests = sum(e["calls"] for e in requests.values())
+
+        metrics = self.batcher.metrics()
+        metrics.update(
+            {
+                "uptime": uptime,
+                "requests": num_requests,
+                "requests_per_second": num_requests / uptime if uptime else 0.0,
+                "keys_per_second": metrics["keys"] / uptime if uptime else 0.0,
+                "request_latency": requests,
+            }
+        )
+        return metrics
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+
+
+def serve(
+    path_to_db: str,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    workers: int = 4,
+    batch_window: float = 0.002,
+    max_batch: int = 256,
+):
+    """Serves the index `path_to_db` via HTTP until interrupted, see `MappingServer`.
+
+    Args:
+        path_to_db (str): Path to the index created by `create_index`.
+        host (str): Host name or address to listen on. Defaults to `127.0.0.1`.
+        port (int): Port to listen on. Defaults to `8080`.
+        workers (int): Number of threads and read-only connections answering lookups.
+        batch_window (float): Seconds to wait for further requests to batch with the first one.
+        max_batch (int): Maximum number of keys looked up in one batch.
+    """
+    server = MappingServer(path_to_db, host, port, workers, batch_window, max_batch)
+
+    _logger.info("Serving [%s] on http://%s:%d", path_to_db, *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
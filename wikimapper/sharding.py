@@ -0,0 +1,761 @@
+""" Splits an index into shards by page title and looks up keys across all of them.
+
+Every shard is a regular index that only contains the pages whose title hashes to it, so a
+title is looked up in exactly one shard. A routing table stored next to the shards tells the
+shard of every page id, so a page id is looked up in exactly one shard as well. The pages of a
+Wikidata id are spread across the shards, Wikidata ids are looked up in all shards concurrently.
+"""
+
+import functools
+import logging
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import sys
+import zlib
+from array import array
+from collections import defaultdict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import chain
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from wikimapper.mapper import (
+    LookupStats,
+    WikiMapper,
+    _as_int,
+    _instrumented,
+    _title_key,
+)
+
+_logger = logging.getLogger(__name__)
+
+_SHARD_NAME = "shard-{0:05d}-of-{1:05d}.db"
+_SHARD_PATTERN = re.compile(r"^shard-(\d{5})-of-(\d{5})\.db$")
+
+# The routing table holds the shard + 1 of every page id, `0` for pages that are in no shard,
+# as little endian integers of `entry_size` bytes after a header.
+_ROUTING_NAME = "routing.bin"
+_ROUTING_MAGIC = b"WMAPR001"
+# (magic, entry_size, num_shards)
+_ROUTING_HEADER = struct.Struct("<8sBI")
+
+# Rows that are sent to a shard at once, and batches that may wait per worker process
+_ROUTE_BATCH_SIZE = 10000
+_MAX_PENDING_BATCHES = 8
+
+
+@functools.lru_cache(maxsize=None)
+def _namespace_crc(namespace: int) -> int:
+    return zlib.crc32(_title_key(namespace, "").encode("utf-8"))
+
+
+def _shard_of(page_title: str, namespace: int, num_shards: int) -> int:
+    """Returns the shard of the page `page_title` in `namespace`, which is stable across runs."""
+    # Same as hashing `_title_key(namespace, page_title)`, without building the key
+    return zlib.crc32(page_title.encode("utf-8"), _namespace_crc(namespace)) % num_shards
+
+
+def _find_shards(path_to_shards: str) -> List[str]:
+    """Returns the paths of all shards in the folder `path_to_shards` ordered by shard."""
+    found = {}
+    for name in os.listdir(path_to_shards):
+        match = _SHARD_PATTERN.match(name)
+        if match is not None:
+            found[int(match.group(1))] = (int(match.group(2)), name)
+
+    num_shards = {n for n, _ in found.values()}
+    if len(num_shards) != 1 or set(found) != set(range(next(iter(num_shards)))):
+        raise ValueError("[{0}] does not contain a complete set of shards".format(path_to_shards))
+
+    return [os.path.join(path_to_shards, found[i][1]) for i in sorted(found)]
+
+
+class _Routing:
+    """Maps page ids to the shards their pages are stored in, while the shards are built."""
+
+    def __init__(self, num_shards: int):
+        self.num_shards = num_shards
+        # Page ids are dense enough that an array indexed by them is much smaller than a dict
+        self._shards = array("B" if num_shards < 255 else "H")
+        self._end = 0
+
+    def add(self, wikipedia_id: int, shard: int):
+        shards = self._shards
+        if wikipedia_id >= len(shards):
+            grow = max(wikipedia_id + 1, 2 * len(shards)) - len(shards)
+            shards.frombytes(bytes(grow * shards.itemsize))
+
+        shards[wikipedia_id] = shard + 1
+        self._end = max(self._end, wikipedia_id + 1)
+
+    def __len__(self) -> int:
+        return self._end
+
+    def get(self, wikipedia_id: int) -> Optional[int]:
+        """Returns the shard of the page `wikipedia_id`, `None` if it is in no shard."""
+        if 0 <= wikipedia_id < self._end and self._shards[wikipedia_id]:
+            return self._shards[wikipedia_id] - 1
+        return None
+
+    def write(self, path: str):
+        shards = self._shards[: self._end]
+        if sys.byteorder != "little":
+            shards.byteswap()
+
+        from wikimapper.processor import _replace_file
+
+        # Readers of the shards only ever see a complete routing table
+        with open(path + ".tmp", "wb") as f:
+            f.write(_ROUTING_HEADER.pack(_ROUTING_MAGIC, shards.itemsize, self.num_shards))
+            shards.tofile(f)
+        _replace_file(path + ".tmp", path)
+
+
+def _open_routing(path_to_shards: str, num_shards: int) -> Optional[mmap.mmap]:
+    """Maps the routing table of the shards in `path_to_shards` into memory, so that only the
+    parts of it that are looked up are read. Returns `None` if there is no routing table.
+    """
+    path = os.path.join(path_to_shards, _ROUTING_NAME)
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+
+    with f:
+        routing = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, _, shards = _ROUTING_HEADER.unpack_from(routing)
+    if magic != _ROUTING_MAGIC or shards != num_shards:
+        routing.close()
+        raise ValueError("[{0}] is not a routing table for [{1}] shards".format(path, num_shards))
+    return routing
+
+
+class _ShardBuilder:
+    """Builds a shard from the rows that are routed to it, in a worker process."""
+
+    def __init__(self, path_to_shard: str, page_props: List[str], cache_size: int):
+        from wikimapper.processor import (
+            _configure_for_bulk_load,
+            _create_redirect_source_table,
+            _create_redirect_target_table,
+            _create_tables,
+            _remove_database,
+        )
+
+        _logger.info("Creating shard [%s]", path_to_shard)
+
+        self._path_to_shard = path_to_shard
+        self._path_to_tmp_db = path_to_shard + ".tmp"
+        _remove_database(self._path_to_tmp_db)
+
+        self._conn = sqlite3.connect(self._path_to_tmp_db, isolation_level="EXCLUSIVE")
+        _configure_for_bulk_load(self._conn, cache_size)
+        _create_tables(self._conn, page_props)
+        _create_redirect_target_table(self._conn)
+        _create_redirect_source_table(self._conn)
+
+        # The Wikidata ids of the redirects to redirects in this shard
+        self._resolved = []  # type: List[tuple]
+
+    def add_pages(self, rows: List[tuple]):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO mapping (wikipedia_id, wikipedia_title, namespace) VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def create_title_index(self):
+        from wikimapper.processor import _create_title_index
+
+        with self._conn:
+            _create_title_index(self._conn)
+
+    def add_wikidata_ids(self, rows: List[tuple]):
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE mapping SET wikidata_id = ? WHERE wikipedia_id = ?", rows
+            )
+
+    def add_page_props(self, rows: List[tuple]):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO page_props (wikipedia_id, property, value) VALUES (?, ?, ?)", rows
+            )
+
+    def resolve_redirects(self, rows: List[tuple]) -> List[tuple]:
+        """Looks up the redirect targets `(namespace, title, source_id)` in this shard and
+        returns `(source_id, target_id, wikidata_id)` for all targets that are in it.
+        """
+        c = self._conn.cursor()
+        resolved = []
+        for namespace, target_title, source_wikipedia_id in rows:
+            c.execute(
+                """SELECT wikipedia_id, wikidata_id FROM mapping
+                WHERE namespace = ? AND wikipedia_title = ?""",
+                (namespace, target_title),
+            )
+            result = c.fetchone()
+            if result is not None:
+                resolved.append((source_wikipedia_id,) + result)
+        c.close()
+        return resolved
+
+    def add_redirect_targets(self, rows: List[tuple]):
+        with self._conn:
+            self._conn.executemany(
+                """INSERT INTO redirect_target (wikipedia_id, target_id, wikidata_id)
+                VALUES (?, ?, ?)""",
+                rows,
+            )
+
+    def chain_links(self, redirects: bytes) -> List[tuple]:
+        """Returns `(source_id, target_id)` of the redirects in this shard whose target is a
+        redirect, which `redirects` tells with one bit per page id.
+        """
+        links = []
+        for source_wikipedia_id, target_wikipedia_id in self._conn.execute(
+            "SELECT wikipedia_id, target_id FROM redirect_target"
+        ):
+            i = target_wikipedia_id >> 3
+            if i < len(redirects) and redirects[i] >> (target_wikipedia_id & 7) & 1:
+                links.append((source_wikipedia_id, target_wikipedia_id))
+        return links
+
+    def redirect_wikidata_ids(self, wikipedia_ids: List[int]) -> List[tuple]:
+        from wikimapper.processor import _redirect_wikidata_ids
+
+        return _redirect_wikidata_ids(self._conn, wikipedia_ids)
+
+    def add_redirected(self, rows: List[tuple]):
+        self._resolved.extend(rows)
+
+    def add_redirect_sources(self, rows: List[tuple]):
+        from wikimapper.processor import _add_redirect_sources
+
+        with self._conn:
+            _add_redirect_sources(self._conn, rows)
+
+    def finish(self, reverse_mapping: bool, bloom_filter_error_rate: Optional[float]):
+        from wikimapper.processor import (
+            _apply_redirects,
+            _create_bloom_filters,
+            _create_wikidata_index,
+            _fill_reverse_mapping,
+            _finalize,
+            _replace_file,
+        )
+
+        conn = self._conn
+        with conn:
+            _apply_redirects(conn, self._resolved)
+
+        with conn:
+            _create_wikidata_index(conn)
+
+        if reverse_mapping:
+            with conn:
+                _fill_reverse_mapping(conn)
+
+        if bloom_filter_error_rate is not None:
+            _create_bloom_filters(conn, bloom_filter_error_rate)
+
+        _finalize(conn)
+        conn.close()
+        _replace_file(self._path_to_tmp_db, self._path_to_shard)
+
+
+# The shards that are built by the current worker process
+_builders = {}  # type: Dict[int, _ShardBuilder]
+
+
+def _open_shard(shard: int, path_to_shard: str, page_props: List[str], cache_size: int):
+    _builders[shard] = _ShardBuilder(path_to_shard, page_props, cache_size)
+
+
+def _call_shard(shard: int, method: str, *args) -> Any:
+    return getattr(_builders[shard], method)(*args)
+
+
+def _finish_shard(shard: int, reverse_mapping: bool, bloom_filter_error_rate: Optional[float]):
+    _builders.pop(shard).finish(reverse_mapping, bloom_filter_error_rate)
+
+
+class _ShardRouter:
+    """Sends rows to the worker processes building the shards, in batches per shard and kind of
+    rows. Each process builds every shard whose number modulo the number of processes is its
+    own, and works off the batches in the order they were sent. Results of the batches, e.g.
+    resolved redirects, are collected in `results`.
+    """
+
+    def __init__(self, executors: List[ProcessPoolExecutor]):
+        self._executors = executors
+        self._buffers = defaultdict(list)  # type: Dict[Tuple[int, str], List[tuple]]
+        self._pending = [deque() for _ in executors]  # type: List[Deque[Future]]
+        self.results = []  # type: List[Any]
+
+    def submit(self, shard: int, function: Callable, *args):
+        """Calls `function(shard, *args)` in the process building `shard`."""
+        i = shard % len(self._executors)
+        self._pending[i].append(self._executors[i].submit(function, shard, *args))
+        # Waiting for the oldest batches keeps the queues short and reports failures early
+        self._wait(i, _MAX_PENDING_BATCHES)
+
+    def _wait(self, i: int, max_pending: int):
+        pending = self._pending[i]
+        while len(pending) > max_pending:
+            result = pending.popleft().result()
+            if result:
+                self.results.extend(result)
+
+    def add(self, shard: int, method: str, row: tuple):
+        """Buffers `row` and passes the buffered rows to `method` of the shard's builder."""
+        buffer = self._buffers[shard, method]
+        buffer.append(row)
+        if len(buffer) >= _ROUTE_BATCH_SIZE:
+            del self._buffers[shard, method]
+            self.submit(shard, _call_shard, method, buffer)
+
+    def flush(self):
+        """Sends all buffered rows and waits until all batches sent so far are processed."""
+        buffers, self._buffers = self._buffers, defaultdict(list)
+        for (shard, method), rows in buffers.items():
+            self.submit(shard, _call_shard, method, rows)
+
+        for i in range(len(self._executors)):
+            self._wait(i, 0)
+
+
+def _route_pages(router: _ShardRouter, routing: _Routing, pages_dump: str, namespaces: Set[str]):
+    from wikimapper.processor import _iter_rows
+
+    _logger.info("Parsing pages dump")
+    for v in _iter_rows(pages_dump):
+        if v[1] in namespaces:
+            wikipedia_id, namespace = int(v[0]), int(v[1])
+            shard = _shard_of(v[2], namespace, routing.num_shards)
+            routing.add(wikipedia_id, shard)
+            router.add(shard, "add_pages", (wikipedia_id, v[2], namespace))
+    router.flush()
+
+    # All titles are inserted, the index speeds up resolving redirects
+    for shard in range(routing.num_shards):
+        router.submit(shard, _call_shard, "create_title_index")
+    router.flush()
+
+
+def _route_page_props(
+    router: _ShardRouter, routing: _Routing, page_props_dump: str, property_ids: Dict[str, int]
+):
+    from wikimapper.processor import _iter_rows, _prop_value
+
+    _logger.info("Parsing page properties dump")
+    for v in _iter_rows(page_props_dump, errors="ignore"):
+        wikipedia_id = int(v[0])
+        shard = routing.get(wikipedia_id)
+        if shard is None:
+            continue
+
+        if v[1] == "wikibase_item":
+            router.add(shard, "add_wikidata_ids", (v[2], wikipedia_id))
+        elif v[1] in property_ids:
+            router.add(
+                shard, "add_page_props", (wikipedia_id, property_ids[v[1]], _prop_value(v[2]))
+            )
+    router.flush()
+
+
+def _route_redirects(
+    router: _ShardRouter,
+    routing: _Routing,
+    redirects_dump: str,
+    namespaces: Set[str],
+    reverse_mapping: bool,
+):
+    """Looks up every redirect target in its shard, which knows its page id and Wikidata id,
+    and sends both to the shard of the redirect. Chains of redirects span shards, so they are
+    followed here, see `_follow_redirects`.
+    """
+    from wikimapper.processor import _follow_redirects, _iter_rows
+
+    # One bit per page id for the redirects whose target is indexed
+    redirects = bytearray((len(routing) + 7) // 8)
+
+    def route_resolved():
+        while router.results:
+            resolved, router.results = router.results, []
+            for source_wikipedia_id, target_wikipedia_id, wikidata_id in resolved:
+                redirects[source_wikipedia_id >> 3] |= 1 << (source_wikipedia_id & 7)
+                row = (source_wikipedia_id, target_wikipedia_id, wikidata_id)
+                router.add(routing.get(source_wikipedia_id), "add_redirect_targets", row)
+
+    _logger.info("Parsing redirects dump")
+    for v in _iter_rows(redirects_dump, errors="ignore"):
+        source_wikipedia_id = int(v[0])
+        source_shard = routing.get(source_wikipedia_id)
+        if source_shard is None:
+            continue
+
+        if reverse_mapping:
+            router.add(source_shard, "add_redirect_sources", (source_wikipedia_id,))
+
+        # We only care about targets in the selected namespaces
+        if v[1] in namespaces:
+            namespace = int(v[1])
+            shard = _shard_of(v[2], namespace, routing.num_shards)
+            router.add(shard, "resolve_redirects", (namespace, v[2], source_wikipedia_id))
+            route_resolved()
+
+    router.flush()
+    route_resolved()
+    router.flush()
+
+    _logger.info("Following redirects to redirects")
+    for shard in range(routing.num_shards):
+        router.submit(shard, _call_shard, "chain_links", bytes(redirects))
+    router.flush()
+    chains, router.results = dict(router.results), []
+    if not chains:
+        return
+
+    by_shard = defaultdict(list)  # type: Dict[int, List[int]]
+    for wikipedia_id in set(chains) | set(chains.values()):
+        by_shard[routing.get(wikipedia_id)].append(wikipedia_id)
+    for shard, wikipedia_ids in by_shard.items():
+        router.submit(shard, _call_shard, "redirect_wikidata_ids", wikipedia_ids)
+    router.flush()
+    pages, router.results = router.results, []
+
+    for source_wikipedia_id, wikidata_id in _follow_redirects(chains, pages).items():
+        row = (source_wikipedia_id, wikidata_id)
+        router.add(routing.get(source_wikipedia_id), "add_redirected", row)
+    router.flush()
+
+
+def create_sharded_index(
+    dumpname: str,
+    path_to_dumps: str,
+    path_to_shards: str = None,
+    num_shards: int = 4,
+    workers: int = None,
+    bloom_filter_error_rate: float = None,
+    namespaces: Iterable[int] = (0,),
+    page_props: Iterable[str] = (),
+    reverse_mapping: bool = False,
+) -> List[str]:
+    """Creates an index like `create_index` that is split into `num_shards` shards by page
+    title, which are read by `ShardedWikiMapper`.
+
+    The dumps are parsed once and their rows are sent to worker processes that build the shards
+    in parallel. Redirects are resolved in the shard of their target page and then stored in
+    the shard of their source page, they get the same Wikidata ids as with `create_index`. A
+    routing table from page ids to shards is stored next to the shards.
+
+    Args:
+        dumpname(str): Name of the Wikipedia SQL dump that should be used for creating an index.
+        path_to_dumps(str): Folder in which the dump has been downloaded to.
+        path_to_shards(str): Folder where the shards will be saved to, it is created if it does
+            not exist. Defaults to `index_${dump_name}_shards`.
+        num_shards(int): Number of shards to split the index into.
+        workers(int): Number of processes building shards. Defaults to the number of CPUs.
+        bloom_filter_error_rate(float): If given, then also store Bloom filters in every shard,
+            see `create_index`.
+        namespaces(Iterable[int]): The namespaces whose pages are indexed, see `create_index`.
+        page_props(Iterable[str]): Names of page properties that are stored in addition to the
+            Wikidata id, see `create_index`.
+        reverse_mapping(bool): If true, then also store the pages clustered by Wikidata id in
+            every shard, see `create_index`.
+
+    Returns:
+        List[str]: The paths to the created shards, ordered by shard.
+
+    """
+    from wikimapper.processor import _BULK_LOAD_CACHE_SIZE, _remove_database
+
+    if num_shards < 1:
+        raise ValueError("Number of shards has to be positive, got [{0}]".format(num_shards))
+
+    if bloom_filter_error_rate is not None and not 0 < bloom_filter_error_rate < 1:
+        raise ValueError(
+            "Bloom filter error rate has to be in (0, 1), got [{0}]".format(bloom_filter_error_rate)
+        )
+
+    if path_to_shards is None:
+        path_to_shards = "index_{0}_shards".format(dumpname)
+    os.makedirs(path_to_shards, exist_ok=True)
+
+    # Values from the dump are compared as strings, so we do not need to convert every row
+    namespaces = {str(int(ns)) for ns in namespaces}
+    page_props = sorted(set(page_props) - {"wikibase_item"})
+    property_ids = {name: i for i, name in enumerate(page_props)}
+
+    pages_dump = os.path.join(path_to_dumps, dumpname + "-page.sql.gz")
+    page_props_dump = os.path.join(path_to_dumps, dumpname + "-page_props.sql.gz")
+    redirects_dump = os.path.join(path_to_dumps, dumpname + "-redirect.sql.gz")
+
+    paths = [
+        os.path.join(path_to_shards, _SHARD_NAME.format(i, num_shards)) for i in range(num_shards)
+    ]
+
+    # Every process keeps the connections to its shards open, so each has an executor of its own
+    num_processes = min(workers or os.cpu_count() or 1, num_shards)
+    executors = [ProcessPoolExecutor(max_workers=1) for _ in range(num_processes)]
+    router = _ShardRouter(executors)
+    routing = _Routing(num_shards)
+
+    try:
+        for shard, path in enumerate(paths):
+            router.submit(shard, _open_shard, path, page_props, _BULK_LOAD_CACHE_SIZE // num_shards)
+
+        _route_pages(router, routing, pages_dump, namespaces)
+        _route_page_props(router, routing, page_props_dump, property_ids)
+        _route_redirects(router, routing, redirects_dump, namespaces, reverse_mapping)
+
+        for shard in range(num_shards):
+            router.submit(shard, _finish_shard, reverse_mapping, bloom_filter_error_rate)
+        router.flush()
+    except BaseException:
+        for executor in executors:
+            executor.shutdown()
+        for path in paths:
+            _remove_database(path + ".tmp")
+        raise
+
+    for executor in executors:
+        executor.shutdown()
+
+    routing.write(os.path.join(path_to_shards, _ROUTING_NAME))
+
+    # Shards of a previous split into a different number of shards would mix with the new ones
+    for name in os.listdir(path_to_shards):
+        match = _SHARD_PATTERN.match(name)
+        if match is not None and int(match.group(2)) != num_shards:
+            _logger.info("Removing outdated shard [%s]", name)
+            os.remove(os.path.join(path_to_shards, name))
+
+    return paths
+
+
+class ShardedWikiMapper:
+    """Has the same lookup methods as `WikiMapper` and returns the same results for an index
+    split by `create_sharded_index` as `WikiMapper` does for the complete index.
+
+    Titles are looked up in the shard they hash to and page ids in the shard the routing table
+    names. Shards without a routing table look up page ids in all shards. The pages of a
+    Wikidata id can be in any shard, so Wikidata ids are looked up in all shards concurrently.
+    Batch methods send the keys of every shard in one batch.
+    """
+
+    _INSTRUMENTED = WikiMapper._INSTRUMENTED
+
+    def __init__(
+        self,
+        path_to_shards: str,
+        use_bloom_filter: bool = False,
+        stats: Optional[LookupStats] = None,
+        read_only: bool = False,
+    ):
+        """
+        Args:
+            path_to_shards (str): Path to the folder with the shards created by
+                `create_sharded_index`.
+            use_bloom_filter (bool): If true and the shards contain Bloom filters, then check them
+                before querying, see `WikiMapper`.
+            stats (LookupStats): If given, then record calls, latencies and hit ratios of
+                all lookups in it.
+            read_only (bool): If true, then open the shards read-only.
+        """
+        paths = _find_shards(path_to_shards)
+        self.num_shards = len(paths)
+        self.stats = stats
+        self._path_to_shards = path_to_shards
+        self._routing = _open_routing(path_to_shards, self.num_shards)
+
+        # A connection can only be used by the thread that opened it, so every shard has a
+        # thread of its own that opens it and then answers all lookups in it.
+        self._executors = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="shard-{0}".format(i))
+            for i in range(self.num_shards)
+        ]
+        self._shards = [
+            future.result()
+            for future in [
+                executor.submit(WikiMapper, path, use_bloom_filter, None, read_only)
+                for executor, path in zip(self._executors, paths)
+            ]
+        ]
+
+        if stats is not None:
+            for name in self._INSTRUMENTED:
+                setattr(self, name, _instrumented(getattr(self, name), stats))
+
+    def _submit(self, shard: int, method: str, *args) -> Future:
+        return self._executors[shard].submit(getattr(self._shards[shard], method), *args)
+
+    def _on_all_shards(self, method: str, *args) -> list:
+        """Calls `method` with `args` in all shards concurrently and returns their results."""
+        futures = [self._submit(shard, method, *args) for shard in range(self.num_shards)]
+        return [future.result() for future in futures]
+
+    def _many_in_shards(
+        self, method: str, keys: list, shard_of: Callable[[Any], Optional[int]], *args
+    ) -> list:
+        """Calls `method` with the keys of every shard in one batch. Keys for which `shard_of`
+        returns `None` are in no shard and their result is `None`.
+        """
+        by_shard = defaultdict(list)  # type: Dict[int, list]
+        found = {}  # type: Dict[Any, Any]
+        for key in set(keys):
+            shard = shard_of(key)
+            if shard is None:
+                found[key] = None
+            else:
+                by_shard[shard].append(key)
+
+        futures = [
+            (shard_keys, self._submit(shard, method, shard_keys, *args))
+            for shard, shard_keys in by_shard.items()
+        ]
+        for shard_keys, future in futures:
+            found.update(zip(shard_keys, future.result()))
+        return [found[key] for key in keys]
+
+    def _by_title(self, method: str, page_title: str, namespace: int):
+        shard = _shard_of(page_title, namespace, self.num_shards)
+        return self._submit(shard, method, page_title, namespace).result()
+
+    def _many_by_title(self, method: str, page_titles: List[str], namespace: int) -> list:
+        def shard_of(page_title):
+            return _shard_of(page_title, namespace, self.num_shards)
+
+        return self._many_in_shards(method, page_titles, shard_of, namespace)
+
+    def _page_shard(self, wikipedia_id: int) -> Optional[int]:
+        """Returns the shard of the page `wikipedia_id` from the routing table, `None` if the
+        page is in no shard.
+        """
+        wikipedia_id = _as_int(wikipedia_id)
+        if not isinstance(wikipedia_id, int) or wikipedia_id < 0:
+            return None
+
+        routing = self._routing
+        entry_size = routing[len(_ROUTING_MAGIC)]
+        start = _ROUTING_HEADER.size + wikipedia_id * entry_size
+        entry = routing[start : start + entry_size]
+        # Past the end of the table the entry is empty, which is `0` as well
+        shard = int.from_bytes(entry, "little") - 1
+        return shard if shard >= 0 else None
+
+    def _by_wikipedia_id(self, method: str, wikipedia_id: int, default: Any = None):
+        if self._routing is None:
+            # A page is in exactly one shard, all others return the default for it
+            results = self._on_all_shards(method, wikipedia_id)
+            return next((r for r in results if r != default), default)
+
+        shard = self._page_shard(wikipedia_id)
+        if shard is None:
+            return default
+        return self._submit(shard, method, wikipedia_id).result()
+
+    def _many_by_wikipedia_id(self, method: str, wikipedia_ids: List[int]) -> list:
+        if self._routing is None:
+            results = self._on_all_shards(method, wikipedia_ids)
+            return [next((r for r in rs if r is not None), None) for rs in zip(*results)]
+
+        return self._many_in_shards(method, wikipedia_ids, self._page_shard)
+
+    def _many_by_wikidata_id(
+        self, column: str, wikidata_ids: List[str], namespace: int
+    ) -> List[list]:
+        # Order the pages of all shards like the complete index orders them
+        if self._shards[0]._has_reverse_mapping:
+            order = "is_redirect, wikipedia_title"
+        else:
+            order = "wikipedia_id"
+
+        method = "_select_many_by_wikidata_id"
+        columns = "{0}, {1}".format(order, column)
+        results = self._on_all_shards(method, columns, wikidata_ids, namespace)
+        return [[row[-1] for row in sorted(chain(*rows))] for rows in zip(*results)]
+
+    def reload(self):
+        """Reopens all shards and the routing table, see `WikiMapper.reload`. The shards are
+        not switched atomically.
+        """
+        self._on_all_shards("reload")
+        # Lookups running concurrently may still read the previous table, it is closed once
+        # they are done with it
+        self._routing = _open_routing(self._path_to_shards, self.num_shards)
+
+    def close(self):
+        """Closes the connections to all shards and stops their threads."""
+        self._on_all_shards("close")
+        for executor in self._executors:
+            executor.shutdown()
+        if self._routing is not None:
+            self._routing.close()
+
+    def title_to_id(self, page_title: str, namespace: int = 0) -> Optional[str]:
+        """See `WikiMapper.title_to_id`."""
+        return self._by_title("title_to_id", page_title, namespace)
+
+    def url_to_id(self, wiki_url: str) -> Optional[str]:
+        """See `WikiMapper.url_to_id`."""
+        return type(self).title_to_id(self, wiki_url.rsplit("/", 1)[-1])
+
+    def id_to_titles(self, wikidata_id: str, namespace: int = 0) -> List[str]:
+        """See `WikiMapper.id_to_titles`."""
+        return self._many_by_wikidata_id("wikipedia_title", [wikidata_id], namespace)[0]
+
+    def wikipedia_id_to_id(self, wikipedia_id: int) -> Optional[str]:
+        """See `WikiMapper.wikipedia_id_to_id`."""
+        return self._by_wikipedia_id("wikipedia_id_to_id", wikipedia_id)
+
+    def id_to_wikipedia_ids(self, wikidata_id: str, namespace: int = 0) -> List[int]:
+        """See `WikiMapper.id_to_wikipedia_ids`."""
+        return self._many_by_wikidata_id("wikipedia_id", [wikidata_id], namespace)[0]
+
+    def wikipedia_id_to_title(self, wikipedia_id: int) -> Optional[str]:
+        """See `WikiMapper.wikipedia_id_to_title`."""
+        return self._by_wikipedia_id("wikipedia_id_to_title", wikipedia_id)
+
+    def title_to_wikipedia_id(self, page_title: str, namespace: int = 0) -> Optional[int]:
+        """See `WikiMapper.title_to_wikipedia_id`."""
+        return self._by_title("title_to_wikipedia_id", page_title, namespace)
+
+    def page_props(self, wikipedia_id: int) -> Dict[str, str]:
+        """See `WikiMapper.page_props`."""
+        return self._by_wikipedia_id("page_props", wikipedia_id, {})
+
+    def titles_to_ids(self, page_titles: List[str], namespace: int = 0) -> List[Optional[str]]:
+        """See `WikiMapper.titles_to_ids`."""
+        return self._many_by_title("titles_to_ids", page_titles, namespace)
+
+    def urls_to_ids(self, wiki_urls: List[str]) -> List[Optional[str]]:
+        """See `WikiMapper.urls_to_ids`."""
+        titles = [url.rsplit("/", 1)[-1] for url in wiki_urls]
+        return type(self).titles_to_ids(self, titles)
+
+    def ids_to_titles(self, wikidata_ids: List[str], namespace: int = 0) -> List[List[str]]:
+        """See `WikiMapper.ids_to_titles`."""
+        return self._many_by_wikidata_id("wikipedia_title", wikidata_ids, namespace)
+
+    def wikipedia_ids_to_ids(self, wikipedia_ids: List[int]) -> List[Optional[str]]:
+        """See `WikiMapper.wikipedia_ids_to_ids`."""
+        return self._many_by_wikipedia_id("wikipedia_ids_to_ids", wikipedia_ids)
+
+    def ids_to_wikipedia_ids(self, wikidata_ids: List[str], namespace: int = 0) -> List[List[int]]:
+        """See `WikiMapper.ids_to_wikipedia_ids`."""
+        return self._many_by_wikidata_id("wikipedia_id", wikidata_ids, namespace)
+
+    def wikipedia_ids_to_titles(self, wikipedia_ids: List[int]) -> List[Optional[str]]:
+        """See `WikiMapper.wikipedia_ids_to_titles`."""
+        return self._many_by_wikipedia_id("wikipedia_ids_to_titles", wikipedia_ids)
+
+    def titles_to_wikipedia_ids(
+        self, page_titles: List[str], namespace: int = 0
+    ) -> List[Optional[int]]:
+        """See `WikiMapper.titles_to_wikipedia_ids`."""
+        return self._many_by_title("titles_to_wikipedia_ids", page_titles, namespace)
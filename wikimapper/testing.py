@@ -0,0 +1,372 @@
+""" Writes synthetic Wikipedia dumps and serves them like a dump mirror, so that downloading,
+creating indices and looking up keys can be tested and profiled without network access.
+
+The dumps have the layout of the dumps on https://dumps.wikimedia.org, including the edge cases
+that the parser has to handle: escaped quotes and backslashes, commas and parentheses in
+titles, NULLs, empty strings, multi-byte characters, invalid UTF-8 in page properties, very long
+values and INSERT statements, several namespaces, redirect chains and redirects to missing
+pages.
+"""
+
+import functools
+import gzip
+import logging
+import os
+import random
+import threading
+from collections import defaultdict, namedtuple
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence
+
+from wikimapper.processor import _MAX_REDIRECT_HOPS
+
+_logger = logging.getLogger(__name__)
+
+# A page as it should end up in an index created from the synthetic dumps. `page_props` holds
+# all properties with a valid UTF-8 value, markers like `disambiguation` have an empty value.
+SyntheticPage = namedtuple(
+    "SyntheticPage", ["wikipedia_id", "namespace", "title", "wikidata_id", "page_props"]
+)
+
+# Words that titles and property values are made of, chosen to trip up the parser
+_WORDS = [
+    "Minga",
+    "O'Brien",
+    "Back\\slash",
+    '"Quoted"',
+    "Comma,_Separated",
+    "Paren_(Begriffsklärung)",
+    "Tricky_),(",
+    "');",
+    "Säx",
+    "東京",
+    "Emoji_😀",
+    "100%",
+    "_",
+]
+
+_HEADER = """-- MySQL dump 10.19  Distrib 10.3.38-MariaDB, for debian-linux-gnu (x86_64)
+--
+-- Host: 127.0.0.1    Database: {wiki}
+-- ------------------------------------------------------
+-- Server version\t10.4.25-MariaDB-log
+
+/*!40101 SET @OLD_CHARACTER_SET_CLIENT=@@CHARACTER_SET_CLIENT */;
+/*!40101 SET NAMES binary */;
+/*!40103 SET @OLD_TIME_ZONE=@@TIME_ZONE */;
+/*!40014 SET @OLD_UNIQUE_CHECKS=@@UNIQUE_CHECKS, UNIQUE_CHECKS=0 */;
+
+--
+-- Table structure for table `{table}`
+--
+
+DROP TABLE IF EXISTS `{table}`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!40101 SET character_set_client = utf8 */;
+CREATE TABLE `{table}` (
+{columns}
+) ENGINE=InnoDB DEFAULT CHARSET=binary;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `{table}`
+--
+
+/*!40000 ALTER TABLE `{table}` DISABLE KEYS */;
+"""
+
+_FOOTER = """/*!40000 ALTER TABLE `{table}` ENABLE KEYS */;
+/*!40103 SET TIME_ZONE=@OLD_TIME_ZONE */;
+
+/*!40014 SET UNIQUE_CHECKS=@OLD_UNIQUE_CHECKS */;
+/*!40101 SET CHARACTER_SET_CLIENT=@OLD_CHARACTER_SET_CLIENT */;
+
+-- Dump completed on 2024-01-01  0:00:00
+"""
+
+_COLUMNS = {
+    "page": [
+        "page_id int(8) unsigned NOT NULL AUTO_INCREMENT",
+        "page_namespace int(11) NOT NULL DEFAULT 0",
+        "page_title varbinary(255) NOT NULL DEFAULT ''",
+        "page_is_redirect tinyint(1) unsigned NOT NULL DEFAULT 0",
+        "page_is_new tinyint(1) unsigned NOT NULL DEFAULT 0",
+        "page_random double unsigned NOT NULL DEFAULT 0",
+        "page_touched binary(14) NOT NULL",
+        "page_links_updated varbinary(14) DEFAULT NULL",
+        "page_latest int(8) unsigned NOT NULL DEFAULT 0",
+        "page_len int(8) unsigned NOT NULL DEFAULT 0",
+        "page_content_model varbinary(32) DEFAULT NULL",
+        "page_lang varbinary(35) DEFAULT NULL",
+    ],
+    "page_props": [
+        "pp_page int(10) unsigned NOT NULL",
+        "pp_propname varbinary(60) NOT NULL",
+        "pp_value blob NOT NULL",
+        "pp_sortkey float DEFAULT NULL",
+    ],
+    "redirect": [
+        "rd_from int(8) unsigned NOT NULL DEFAULT 0",
+        "rd_namespace int(11) NOT NULL DEFAULT 0",
+        "rd_title varbinary(255) NOT NULL DEFAULT ''",
+        "rd_interwiki varbinary(32) DEFAULT NULL",
+        "rd_fragment varbinary(255) DEFAULT NULL",
+    ],
+}
+
+# Newlines and the like are not generated, as the parser does not unescape them
+_ESCAPES = [(b"\\", b"\\\\"), (b"'", b"\\'"), (b'"', b'\\"')]
+
+
+def _sql_value(value) -> bytes:
+    """Formats `value` like mysqldump does."""
+    if value is None:
+        return b"NULL"
+    if isinstance(value, (int, float)):
+        return str(value).encode("ascii")
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    for char, escaped in _ESCAPES:
+        value = value.replace(char, escaped)
+    return b"'" + value + b"'"
+
+
+def _write_dump(path: str, wiki: str, table: str, rows: List[tuple], statement_size: int):
+    """Writes `rows` as gzipped SQL dump of `table`, starting a new INSERT statement once the
+    current one is longer than `statement_size` bytes, like mysqldump does.
+    """
+    columns = ",\n".join("  `{0}` {1}".format(*c.split(" ", 1)) for c in _COLUMNS[table])
+    prefix = "INSERT INTO `{0}` VALUES ".format(table).encode("ascii")
+
+    with gzip.open(path, "wb") as f:
+        f.write(_HEADER.format(wiki=wiki, table=table, columns=columns).encode("utf-8"))
+
+        statement = []
+        size = 0
+        for row in rows:
+            values = b"(" + b",".join([_sql_value(v) for v in row]) + b")"
+            statement.append(values)
+
+            size += len(values)
+            if size > statement_size:
+                f.write(prefix + b",".join(statement) + b";\n")
+                statement = []
+                size = 0
+
+        if statement:
+            f.write(prefix + b",".join(statement) + b";\n")
+
+        f.write(_FOOTER.format(table=table).encode("utf-8"))
+
+
+def _title(rnd: random.Random, i: int) -> str:
+    words = rnd.sample(_WORDS, rnd.randint(1, 3))
+    return "_".join(words + [str(i)])
+
+
+def write_wikidumps(
+    dumpname: str,
+    path: str,
+    num_pages: int = 1000,
+    namespaces: Sequence[int] = (0, 1, 10, 14),
+    redirect_ratio: float = 0.3,
+    statement_size: int = 1024 * 1024,
+    long_value_size: int = 64 * 1024,
+    seed: int = 0,
+) -> List[SyntheticPage]:
+    """Writes synthetic page, page props and redirect SQL dumps for the dump `dumpname` to the
+    folder `path`, named like the dumps that `download_wikidumps` downloads. The same arguments
+    always produce the same dumps.
+
+    Redirects get the Wikidata id that their target ends up with, following redirects to
+    redirects like `create_index` does. Redirects point to redirects with both smaller and larger
+    page ids and form cycles, and a few have a Wikidata id of their own, which they keep if
+    their target ends up without one.
+
+    Args:
+        dumpname (str): The name of the dump, e.g. `barwiki-latest`.
+        path (str): Path to the folder where the dumps are written to.
+        num_pages (int): Number of pages that are not redirects.
+        namespaces (Sequence[int]): Namespaces of the pages, most pages are in the first one.
+        redirect_ratio (float): Number of redirects relative to `num_pages`.
+        statement_size (int): Bytes after which an INSERT statement is ended and a new one
+            begun. mysqldump uses about 1 MiB, larger values give longer lines.
+        long_value_size (int): Length of the few very long page property values.
+        seed (int): Seed of the random number generator.
+
+    Returns:
+        List[SyntheticPage]: All pages, ordered by their page id.
+    """
+    rnd = random.Random(seed)
+    os.makedirs(path, exist_ok=True)
+    wiki = dumpname.split("-")[0]
+
+    num_redirects = int(num_pages * redirect_ratio)
+    num_ids = num_pages + num_redirects
+    ids = sorted(rnd.sample(range(1, 2 * num_ids + 1), num_ids))
+    is_redirect = [True] * num_redirects + [False] * num_pages
+    rnd.shuffle(is_redirect)
+    wikidata_numbers = iter(rnd.sample(range(1, 100 * num_ids + 1), num_ids))
+
+    def namespace() -> int:
+        return namespaces[0] if rnd.random() < 0.7 else rnd.choice(namespaces)
+
+    pages = []  # type: List[SyntheticPage]
+    page_props = []
+    redirects = []  # type: List[SyntheticPage]
+
+    for i, (wikipedia_id, redirect) in enumerate(zip(ids, is_redirect)):
+        # Redirects have no page properties, which marks them until their target is chosen
+        page = SyntheticPage(wikipedia_id, namespace(), _title(rnd, i), None, None)
+        if redirect:
+            if rnd.random() < 0.05:
+                wikidata_id = "Q{0}".format(next(wikidata_numbers))
+                page_props.append((wikipedia_id, "wikibase_item", wikidata_id, None))
+                page = page._replace(wikidata_id=wikidata_id)
+            redirects.append(page)
+            pages.append(page)
+            continue
+
+        props = {}  # type: Dict[str, Optional[str]]
+        if rnd.random() < 0.85:
+            props["wikibase_item"] = "Q{0}".format(next(wikidata_numbers))
+        if rnd.random() < 0.3:
+            props["wikibase-shortdesc"] = " ".join(rnd.sample(_WORDS, 3))
+        if rnd.random() < 0.05:
+            props["disambiguation"] = ""
+        if rnd.random() < 0.2:
+            props["defaultsort"] = page.title.upper()
+        if i % 200 == 0:
+            value = '{"params":{"' + "x', (y)," * long_value_size
+            props["templatedata"] = value[:long_value_size]
+
+        for name, value in sorted(props.items()):
+            page_props.append((wikipedia_id, name, value, rnd.choice([None, 0.0, 1.5])))
+        if i % 300 == 0:
+            # pp_value is a blob that is not always valid UTF-8
+            page_props.append((wikipedia_id, "ünicode_bytes", b"\xff\xfe'\\,)(", None))
+
+        wikidata_id = props.pop("wikibase_item", None)
+        pages.append(page._replace(wikidata_id=wikidata_id, page_props=props))
+
+    page_props.sort(key=lambda row: (row[0], row[1].encode("utf-8")))
+
+    # Redirects point to pages in their own namespace, so that whether they get a Wikidata id
+    # does not depend on the indexed namespaces
+    targets = defaultdict(list)  # type: Dict[int, List[SyntheticPage]]
+    chained = defaultdict(list)  # type: Dict[int, List[SyntheticPage]]
+    for page in pages:
+        if page.page_props is not None:
+            targets[page.namespace].append(page)
+        else:
+            chained[page.namespace].append(page)
+
+    # Random chains hardly ever close, so the first two redirects of a namespace form a cycle
+    cycles = {}  # type: Dict[int, SyntheticPage]
+    for first, second in [pages[:2] for pages in chained.values() if len(pages) >= 2]:
+        cycles[first.wikipedia_id], cycles[second.wikipedia_id] = second, first
+
+    by_id = {page.wikipedia_id: i for i, page in enumerate(pages)}
+    redirect_rows = []  # type: List[tuple]
+    target_ids = {}  # type: Dict[int, int]
+    for source in redirects:
+        chance = rnd.random()
+        if source.wikipedia_id in cycles:
+            target = cycles[source.wikipedia_id]
+        elif chance < 0.15:
+            target = rnd.choice(chained[source.namespace])
+        elif chance < 0.2 or not targets[source.namespace]:
+            target = SyntheticPage(None, source.namespace, "Missing_" + source.title, None, None)
+        else:
+            target = rnd.choice(targets[source.namespace])
+
+        fragment = rnd.choice(["", "", None, "Abschnitt_(1)"])
+        redirect_rows.append((source.wikipedia_id, target.namespace, target.title, "", fragment))
+        if target.wikipedia_id is not None:
+            target_ids[source.wikipedia_id] = target.wikipedia_id
+
+    # Every redirect gets the Wikidata id of the last page in its chain of redirects that has
+    # one of its own
+    own_wikidata_ids = {page.wikipedia_id: page.wikidata_id for page in pages}
+    for source in redirects:
+        wikidata_id = own_wikidata_ids[source.wikipedia_id]
+        wikipedia_id = source.wikipedia_id
+        for _ in range(_MAX_REDIRECT_HOPS):
+            wikipedia_id = target_ids.get(wikipedia_id)
+            if wikipedia_id is None:
+                break
+            if own_wikidata_ids[wikipedia_id] is not None:
+                wikidata_id = own_wikidata_ids[wikipedia_id]
+        pages[by_id[source.wikipedia_id]] = source._replace(wikidata_id=wikidata_id, page_props={})
+
+    redirected = {page.wikipedia_id for page in redirects}
+    page_rows = [
+        (
+            page.wikipedia_id,
+            page.namespace,
+            page.title,
+            int(page.wikipedia_id in redirected),
+            rnd.randint(0, 1),
+            round(rnd.random(), 12),
+            "20240101000000",
+            rnd.choice([None, "20240102000000"]),
+            rnd.randint(1, 10 ** 9),
+            len(page.title) * 10,
+            "wikitext",
+            None,
+        )
+        for page in pages
+    ]
+
+    dumps = [("page", page_rows), ("page_props", page_props), ("redirect", redirect_rows)]
+    for table, rows in dumps:
+        name = "{0}-{1}.sql.gz".format(dumpname, table)
+        _write_dump(os.path.join(path, name), wiki, table, rows, statement_size)
+
+    return pages
+
+
+class _MirrorHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format: str, *args):
+        _logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class MirrorServer(ThreadingHTTPServer):
+    """Serves the folder `path` over HTTP like a Wikipedia dump mirror, so that its URL can be
+    passed as `mirror` to `download_wikidumps`. Used as context manager, it serves in a
+    background thread until the context is left.
+    """
+
+    def __init__(self, path: str, host: str = "127.0.0.1", port: int = 0):
+        """
+        Args:
+            path (str): Path to the folder that is served.
+            host (str): Address to listen on.
+            port (int): Port to listen on, `0` picks a free one.
+        """
+        self.root = path
+        super().__init__((host, port), functools.partial(_MirrorHandler, directory=path))
+        self._thread = None  # type: Optional[threading.Thread]
+
+    @property
+    def url(self) -> str:
+        return "http://{0}:{1}/".format(*self.server_address[:2])
+
+    def dump_dir(self, dumpname: str) -> str:
+        """Returns the folder that dumps of `dumpname` have to be written to, so that
+        `download_wikidumps` finds them on this mirror.
+        """
+        wiki, date = dumpname.split("-")
+        path = os.path.join(self.root, wiki, date)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self._thread.join()
+        self.server_close()